@@ -14,10 +14,6 @@ interface ChatMessage {
   html?: SafeHtml;
 }
 
-interface ChatResponse {
-  response: string;
-}
-
 interface ChatHistoryResponse {
   history: ChatMessage[];
 }
@@ -215,35 +211,68 @@ export class ChatComponent implements OnInit, OnDestroy, AfterViewChecked {
   }
 
   private async sendMessageAsync(messageToSend: string): Promise<void> {
+    const aiMessageId = (Date.now() + 1).toString();
+    let text = '';
     try {
-      const response = await firstValueFrom(this.http.post<ChatResponse>(`${environment.apiUrl}/api/chat/${this.userId}`, {
-        message: messageToSend
-      }));
-
-      const markdown = response.response || 'Sorry, I couldn\'t process your request.';
-      const parsedMarkdown = await marked.parse(markdown);
-      const html = this.sanitizer.bypassSecurityTrustHtml(parsedMarkdown);
-
+      // Streamed as Server-Sent Events so the answer shows up as it is generated
+      const response = await fetch(`${environment.apiUrl}/api/chat/${this.userId}/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: messageToSend })
+      });
+      if (!response.ok || !response.body) {
+        throw new Error(`Chat stream failed with status ${response.status}`);
+      }
 
-      const aiMessage: ChatMessage = {
-        id: (Date.now() + 1).toString(),
-        message: response.response || 'Sorry, I couldn\'t process your request.',
-        isUser: false,
-        timestamp: new Date(),
-        html: html
-      };
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finished = false;
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) {
+          break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+          if (event === 'chunk') {
+            text += data.text;
+            if (this.isLoading) {
+              this.isLoading = false;
+              this.chatService.addMessage({ id: aiMessageId, message: text, isUser: false, timestamp: new Date() });
+            } else {
+              this.chatService.updateMessage(aiMessageId, { message: text });
+            }
+            this.shouldScrollToBottom = true;
+          } else if (event === 'error') {
+            throw new Error(data.error);
+          } else if (event === 'done') {
+            text = data.response;
+            finished = true;
+          }
+        }
+      }
 
-      this.chatService.addMessage(aiMessage);
+      const markdown = text || 'Sorry, I couldn\'t process your request.';
+      const html = this.sanitizer.bypassSecurityTrustHtml(await marked.parse(markdown));
+      if (this.isLoading) {
+        this.chatService.addMessage({ id: aiMessageId, message: markdown, isUser: false, timestamp: new Date(), html: html });
+      } else {
+        this.chatService.updateMessage(aiMessageId, { message: markdown, html: html });
+      }
       this.shouldScrollToBottom = true;
     } catch (error) {
       console.error('Error sending message:', error);
-      const errorMessage: ChatMessage = {
-        id: (Date.now() + 1).toString(),
-        message: 'Sorry, there was an error processing your request. Please try again.',
-        isUser: false,
-        timestamp: new Date()
-      };
-      this.chatService.addMessage(errorMessage);
+      const errorText = 'Sorry, there was an error processing your request. Please try again.';
+      if (this.isLoading) {
+        this.chatService.addMessage({ id: aiMessageId, message: errorText, isUser: false, timestamp: new Date() });
+      } else {
+        this.chatService.updateMessage(aiMessageId, { message: errorText, html: undefined });
+      }
       this.shouldScrollToBottom = true;
     } finally {
       this.isLoading = false;
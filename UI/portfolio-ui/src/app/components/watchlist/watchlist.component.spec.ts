@@ -13,6 +13,7 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
   let portfolioService: PortfolioService;
 
   const mockUserID = 'user123';
+  const watchlistUrl = `http://localhost:2000/api/watchlist/${mockUserID}?fields=symbol,name,current_price,high,low,open,previousClose`;
 
   const mockWatchlistData: WatchlistData[] = [
     {
@@ -98,13 +99,13 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
   it('should create', () => {
     expect(component).toBeTruthy();
   
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
   });
 
   it('should load the watchlist data from service', () => {
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
 
@@ -113,7 +114,7 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
   });
 
   it('should add a new symbol to watchlist', () => {
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
 
@@ -144,7 +145,7 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
     expect(postReq.request.body).toEqual({ symbol: newSymbol });
     postReq.flush(null);
 
-    const getReq = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const getReq = httpMock.expectOne(watchlistUrl);
     expect(getReq.request.method).toBe('GET');
     getReq.flush({ watchlist: updatedWatchlist });
 
@@ -152,7 +153,7 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
   });
 
   it('should remove a symbol from the watchlist', () => {
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
 
@@ -180,13 +181,13 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
     expect(deleteReq.request.method).toBe('DELETE');
     deleteReq.flush(null);
 
-    const getReq = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const getReq = httpMock.expectOne(watchlistUrl);
     getReq.flush({ watchlist: mockWatchlistData });
     expect(component.watchlist.some(w => w.symbol === 'TSLA')).toBeFalse();
   });
 
   it('should open edit modal', () => {
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
 
@@ -195,7 +196,7 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
   });
 
   it('should close edit modal', () => {
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
 
@@ -204,7 +205,7 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
   });
 
   it('should update searchResults on input change if length > 1', () => {
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
 
@@ -221,7 +222,7 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
   })
 
   it('should not update searchResults on input change if length <= 1', () => {
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
 
@@ -233,7 +234,7 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
   })
 
   it('should set curren_stock if search was successful', () => {
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
 
@@ -248,7 +249,7 @@ describe('WatchlistComponent (with real PortfolioService)', () => {
   })
 
   it('should set current_stock to null, set searchError to true, and reset it after 3 seconds', fakeAsync(() => {
-    const req = httpMock.expectOne(`http://localhost:2000/api/watchlist/${mockUserID}`);
+    const req = httpMock.expectOne(watchlistUrl);
     expect(req.request.method).toBe('GET');
     req.flush({ watchlist: mockWatchlistData });
 
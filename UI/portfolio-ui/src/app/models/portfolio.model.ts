@@ -151,16 +151,16 @@ export interface StockSearchResult {
 }
 
 export interface WatchlistData{
-  fiftyTwoWeekHigh: number;
-  fiftyTwoWeekLow: number;
+  fiftyTwoWeekHigh?: number;
+  fiftyTwoWeekLow?: number;
   high: number;
   low: number;
-  marketCap: number;
+  marketCap?: number;
   name: string;
   open: number;
   previousClose: number;
   current_price: number;
-  recommendations: Recommendation[];
+  recommendations?: Recommendation[];
   symbol: string;
 }
 
@@ -25,4 +25,8 @@ export class ChatService {
     const currentMessages = this.messages.getValue();
     this.messages.next([...currentMessages, message]);
   }
-}
\ No newline at end of file
+
+  updateMessage(id: string, changes: any) {
+    this.messages.next(this.messages.getValue().map(m => m.id === id ? { ...m, ...changes } : m));
+  }
+}
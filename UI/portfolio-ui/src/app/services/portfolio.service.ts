@@ -64,8 +64,9 @@ export class PortfolioService {
 
   // Set as a year for now, will make it changeable via UI later on
 
-  getTimeSeriesData(period: string = '1Y'): Observable<ChartData> {
-    return this.http.get<ChartData>(`${this.host}/portfolio/chart/${this.userID}/${period}`, this.httpOptions).pipe(
+  // The chart is a few hundred pixels wide, so let the backend downsample long periods
+  getTimeSeriesData(period: string = '1Y', maxPoints: number = 400): Observable<ChartData> {
+    return this.http.get<ChartData>(`${this.host}/portfolio/chart/${this.userID}/${period}?max_points=${maxPoints}`, this.httpOptions).pipe(
       tap((chartData: ChartData) => {
         this.timeSerisSubject.next(chartData);
       }),
@@ -237,7 +238,9 @@ export class PortfolioService {
     }
 
   getWatchlist(): Observable<WatchlistDataResponse> {
-    return this.http.get<WatchlistDataResponse>(`${this.host}/watchlist/${this.userID}`, this.httpOptions).pipe(
+    // Only the columns the table shows; recommendations/fundamentals come from /market/details/<symbol>
+    const fields = 'symbol,name,current_price,high,low,open,previousClose';
+    return this.http.get<WatchlistDataResponse>(`${this.host}/watchlist/${this.userID}?fields=${fields}`, this.httpOptions).pipe(
       tap((res: WatchlistDataResponse) => {
         this.watchlistSubject.next(res.watchlist);
       }),
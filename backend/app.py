@@ -1,6 +1,7 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
+import json
 from datetime import datetime, timezone
 import logging
 from functools import wraps
@@ -20,19 +21,30 @@ from services.transaction_service import (
 )
 from services.market_service import (
     search_symbols, get_current_price, refresh_all_prices,
-    get_market_status, store_portfolio_snapshot, get_portfolio_value_history
+    get_market_status, store_portfolio_snapshot, get_portfolio_value_history,
+    get_period_days
 )
 from services.analytics_service import (
     calculate_portfolio_performance, calculate_asset_allocation,
     get_portfolio_summary, calculate_historical_performance,
+    calculate_portfolio_projection
 )
+from services.returns_service import calculate_returns
+from services.risk_service import calculate_risk_metrics
+from services.benchmark_service import compare_to_benchmark
+from services.diversification_service import calculate_diversification
+from services.backfill_service import backfill_user_snapshots
+from services.rebalance_service import calculate_rebalance
+from services.whatif_service import simulate_trades
 from services.watchlist_service import (
-    get_watchlist, add_to_watchlist, remove_from_watchlist
+    get_watchlist, get_symbol_detail, add_to_watchlist, remove_from_watchlist,
+    add_many_to_watchlist, remove_many_from_watchlist
 )
-from services.news_service import get_stock_news
+from services.news_service import get_stock_news, get_news_feed, search_user_news
 from services.ai_chat_service import get_ai_chat_service
 
 from utils.database import init_database
+from utils.validators import validate_stock_symbol
 load_dotenv()
 
 
@@ -123,8 +135,10 @@ def signout():
 @app.route('/api/watchlist/<user_id>', methods=['GET'])
 def get_watchlist_route(user_id):
     try:
-        watchlist = get_watchlist(user_id)
+        watchlist = get_watchlist(user_id, request.args.get('fields'))
         return jsonify({'watchlist': watchlist})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_watchlist: {e}")
         return jsonify({'error': str(e)}), 500
@@ -142,6 +156,38 @@ def add_to_watchlist_route(user_id):
         logger.error(f"Error in add_to_watchlist: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/watchlist/<user_id>/bulk', methods=['POST'])
+def add_many_to_watchlist_route(user_id):
+    """Add a list of symbols; failures are reported per symbol"""
+    try:
+        data = request.get_json()
+        if not data or 'symbols' not in data:
+            return jsonify({'error': 'symbols required'}), 400
+        
+        result = add_many_to_watchlist(user_id, data['symbols'])
+        return jsonify(result), 201 if result['added'] else 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in add_many_to_watchlist: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/watchlist/<user_id>/bulk', methods=['DELETE'])
+def remove_many_from_watchlist_route(user_id):
+    """Remove a list of symbols in one delete"""
+    try:
+        data = request.get_json()
+        if not data or 'symbols' not in data:
+            return jsonify({'error': 'symbols required'}), 400
+        
+        result = remove_many_from_watchlist(user_id, data['symbols'])
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in remove_many_from_watchlist: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/watchlist/<user_id>/<symbol>', methods=['DELETE'])
 def remove_from_watchlist_route(user_id, symbol):
     try:
@@ -269,6 +315,18 @@ def get_symbol_price(symbol):
         logger.error(f"Error in get_symbol_price: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/market/details/<symbol>', methods=['GET'])
+def get_symbol_details(symbol):
+    """Recommendations and fundamentals for one symbol (loaded on demand, cached)"""
+    try:
+        details = get_symbol_detail(symbol, request.args.get('fields'))
+        return jsonify({'details': details})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_symbol_details: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/market/prices/refresh/<user_id>', methods=['POST'])
 def refresh_portfolio_prices(user_id):
     """Refresh current prices for user's portfolio (yfinance calls)"""
@@ -289,6 +347,7 @@ def update_sector_info(user_id):
     """Update sector information for user's holdings that don't have sector data"""
     try:
         from services.holdings_service import get_user_symbols
+        from utils.versions import bump_price_epoch
         from services.market_service import fetch_sector_info
         from utils.database import get_supabase_client
         
@@ -330,6 +389,10 @@ def update_sector_info(user_id):
                 logger.error(f"Error updating sector info for {symbol}: {e}")
                 failed_symbols.append(symbol)
         
+        if updated_count:
+            # Sectors live on the shared assets table
+            bump_price_epoch()
+        
         return jsonify({
             'message': f'Updated sector info for {updated_count} symbols',
             'updated_count': updated_count,
@@ -358,6 +421,44 @@ def get_stock_news_route(symbol):
         logger.error(f"Error in get_stock_news_route: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/news/feed/<user_id>', methods=['GET'])
+def get_news_feed_route(user_id):
+    """Merged news for every symbol the user holds or watches"""
+    try:
+        page = request.args.get('page', 1, type=int)
+        page_size = request.args.get('page_size', 20, type=int)
+        tab = request.args.get('tab', 'news')
+        
+        if tab not in ['news', 'all', 'press releases']:
+            return jsonify({'error': 'Invalid tab parameter. Must be "news", "all", or "press releases"'}), 400
+        
+        feed = get_news_feed(user_id, page=page, page_size=page_size, tab=tab)
+        return jsonify(feed)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_news_feed_route: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/news/search/<user_id>', methods=['GET'])
+def search_news_route(user_id):
+    """Keyword search over news the backend has already fetched"""
+    try:
+        symbols = request.args.get('symbols')
+        results = search_user_news(
+            user_id,
+            request.args.get('q', ''),
+            symbols=[s.strip() for s in symbols.split(',') if s.strip()] if symbols else None,
+            scope=request.args.get('scope', 'portfolio'),
+            limit=request.args.get('limit', 20, type=int)
+        )
+        return jsonify(results)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in search_news_route: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # AI CHAT ENDPOINTS
 
 @app.route('/api/chat/<user_id>', methods=['POST'])
@@ -377,6 +478,30 @@ def chat_with_ai(user_id):
         logger.error(f"Error in chat_with_ai: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/<user_id>/stream', methods=['POST'])
+def stream_chat_with_ai(user_id):
+    """Chat with AI assistant, streaming the answer as Server-Sent Events"""
+    try:
+        data = request.get_json()
+        if not data or 'message' not in data:
+            return jsonify({'error': 'Message is required'}), 400
+
+        ai_service = get_ai_chat_service()
+        events = ai_service.stream_chat(user_id, data['message'])
+
+        def generate():
+            for event, payload in events:
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception as e:
+        logger.error(f"Error in stream_chat_with_ai: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/chat/<user_id>/clear', methods=['POST'])
 def clear_chat_history(user_id):
     """Clear chat history for user"""
@@ -416,11 +541,96 @@ def get_performance(user_id):
         logger.error(f"Error in get_performance: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/performance/<user_id>/returns/<period>', methods=['GET'])
+def get_period_returns(user_id, period):
+    """Get time-weighted and money-weighted returns for a chart period"""
+    try:
+        days = get_period_days(period)
+        returns = calculate_returns(user_id, days)
+        return jsonify({'returns': returns, 'period': period, 'days': days})
+    except Exception as e:
+        logger.error(f"Error in get_period_returns: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/performance/<user_id>/benchmark/<period>', methods=['GET'])
+def get_benchmark_comparison(user_id, period):
+    """Get the portfolio series next to a benchmark's, with relative return and tracking error"""
+    try:
+        days = get_period_days(period)
+        benchmark = validate_stock_symbol(request.args.get('benchmark', 'SPY'))
+        max_points = request.args.get('max_points', type=int)
+        if max_points is not None and max_points < 3:
+            return jsonify({'error': 'max_points must be at least 3'}), 400
+        
+        comparison = compare_to_benchmark(user_id, days, benchmark, max_points)
+        return jsonify({'comparison': comparison, 'period': period, 'days': days})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_benchmark_comparison: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/risk/<user_id>/<period>', methods=['GET'])
+def get_risk_metrics(user_id, period):
+    """Get volatility, Sharpe/Sortino, drawdown and beta for a chart period"""
+    try:
+        days = get_period_days(period)
+        benchmark = request.args.get('benchmark', 'SPY')
+        risk_free_rate = float(request.args.get('risk_free_rate', 0))
+        window = int(request.args.get('window', 21))
+        if window < 2:
+            return jsonify({'error': 'window must be at least 2'}), 400
+        
+        risk = calculate_risk_metrics(user_id, days, benchmark, risk_free_rate, window)
+        return jsonify({'risk': risk, 'period': period, 'days': days})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_risk_metrics: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/correlation/<user_id>/<period>', methods=['GET'])
+def get_holdings_correlation(user_id, period):
+    """Get the holdings correlation matrix, risk contributions and diversification scores"""
+    try:
+        days = get_period_days(period)
+        diversification = calculate_diversification(user_id, days)
+        return jsonify({'diversification': diversification, 'period': period, 'days': days})
+    except Exception as e:
+        logger.error(f"Error in get_holdings_correlation: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/projection/<user_id>', methods=['GET'])
+def get_portfolio_projection(user_id):
+    """Get Monte Carlo percentile bands for the current holdings' future value"""
+    try:
+        horizon_days = request.args.get('horizon_days', 252, type=int)
+        paths = request.args.get('paths', 5000, type=int)
+        method = request.args.get('method', 'bootstrap')
+        history_days = get_period_days(request.args.get('history', 'MAX'))
+        seed = request.args.get('seed', type=int)
+        if not 1 <= horizon_days <= 2520:
+            return jsonify({'error': 'horizon_days must be between 1 and 2520'}), 400
+        if not 100 <= paths <= 100000:
+            return jsonify({'error': 'paths must be between 100 and 100000'}), 400
+        
+        projection = calculate_portfolio_projection(user_id, horizon_days, paths, method, history_days, seed)
+        return jsonify({'projection': projection})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_portfolio_projection: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/allocation/<user_id>', methods=['GET'])
 def get_allocation(user_id):
-    """Get asset allocation breakdown"""
+    """Get asset allocation breakdown by asset type, sector, currency and symbol"""
     try:
-        allocation = calculate_asset_allocation(user_id)
+        top_n = request.args.get('top_n', type=int)
+        if top_n is not None and top_n < 1:
+            return jsonify({'error': 'top_n must be at least 1'}), 400
+        
+        allocation = calculate_asset_allocation(user_id, top_n)
         return jsonify({'allocation': allocation})
     except Exception as e:
         logger.error(f"Error in get_allocation: {e}")
@@ -430,18 +640,12 @@ def get_allocation(user_id):
 def get_portfolio_chart(user_id, period):
     """Get portfolio value chart data for specified time period"""
     try:
-        # Map period to days
-        period_days = {
-            '1W': 7,
-            '1M': 30,
-            '3M': 90,
-            '6M': 180,
-            '1Y': 365,
-            'MAX': 3650  # 10 years for MAX period
-        }
+        days = get_period_days(period)
+        max_points = request.args.get('max_points', type=int)
+        if max_points is not None and max_points < 3:
+            return jsonify({'error': 'max_points must be at least 3'}), 400
         
-        days = period_days.get(period, 30)
-        chart_data = get_portfolio_value_history(user_id, days)
+        chart_data = get_portfolio_value_history(user_id, days, max_points)
         
         return jsonify({
             'chart_data': chart_data,
@@ -474,6 +678,65 @@ def create_portfolio_snapshot(user_id):
         logger.error(f"Error in create_portfolio_snapshot: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/portfolio/rebalance/<user_id>', methods=['POST'])
+def rebalance_portfolio(user_id):
+    """Calculate the trades that bring holdings to target weights (nothing is executed)"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Request body required'}), 400
+        
+        rebalance = calculate_rebalance(
+            user_id,
+            data.get('targets'),
+            target_type=data.get('target_type', 'symbol'),
+            band_percent=float(data.get('band_percent', 0)),
+            lot_size=data.get('lot_size', 1),
+            min_cash=float(data.get('min_cash', 0))
+        )
+        return jsonify({'rebalance': rebalance})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in rebalance_portfolio: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/portfolio/what-if/<user_id>', methods=['POST'])
+def what_if_trades(user_id):
+    """Preview the effect of hypothetical trades on the current portfolio (nothing is executed)"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Request body required'}), 400
+        
+        top_n = data.get('top_n')
+        if top_n is not None and (not isinstance(top_n, int) or top_n < 1):
+            return jsonify({'error': 'top_n must be at least 1'}), 400
+        
+        what_if = simulate_trades(user_id, data.get('actions'), top_n)
+        return jsonify({'what_if': what_if})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in what_if_trades: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/portfolio/backfill/<user_id>', methods=['POST'])
+def backfill_portfolio_snapshots(user_id):
+    """Rebuild missing daily snapshots from the transaction ledger and price history"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = backfill_user_snapshots(
+            user_id,
+            start_date=data.get('start_date'),
+            end_date=data.get('end_date'),
+            overwrite=bool(data.get('overwrite', False))
+        )
+        return jsonify({'backfill': result})
+    except Exception as e:
+        logger.error(f"Error in backfill_portfolio_snapshots: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # RUN APPLICATION
 
 if __name__ == '__main__':
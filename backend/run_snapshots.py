@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Nightly batch snapshot job for all users
+Schedule daily (e.g. cron) after prices are refreshed; re-running resumes where it stopped
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+def main():
+    parser = argparse.ArgumentParser(description="Store a portfolio snapshot for every user")
+    parser.add_argument('--date', help="Snapshot date (YYYY-MM-DD), defaults to today (UTC)")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Rows per bulk upsert")
+    parser.add_argument('--no-resume', action='store_true', help="Rewrite users that already have a snapshot")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    from services.snapshot_service import run_batch_snapshot
+
+    report = run_batch_snapshot(args.date, chunk_size=args.chunk_size, resume=not args.no_resume)
+    print(json.dumps(report, indent=2))
+    return not report['failed_users']
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
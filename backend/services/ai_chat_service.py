@@ -3,20 +3,185 @@ AI Chat Service for Portfolio Manager
 Uses Google GenAI with gemini-2.5-flash model
 """
 
+import difflib
 import logging
+import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from google import genai
+from google.genai import types
 
-from services.portfolio_service import get_portfolio_details
-from services.holdings_service import get_user_holdings
+from services.holdings_service import get_portfolio_valuation
 from services.transaction_service import get_transaction_history
-from services.analytics_service import calculate_asset_allocation
-from services.watchlist_service import get_watchlist
+from services.analytics_service import build_allocation
+from services.market_service import get_cached_prices
+from services.watchlist_service import get_watchlist_symbols
+from utils.cache import TTLCache
+from utils.session_store import SessionStore
+from utils.versions import data_version, get_watchlist_version
 
 logger = logging.getLogger(__name__)
 
+# Conversation state per user: LRU-bounded, dropped after CHAT_IDLE_TIMEOUT seconds idle,
+# and capped at CHAT_MAX_HISTORY messages; CHAT_SESSION_DIR lets evicted sessions resume
+CHAT_MAX_SESSIONS = 500
+CHAT_IDLE_TIMEOUT = 1800
+CHAT_MAX_HISTORY = 20
+CHAT_MAX_TOTAL_BYTES = 32 * 1024 * 1024
+# Estimated tokens for replayed history plus the new turn; older turns are left out past it
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv('CHAT_PROMPT_TOKEN_BUDGET', '6000'))
+
+# (user_id, ledger version, price epoch, watchlist version) -> context string; the TTL only covers edits made outside the API
+_context_cache = TTLCache(maxsize=1024, ttl=900)
+# Context sources are independent DB/cache reads, so they load side by side
+_context_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix='ai-context')
+
+def _load_watchlist(user_id: str):
+    """Watchlist symbols with whatever quote market_prices already has (no yfinance)"""
+    symbols = get_watchlist_symbols(user_id)
+    quotes = get_cached_prices(symbols)
+    return [{'symbol': symbol, **quotes.get(symbol, {})} for symbol in symbols]
+
+def gather_context_data(user_id: str) -> dict:
+    """Valuation, recent transactions and watchlist for the prompt, loaded concurrently
+
+    Everything comes from the database or the in-process caches; nothing calls a
+    market data provider. A source that fails is left out rather than failing the chat.
+    """
+    sources = {
+        'valuation': (get_portfolio_valuation, user_id),
+        'transactions': (lambda uid: get_transaction_history(uid, limit=5, offset=0), user_id),
+        'watchlist': (_load_watchlist, user_id),
+    }
+    futures = {name: _context_pool.submit(fn, arg) for name, (fn, arg) in sources.items()}
+    data = {}
+    for name, future in futures.items():
+        try:
+            data[name] = future.result()
+        except Exception as e:
+            logger.warning(f"Could not load {name} for chat context: {e}")
+            data[name] = None
+    return data
+
+def format_portfolio_context(data: dict) -> str:
+    """Render gathered context data as the prompt's PORTFOLIO CONTEXT section"""
+    context_parts = []
+    valuation = data.get('valuation') or {}
+    holdings = valuation.get('holdings') or []
+    totals = valuation.get('totals') or {}
+
+    if totals:
+        context_parts.append(f"PORTFOLIO OVERVIEW:")
+        context_parts.append(f"- Total Value: ${totals.get('total_market_value', 0):,.2f}")
+        context_parts.append(f"- Cash Balance: ${totals.get('cash_balance', 0):,.2f}")
+        context_parts.append(f"- Total Gain/Loss: ${totals.get('total_gain_loss', 0):,.2f}")
+        context_parts.append(f"- Total Gain/Loss %: {totals.get('total_gain_loss_percent', 0):.2f}%")
+
+    positions = [h for h in holdings if h.get('symbol') != 'CASH' and h.get('quantity', 0) > 0]
+    if positions:
+        context_parts.append(f"\nCURRENT HOLDINGS:")
+        for holding in positions:
+            context_parts.append(
+                f"- {holding.get('symbol', '')}: {holding.get('quantity', 0)} shares @ ${holding.get('average_cost', 0):.2f} avg, "
+                f"Current: ${holding.get('current_price', 0):.2f}, Value: ${holding.get('market_value', 0):.2f}, "
+                f"G/L: ${holding.get('gain_loss', 0):.2f} ({holding.get('gain_loss_percent', 0):.2f}%)"
+            )
+
+    transactions = data.get('transactions') or []
+    if transactions:
+        context_parts.append(f"\nRECENT TRANSACTIONS:")
+        for tx in transactions:
+            context_parts.append(
+                f"- {tx.get('transaction_date', '')}: {tx.get('transaction_type', '')} "
+                f"{tx.get('quantity', 0)} {tx.get('symbol', 'CASH')} @ ${float(tx.get('price') or 0):.2f}"
+            )
+
+    if holdings:
+        allocation = build_allocation(holdings, top_n=10)
+        if allocation['by_symbol']:
+            context_parts.append(f"\nASSET ALLOCATION:")
+            for asset in allocation['by_symbol']:
+                context_parts.append(f"- {asset.get('symbol', '')}: {asset.get('percentage', 0):.1f}%")
+            context_parts.append(f"\nSECTOR ALLOCATION:")
+            for sector in allocation['by_sector']:
+                context_parts.append(f"- {sector['name']}: {sector['percentage']:.1f}%")
+
+    watchlist = data.get('watchlist') or []
+    if watchlist:
+        context_parts.append(f"\nWATCHLIST:")
+        for item in watchlist:
+            price = item.get('current_price')
+            context_parts.append(f"- {item['symbol']}" + (f": ${float(price):.2f}" if price else ""))
+
+    return "\n".join(context_parts)
+
+def get_portfolio_context(user_id: str) -> str:
+    """Prompt context for a user, rebuilt only when their data or watchlist version or the price epoch changes"""
+    # Read the versions before loading so a concurrent write can't be cached as current
+    key = (user_id, *data_version(user_id), get_watchlist_version(user_id))
+    context = _context_cache.get(key)
+    if context is None:
+        context = format_portfolio_context(gather_context_data(user_id))
+        _context_cache.set(key, context)
+    return context
+
+def invalidate_portfolio_context(user_id: str) -> int:
+    """Drop every cached context for a user"""
+    return _context_cache.invalidate_user(user_id)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) used for budgeting"""
+    return math.ceil(len(text or '') / 4)
+
+def context_diff(previous: str, current: str) -> str:
+    """Changed lines between two portfolio contexts as a headerless unified diff"""
+    lines = difflib.unified_diff(previous.splitlines(), current.splitlines(), n=0, lineterm='')
+    return "\n".join(line for line in lines if not line.startswith(('---', '+++', '@@')))
+
+def render_turn(message: dict) -> str:
+    """Prompt text for a stored message: the question plus whatever context it carried"""
+    if message.get('context_kind') == 'full':
+        return f"PORTFOLIO CONTEXT:\n{message['snapshot']}\n\nUSER QUESTION: {message['content']}"
+    if message.get('context_kind') == 'diff':
+        return (f"PORTFOLIO CONTEXT UPDATE (diff against the last context):\n{message['context']}"
+                f"\n\nUSER QUESTION: {message['content']}")
+    return message['content']
+
+def fit_history(messages: list, budget: int) -> list:
+    """Newest messages whose rendered turns fit in budget tokens, starting on a user turn"""
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        used += estimate_tokens(render_turn(message))
+        if used > budget:
+            break
+        kept.append(message)
+    kept.reverse()
+    while kept and kept[0]['role'] != 'user':
+        kept.pop(0)
+    return kept
+
+def plan_context(history: list, context: str) -> dict:
+    """Context fields for the next user turn given the turns that will be replayed
+
+    The full context is sent when no replayed turn carries one (new session, or it was
+    trimmed away), a diff when it changed since the last one sent, and nothing when
+    unchanged.
+    """
+    carriers = [m for m in history if m.get('context_kind')]
+    if not any(m['context_kind'] == 'full' for m in carriers):
+        return {'context_kind': 'full', 'snapshot': context}
+    previous = carriers[-1]['snapshot']
+    if previous == context:
+        return {}
+    diff = context_diff(previous, context)
+    if len(diff) >= len(context):
+        return {'context_kind': 'full', 'snapshot': context}
+    return {'context_kind': 'diff', 'context': diff, 'snapshot': context}
+
 class AIChatService:
     def __init__(self):
         api_key = os.getenv('GOOGLE_GENAI_API_KEY')
@@ -24,129 +189,72 @@ class AIChatService:
             raise ValueError("GOOGLE_GENAI_API_KEY environment variable is required")
         self.client = genai.Client(api_key=api_key)
         self.model = "gemini-2.5-flash"
-        self.active_chats: Dict[str, Any] = {}
-        self.cache: Dict[str, str] = {}
-        self.cache_timestamps: Dict[str, datetime] = {}
-        self.CACHE_DURATION = timedelta(minutes=5)
+        self.sessions = SessionStore(
+            max_sessions=CHAT_MAX_SESSIONS,
+            idle_timeout=CHAT_IDLE_TIMEOUT,
+            max_history=CHAT_MAX_HISTORY,
+            max_bytes=CHAT_MAX_TOTAL_BYTES,
+            spill_dir=os.getenv('CHAT_SESSION_DIR')
+        )
         self.system_instruction = (
             "You are a helpful portfolio management assistant. You have access to the user's portfolio data and can provide insights about their investments, market analysis, and portfolio performance. "
             "Your capabilities include: Analyzing portfolio performance and allocation, providing market insights and stock information, suggesting portfolio improvements, answering questions about specific holdings, and explaining investment concepts. "
             "Always be helpful, accurate, and provide actionable insights. Stricly provide the information requested, No long responses. Make them brief, succinct and to the point. Do not cajole the user or say that's a great question or anything of the sort. Just answer the question."
         )
 
-    def _get_or_create_chat(self, user_id: str):
-        if user_id not in self.active_chats:
-            self.active_chats[user_id] = self.client.chats.create(model=self.model)
-        return self.active_chats[user_id]
-
     def _build_portfolio_context(self, user_id: str) -> str:
-        now = datetime.now(timezone.utc)
-        if user_id in self.cache and (now - self.cache_timestamps.get(user_id, now)) < self.CACHE_DURATION:
-            return self.cache[user_id]
-
         try:
-            context_parts = []
-            
-            # Get portfolio details with error handling
-            try:
-                portfolio_details = get_portfolio_details(user_id)
-                if portfolio_details and isinstance(portfolio_details, dict):
-                    context_parts.append(f"PORTFOLIO OVERVIEW:")
-                    context_parts.append(f"- Total Value: ${portfolio_details.get('total_value', 0):,.2f}")
-                    context_parts.append(f"- Cash Balance: ${portfolio_details.get('cash_balance', 0):,.2f}")
-                    context_parts.append(f"- Total Gain/Loss: ${portfolio_details.get('total_gain_loss', 0):,.2f}")
-                    context_parts.append(f"- Total Gain/Loss %: {portfolio_details.get('total_gain_loss_percent', 0):.2f}%")
-            except Exception as e:
-                logger.warning(f"Could not get portfolio details: {e}")
-            
-            # Get holdings with error handling
-            try:
-                holdings = get_user_holdings(user_id)
-                if holdings and isinstance(holdings, list):
-                    context_parts.append(f"\nCURRENT HOLDINGS:")
-                    for holding in holdings:
-                        if isinstance(holding, dict):
-                            symbol = holding.get('symbol', '')
-                            quantity = holding.get('quantity', 0)
-                            avg_price = holding.get('avg_price', 0)
-                            current_price = holding.get('current_price', 0)
-                            market_value = holding.get('market_value', 0)
-                            gain_loss = holding.get('gain_loss', 0)
-                            gain_loss_percent = holding.get('gain_loss_percent', 0)
-                            context_parts.append(
-                                f"- {symbol}: {quantity} shares @ ${avg_price:.2f} avg, "
-                                f"Current: ${current_price:.2f}, Value: ${market_value:.2f}, "
-                                f"G/L: ${gain_loss:.2f} ({gain_loss_percent:.2f}%)"
-                            )
-            except Exception as e:
-                logger.warning(f"Could not get holdings: {e}")
-            
-            # Get transactions with error handling
-            try:
-                transactions = get_transaction_history(user_id, limit=5, offset=0)
-                if transactions and isinstance(transactions, list):
-                    context_parts.append(f"\nRECENT TRANSACTIONS:")
-                    for tx in transactions:
-                        if isinstance(tx, dict):
-                            symbol = tx.get('symbol', 'CASH')
-                            tx_type = tx.get('transaction_type', '')
-                            quantity = tx.get('quantity', 0)
-                            price = tx.get('price', 0)
-                            date = tx.get('transaction_date', '')
-                            context_parts.append(
-                                f"- {date}: {tx_type} {quantity} {symbol} @ ${price:.2f}"
-                            )
-            except Exception as e:
-                logger.warning(f"Could not get transactions: {e}")
-            
-            # Get allocation with error handling
-            try:
-                allocation = calculate_asset_allocation(user_id)
-                if allocation and isinstance(allocation, list):
-                    context_parts.append(f"\nASSET ALLOCATION:")
-                    for asset in allocation:
-                        if isinstance(asset, dict):
-                            symbol = asset.get('symbol', '')
-                            percentage = asset.get('percentage', 0)
-                            context_parts.append(f"- {symbol}: {percentage:.1f}%")
-            except Exception as e:
-                logger.warning(f"Could not get allocation: {e}")
-            
-            # Get watchlist with error handling
-            try:
-                watchlist = get_watchlist(user_id)
-                if watchlist and isinstance(watchlist, list):
-                    context_parts.append(f"\nWATCHLIST:")
-                    for item in watchlist:
-                        if isinstance(item, dict):
-                            symbol = item.get('symbol', '')
-                            context_parts.append(f"- {symbol}")
-            except Exception as e:
-                logger.warning(f"Could not get watchlist: {e}")
-            
-            context = "\n".join(context_parts)
-            self.cache[user_id] = context
-            self.cache_timestamps[user_id] = now
-            return context
+            return get_portfolio_context(user_id)
         except Exception as e:
             logger.error(f"Error building portfolio context for user {user_id}: {e}")
             return "Portfolio data unavailable"
 
+    def _prompt(self, user_id: str, message: str):
+        """(contents, new user turn, omitted message count) within CHAT_PROMPT_TOKEN_BUDGET"""
+        stored = self.sessions.get(user_id)
+        portfolio_context = self._build_portfolio_context(user_id)
+        # Reserve room for the new turn as if it carried the full context
+        reserve = estimate_tokens(portfolio_context) + estimate_tokens(message)
+        history = fit_history(stored, max(CHAT_PROMPT_TOKEN_BUDGET - reserve, 0))
+        turn = {'role': 'user', 'content': message, **plan_context(history, portfolio_context)}
+        # No stock symbol extraction or market data lookup
+        contents = [{'role': m['role'], 'parts': [{'text': render_turn(m)}]} for m in history + [turn]]
+        return contents, turn, len(stored) - len(history)
+
+    def _config(self):
+        return types.GenerateContentConfig(system_instruction=self.system_instruction)
+
+    def _finish(self, user_id: str, contents: list, turn: dict, text: str, omitted: int, usage_metadata=None):
+        """Store the completed exchange; returns (timestamp, history, usage)"""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        history = self.sessions.append(
+            user_id,
+            {**turn, 'timestamp': timestamp},
+            {'role': 'model', 'content': text, 'timestamp': timestamp}
+        )
+        usage = {
+            'prompt_tokens': getattr(usage_metadata, 'prompt_token_count', None),
+            'estimated_prompt_tokens': sum(estimate_tokens(c['parts'][0]['text']) for c in contents)
+                                       + estimate_tokens(self.system_instruction),
+            'context': turn.get('context_kind', 'unchanged'),
+            'omitted_messages': omitted
+        }
+        return timestamp, [{'role': m['role'], 'content': m['content']} for m in history], usage
+
     def chat(self, user_id: str, message: str) -> Dict[str, Any]:
         try:
-            chat = self._get_or_create_chat(user_id)
-            portfolio_context = self._build_portfolio_context(user_id)
-            # No stock symbol extraction or market data lookup
-            full_context = f"SYSTEM INSTRUCTION:\n{self.system_instruction}\n\nPORTFOLIO CONTEXT:\n{portfolio_context}\n\nUSER QUESTION: {message}"
-            response = chat.send_message(full_context)
+            contents, turn, omitted = self._prompt(user_id, message)
+            response = self.client.models.generate_content(model=self.model, contents=contents, config=self._config())
+            timestamp, history, usage = self._finish(
+                user_id, contents, turn, response.text or '', omitted, getattr(response, 'usage_metadata', None)
+            )
+            logger.info(f"AI chat prompt for user {user_id}: {usage}")
             return {
                 'response': response.text,
-                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'timestamp': timestamp,
                 'user_id': user_id,
-                'history': [
-                    {'role': m.role, 'content': m.parts[0].text if m.parts else ''}
-                    for m in chat._curated_history
-                ]
+                'usage': usage,
+                'history': history
             }
         except Exception as e:
             logger.error(f"Error in AI chat for user {user_id}: {e}")
@@ -157,10 +265,53 @@ class AIChatService:
                 'error': str(e)
             }
 
+    def stream_chat(self, user_id: str, message: str):
+        """Yield (event, data) pairs: 'chunk' for each piece of the answer, then 'done' or 'error'
+
+        The exchange is stored once the stream completes; a failed or abandoned stream
+        leaves the history untouched.
+        """
+        start = time.perf_counter()
+        first_token_ms = None
+        parts = []
+        usage_metadata = None
+        try:
+            contents, turn, omitted = self._prompt(user_id, message)
+            stream = self.client.models.generate_content_stream(model=self.model, contents=contents, config=self._config())
+            for chunk in stream:
+                usage_metadata = getattr(chunk, 'usage_metadata', None) or usage_metadata
+                text = chunk.text
+                if not text:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - start) * 1000, 1)
+                    logger.info(f"AI chat first token for user {user_id} after {first_token_ms} ms")
+                parts.append(text)
+                yield 'chunk', {'text': text}
+
+            timestamp, history, usage = self._finish(user_id, contents, turn, ''.join(parts), omitted, usage_metadata)
+            usage['first_token_ms'] = first_token_ms
+            usage['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            logger.info(f"AI chat stream for user {user_id}: {usage}")
+            yield 'done', {
+                'response': ''.join(parts),
+                'timestamp': timestamp,
+                'user_id': user_id,
+                'usage': usage,
+                'history': history
+            }
+        except Exception as e:
+            logger.error(f"Error in AI chat stream for user {user_id}: {e}")
+            yield 'error', {
+                'response': "I'm sorry, I encountered an error processing your request. Please try again.",
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'user_id': user_id,
+                'error': str(e)
+            }
+
     def clear_chat_history(self, user_id: str) -> bool:
         try:
-            if user_id in self.active_chats:
-                del self.active_chats[user_id]
+            if self.sessions.clear(user_id):
                 logger.info(f"Cleared chat history for user {user_id}")
             return True
         except Exception as e:
@@ -169,9 +320,7 @@ class AIChatService:
 
     def clear_cache(self, user_id: str) -> bool:
         try:
-            if user_id in self.cache:
-                del self.cache[user_id]
-                del self.cache_timestamps[user_id]
+            if invalidate_portfolio_context(user_id):
                 logger.info(f"Cleared cache for user {user_id}")
             return True
         except Exception as e:
@@ -180,17 +329,10 @@ class AIChatService:
 
     def get_chat_history(self, user_id: str) -> List[Dict[str, Any]]:
         try:
-            if user_id not in self.active_chats:
-                return []
-            chat = self.active_chats[user_id]
-            history = []
-            for message in chat._curated_history:
-                history.append({
-                    'role': message.role,
-                    'content': message.parts[0].text if message.parts else '',
-                    'timestamp': datetime.now(timezone.utc).isoformat()
-                })
-            return history
+            return [
+                {'role': m['role'], 'content': m['content'], 'timestamp': m.get('timestamp')}
+                for m in self.sessions.get(user_id)
+            ]
         except Exception as e:
             logger.error(f"Error getting chat history for user {user_id}: {e}")
             return []
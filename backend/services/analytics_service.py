@@ -1,19 +1,47 @@
 import logging
+import multiprocessing
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal
 from datetime import datetime, timezone, timedelta
-from services.holdings_service import get_user_holdings, calculate_portfolio_totals
+from services.holdings_service import calculate_portfolio_totals, get_portfolio_valuation
 from services.transaction_service import get_transaction_history
+from services.returns_service import calculate_returns
 from utils.database import get_supabase_client
+from utils.cache import TTLCache
+from utils.versions import cached_by_version
+from services.market_service import get_close_price_matrix
+from services.diversification_service import daily_returns_matrix
 
 logger = logging.getLogger(__name__)
 
+# (user_id, user_version, price_epoch, function, args) -> result; dashboard polls between writes are lookups
+_analytics_cache = TTLCache(maxsize=2048, ttl=900)
+
+# Monte Carlo projection limits
+PROJECTION_METHODS = ('bootstrap', 'parametric')
+PROJECTION_PERCENTILES = (5, 25, 50, 75, 95)
+PROJECTION_MAX_STEPS = 50_000_000       # paths x horizon days per request; paths are cut to fit
+PROJECTION_CHUNK_PATHS = 2_000          # paths per vectorized batch (bounds memory per batch)
+PROJECTION_PARALLEL_STEPS = 5_000_000   # larger requests are spread over the process pool
+PROJECTION_MAX_WORKERS = min(os.cpu_count() or 1, 4)
+PROJECTION_OUTPUT_POINTS = 120
+
+# (holdings signature, parameters, as_of_date) -> projection; identical portfolios share results
+_projection_cache = TTLCache(maxsize=256, ttl=3600)
+_projection_pool = None
+
+@cached_by_version(_analytics_cache)
 def calculate_portfolio_performance(user_id: str):
     """Calculate portfolio performance metrics"""
     try:
-        holdings = get_user_holdings(user_id)
+        valuation = get_portfolio_valuation(user_id)
+        holdings = valuation['holdings']
         
         # Basic calculations using portfolio totals
-        totals = calculate_portfolio_totals(user_id)
+        totals = valuation['totals']
         
         total_value = totals['total_market_value']
         total_cost = totals['total_cost_basis']
@@ -48,57 +76,101 @@ def calculate_portfolio_performance(user_id: str):
         logger.error(f"Error calculating portfolio performance: {e}")
         return {}
 
-def calculate_asset_allocation(user_id: str):
-    """Calculate asset allocation breakdown by type"""
+# Display names for assets.asset_type
+ASSET_TYPE_LABELS = {'CASH': 'Cash', 'STOCK': 'Stocks', 'BOND': 'Bonds'}
+
+def _allocation_breakdown(groups: dict, total_value: float):
+    """Turn {name: {'value', 'count'}} into a list sorted by value with percentages"""
+    breakdown = [
+        {
+            'name': name,
+            'value': round(group['value'], 2),
+            'count': group['count'],
+            'percentage': round(group['value'] / total_value * 100, 1) if total_value > 0 else 0
+        }
+        for name, group in groups.items()
+    ]
+    breakdown.sort(key=lambda x: x['value'], reverse=True)
+    return breakdown
+
+def build_allocation(holdings: list, top_n: int = None):
+    """Group holdings by asset type, sector, currency and symbol in a single pass
+
+    With top_n, only the largest top_n positions are listed individually and the
+    rest are rolled into one 'OTHER' entry.
+    """
+    total_value = 0
+    by_asset_type, by_sector, by_currency = {}, {}, {}
+    positions = []
+    
+    for holding in holdings:
+        if holding['quantity'] <= 0:
+            continue
+        
+        symbol = holding['symbol']
+        value = holding['market_value']
+        total_value += value
+        
+        is_cash = symbol == 'CASH'
+        asset_type = holding.get('asset_type') or ('CASH' if is_cash else 'STOCK')
+        keys = (
+            (by_asset_type, ASSET_TYPE_LABELS.get(asset_type, asset_type.title())),
+            (by_sector, 'Cash' if is_cash else (holding.get('sector') or 'Unknown')),
+            (by_currency, holding.get('currency') or 'USD'),
+        )
+        for groups, name in keys:
+            group = groups.setdefault(name, {'value': 0, 'count': 0})
+            group['value'] += value
+            group['count'] += 1
+        
+        positions.append({
+            'symbol': symbol,
+            'name': holding.get('name', symbol),
+            'sector': keys[1][1],
+            'value': value
+        })
+    
+    positions.sort(key=lambda x: x['value'], reverse=True)
+    if top_n is not None and len(positions) > top_n:
+        rest = positions[top_n:]
+        positions = positions[:top_n] + [{
+            'symbol': 'OTHER',
+            'name': f'Other ({len(rest)} positions)',
+            'sector': None,
+            'value': sum(p['value'] for p in rest)
+        }]
+    for position in positions:
+        position['percentage'] = round(position['value'] / total_value * 100, 1) if total_value > 0 else 0
+        position['value'] = round(position['value'], 2)
+    
+    return {
+        'total_value': round(total_value, 2),
+        'by_asset_type': _allocation_breakdown(by_asset_type, total_value),
+        'by_sector': _allocation_breakdown(by_sector, total_value),
+        'by_currency': _allocation_breakdown(by_currency, total_value),
+        'by_symbol': positions
+    }
+
+@cached_by_version(_analytics_cache)
+def calculate_asset_allocation(user_id: str, top_n: int = None):
+    """Calculate allocation by asset type, sector, currency and symbol from the cached valuation"""
     try:
-        holdings = get_user_holdings(user_id)
-        
-        # Group by asset type
-        allocation = {}
-        total_value = 0
-        
-        for holding in holdings:
-            if holding['quantity'] <= 0:
-                continue
-                
-            symbol = holding['symbol']
-            value = holding['market_value']
-            total_value += value
-            
-            # Determine asset type
-            if symbol == 'CASH':
-                asset_type = 'Cash'
-            else:
-                asset_type = 'Stocks'
-            
-            if asset_type not in allocation:
-                allocation[asset_type] = {'value': 0, 'count': 0}
-            
-            allocation[asset_type]['value'] += value
-            allocation[asset_type]['count'] += 1
-        
-        # Calculate percentages
-        for asset_type in allocation:
-            allocation[asset_type]['percentage'] = (
-                allocation[asset_type]['value'] / total_value * 100
-            ) if total_value > 0 else 0
-            allocation[asset_type]['value'] = round(allocation[asset_type]['value'], 2)
-            allocation[asset_type]['percentage'] = round(allocation[asset_type]['percentage'], 1)
-        
-        return allocation
+        return build_allocation(get_portfolio_valuation(user_id)['holdings'], top_n)
     except Exception as e:
         logger.error(f"Error calculating asset allocation: {e}")
         return {}
 
+@cached_by_version(_analytics_cache)
 def get_portfolio_summary(user_id: str):
     """Get comprehensive portfolio summary with key metrics"""
     try:
         performance = calculate_portfolio_performance(user_id)
         allocation = calculate_asset_allocation(user_id)
-        totals = calculate_portfolio_totals(user_id)
+        valuation = get_portfolio_valuation(user_id)
+        totals = valuation['totals']
         
         # Get top holdings by value (no individual performance analysis)
-        holdings = get_user_holdings(user_id)
+        holdings = valuation['holdings']
         stock_holdings = [h for h in holdings if h['symbol'] != 'CASH' and h['quantity'] > 0]
         stock_holdings.sort(key=lambda x: x['market_value'], reverse=True)
         top_holdings = stock_holdings[:5]
@@ -167,22 +239,12 @@ def calculate_transaction_metrics(user_id: str, days: int = 30):
 def calculate_portfolio_chart_data(user_id: str, period: str = '1M'):
     """Get portfolio value chart data from snapshots"""
     try:
-        from services.market_service import get_portfolio_value_history
-        
-        # Map period to days
-        period_days = {
-            '1W': 7,
-            '1M': 30,
-            '3M': 90,
-            '6M': 180,
-            '1Y': 365,
-            'MAX': 3650  # 10 years for MAX period
-        }
+        from services.market_service import get_portfolio_value_history, get_period_days
         
-        days = period_days.get(period, 30)
+        days = get_period_days(period)
         
         # Get portfolio value history from snapshots
-        history_data = get_portfolio_value_history(user_id, days)
+        history_data = get_portfolio_value_history(user_id, days)['chart_data']
         
         # If no historical data, return current value only
         if not history_data:
@@ -213,7 +275,7 @@ def calculate_historical_performance(user_id: str, days: int = 30):
         from services.market_service import get_portfolio_value_history
         
         # Get portfolio value history
-        history_data = get_portfolio_value_history(user_id, days)
+        history_data = get_portfolio_value_history(user_id, days)['chart_data']
         
         if len(history_data) < 2:
             return {
@@ -233,6 +295,9 @@ def calculate_historical_performance(user_id: str, days: int = 30):
         # Transaction metrics for the period
         transaction_metrics = calculate_transaction_metrics(user_id, days)
         
+        # Flow-adjusted returns (percent_change above counts deposits as gains)
+        returns = calculate_returns(user_id, days)
+        
         return {
             'period_days': days,
             'start_date': history_data[0]['date'],
@@ -241,10 +306,150 @@ def calculate_historical_performance(user_id: str, days: int = 30):
             'end_value': round(latest_value, 2),
             'value_change': round(value_change, 2),
             'percent_change': round(percent_change, 2),
+            'time_weighted_return_percent': returns.get('time_weighted_return_percent'),
+            'money_weighted_return_percent': returns.get('money_weighted_return_percent'),
             'snapshots_count': len(history_data),
             'transaction_metrics': transaction_metrics,
             'calculated_at': datetime.now(timezone.utc).isoformat()
         }
     except Exception as e:
         logger.error(f"Error calculating historical performance: {e}")
-        return {} 
\ No newline at end of file
+        return {} 
+
+def _simulate_chunk(portfolio_returns: np.ndarray, n_paths: int, horizon: int, method: str,
+                    sample_steps: np.ndarray, seed) -> np.ndarray:
+    """Growth multiples at sample_steps for n_paths simulated paths (runs in pool workers)"""
+    rng = np.random.default_rng(seed)
+    if method == 'bootstrap':
+        draws = np.log1p(portfolio_returns[rng.integers(0, len(portfolio_returns), (n_paths, horizon))])
+    else:
+        log_returns = np.log1p(portfolio_returns)
+        draws = rng.normal(log_returns.mean(), log_returns.std(ddof=1), (n_paths, horizon))
+    return np.exp(np.cumsum(draws, axis=1)[:, sample_steps])
+
+def _get_projection_pool():
+    """Shared worker pool, started on first use; spawn avoids forking the threaded web server"""
+    global _projection_pool
+    if _projection_pool is None:
+        _projection_pool = ProcessPoolExecutor(
+            max_workers=PROJECTION_MAX_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _projection_pool
+
+def simulate_growth(portfolio_returns: np.ndarray, paths: int, horizon: int, method: str = 'bootstrap',
+                    sample_steps: np.ndarray = None, seed: int = None, parallel: bool = None):
+    """Simulated growth multiples, shape (paths, len(sample_steps))
+
+    Paths are generated in fixed chunks with independent child seeds, so the result for a
+    given seed is the same whether the chunks run in-process or on the process pool.
+    """
+    if sample_steps is None:
+        sample_steps = np.arange(horizon)
+    chunk_sizes = [min(PROJECTION_CHUNK_PATHS, paths - start) for start in range(0, paths, PROJECTION_CHUNK_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    args = [(portfolio_returns, n, horizon, method, sample_steps, child) for n, child in zip(chunk_sizes, seeds)]
+
+    if parallel is None:
+        parallel = paths * horizon >= PROJECTION_PARALLEL_STEPS and PROJECTION_MAX_WORKERS > 1
+    if parallel and len(args) > 1:
+        try:
+            pool = _get_projection_pool()
+            return np.concatenate(list(pool.map(_simulate_chunk, *zip(*args))))
+        except Exception as e:
+            logger.warning(f"Projection pool unavailable, simulating in-process: {e}")
+    return np.concatenate([_simulate_chunk(*a) for a in args])
+
+def _portfolio_daily_returns(holdings: list, days: int):
+    """Historical daily returns of today's holdings (cash and unpriced symbols held flat)
+
+    Returns (portfolio_returns, start_value, missing_symbols).
+    """
+    start_value = sum(h['market_value'] for h in holdings)
+    stocks = [h for h in holdings if h['symbol'] != 'CASH' and h['market_value'] > 0]
+    if not stocks or start_value <= 0:
+        return np.array([]), start_value, []
+
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    start = str(np.datetime64(today, 'D') - np.timedelta64(days, 'D'))
+    symbols = [h['symbol'] for h in stocks]
+    dates, closes = get_close_price_matrix(symbols, start, today)
+    priced = ~np.isnan(closes).all(axis=0)
+    missing = [s for s, ok in zip(symbols, priced) if not ok]
+
+    weights = np.array([h['market_value'] for h in stocks])[priced] / start_value
+    returns = daily_returns_matrix(dates, closes[:, priced])
+    return returns @ weights, start_value, missing
+
+def project_portfolio(holdings: list, horizon_days: int = 252, paths: int = 5000, method: str = 'bootstrap',
+                      history_days: int = 1095, seed: int = None):
+    """Monte Carlo projection of current holdings over horizon_days trading days
+
+    Bootstrap resamples historical daily portfolio returns; parametric draws log returns
+    from a normal fitted to them (geometric Brownian motion). Paths are capped so that
+    paths x horizon stays within PROJECTION_MAX_STEPS.
+    """
+    if method not in PROJECTION_METHODS:
+        raise ValueError(f"method must be one of {', '.join(PROJECTION_METHODS)}")
+    holdings = [h for h in holdings if h['quantity'] > 0]
+    signature = tuple(sorted((h['symbol'], round(h['quantity'], 6), round(h['market_value'], 2)) for h in holdings))
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    cache_key = (signature, horizon_days, paths, method, history_days, seed, today)
+    cached = _projection_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
+    portfolio_returns, start_value, missing = _portfolio_daily_returns(holdings, history_days)
+    if len(portfolio_returns) < 20:
+        return {
+            'insufficient_data': True,
+            'message': 'Need at least 20 days of price history for the current holdings',
+            'start_value': round(start_value, 2),
+            'missing_price_symbols': missing,
+            'calculated_at': datetime.now(timezone.utc).isoformat()
+        }
+
+    paths_run = max(1, min(paths, PROJECTION_MAX_STEPS // horizon_days))
+    sample_steps = np.unique(np.linspace(0, horizon_days - 1, min(horizon_days, PROJECTION_OUTPUT_POINTS)).astype(int))
+    growth = simulate_growth(portfolio_returns, paths_run, horizon_days, method, sample_steps, seed)
+    values = start_value * growth
+    bands = np.percentile(values, PROJECTION_PERCENTILES, axis=0)
+    final = values[:, -1]
+
+    step_dates = np.busday_offset(np.datetime64(today, 'D'), sample_steps + 1, roll='forward')
+    result = {
+        'start_value': round(start_value, 2),
+        'horizon_days': horizon_days,
+        'method': method,
+        'paths_requested': paths,
+        'paths': paths_run,
+        'budget_limited': paths_run < paths,
+        'history_observations': len(portfolio_returns),
+        'dates': [str(today)] + step_dates.astype(str).tolist(),
+        'percentiles': {
+            f'p{p}': [round(start_value, 2)] + np.round(band, 2).tolist()
+            for p, band in zip(PROJECTION_PERCENTILES, bands)
+        },
+        'final_value': {
+            'mean': round(float(final.mean()), 2),
+            **{f'p{p}': round(float(v), 2) for p, v in zip(PROJECTION_PERCENTILES, bands[:, -1])}
+        },
+        'probability_of_loss_percent': round(float((final < start_value).mean()) * 100, 2),
+        'missing_price_symbols': missing,
+        'computation_ms': round((time.perf_counter() - started) * 1000, 3),
+        'calculated_at': datetime.now(timezone.utc).isoformat()
+    }
+    return _projection_cache.set(cache_key, result)
+
+def calculate_portfolio_projection(user_id: str, horizon_days: int = 252, paths: int = 5000,
+                                   method: str = 'bootstrap', history_days: int = 1095, seed: int = None):
+    """Monte Carlo projection of a user's current holdings"""
+    try:
+        holdings = get_portfolio_valuation(user_id)['holdings']
+        return project_portfolio(holdings, horizon_days, paths, method, history_days, seed)
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Error projecting portfolio for user {user_id}: {e}")
+        raise Exception("Failed to project portfolio")
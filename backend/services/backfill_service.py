@@ -0,0 +1,152 @@
+"""
+Historical snapshot backfill
+Replays the transaction ledger into daily positions and values them with daily closes
+"""
+
+import logging
+import time
+import numpy as np
+from datetime import datetime, timezone
+from utils.database import get_supabase_client, fetch_all_rows
+from utils.locks import user_lock
+from services.market_service import get_close_price_matrix, rebuild_snapshot_rollups
+from services.returns_service import invalidate_returns_cache
+from services.risk_service import invalidate_risk_cache
+
+logger = logging.getLogger(__name__)
+
+# Signed effect of each transaction type on (position quantity, cash)
+QUANTITY_SIGN = {'BUY': 1, 'SELL': -1, 'DEPOSIT': 0, 'WITHDRAWAL': 0}
+CASH_SIGN = {'BUY': -1, 'SELL': 1, 'DEPOSIT': 1, 'WITHDRAWAL': -1}
+
+def load_ledger(user_id: str):
+    """All of a user's transactions, oldest first"""
+    client = get_supabase_client()
+    return fetch_all_rows(
+        lambda: client.table('transactions')
+        .select('symbol, transaction_type, quantity, price, total_amount, transaction_date')
+        .eq('user_id', user_id)
+        .order('transaction_date')
+    )
+
+def forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """Carry the last non-NaN value down each column (leading NaNs stay NaN)"""
+    rows = np.arange(matrix.shape[0])[:, None]
+    last_valid = np.where(np.isnan(matrix), 0, rows)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    # Leading NaNs point at row 0, which is itself NaN in that case
+    return matrix[last_valid, np.arange(matrix.shape[1])]
+
+def build_daily_positions(ledger: list, dates: np.ndarray):
+    """End-of-day positions and cash for every date from the ledger
+
+    Returns (symbols, positions[days x symbols], cash[days], trade_prices[days x symbols]);
+    trade_prices holds the last traded price per symbol as a fallback valuation.
+    Rows dated after the last date are ignored.
+    """
+    last_day = str(dates[-1])
+    ledger = [tx for tx in ledger if tx['transaction_date'][:10] <= last_day]
+    trades = [tx for tx in ledger if tx['transaction_type'] in ('BUY', 'SELL')]
+    symbols = sorted({tx['symbol'] for tx in trades})
+    symbol_index = {symbol: j for j, symbol in enumerate(symbols)}
+
+    tx_days = np.array([tx['transaction_date'][:10] for tx in ledger], dtype='datetime64[D]')
+    day_index = np.searchsorted(dates, tx_days, side='left')
+    types = [tx['transaction_type'] for tx in ledger]
+
+    cash_deltas = np.zeros(len(dates))
+    amounts = np.array([float(tx['total_amount']) for tx in ledger]) * np.array([CASH_SIGN[t] for t in types])
+    np.add.at(cash_deltas, day_index, amounts)
+
+    position_deltas = np.zeros((len(dates), len(symbols)))
+    trade_prices = np.full((len(dates), len(symbols)), np.nan)
+    trade_rows = np.array([i for i, t in enumerate(types) if t in ('BUY', 'SELL')], dtype=int)
+    if len(trade_rows):
+        columns = np.array([symbol_index[ledger[i]['symbol']] for i in trade_rows])
+        quantities = np.array([float(ledger[i]['quantity']) * QUANTITY_SIGN[types[i]] for i in trade_rows])
+        np.add.at(position_deltas, (day_index[trade_rows], columns), quantities)
+        trade_prices[day_index[trade_rows], columns] = [float(ledger[i]['price']) for i in trade_rows]
+
+    return symbols, np.cumsum(position_deltas, axis=0), np.cumsum(cash_deltas), forward_fill(trade_prices)
+
+def compute_daily_values(positions: np.ndarray, cash: np.ndarray, closes: np.ndarray, trade_prices: np.ndarray):
+    """Portfolio value per day; market closes win, last trade price fills days without a close"""
+    prices = np.where(np.isnan(closes), trade_prices, closes)
+    return np.nansum(positions * prices, axis=1) + cash
+
+def backfill_user_snapshots(user_id: str, start_date: str = None, end_date: str = None,
+                            overwrite: bool = False, chunk_size: int = 500):
+    """Write daily snapshots replayed from the ledger; existing snapshots are kept unless overwrite"""
+    try:
+        started = time.perf_counter()
+        ledger = load_ledger(user_id)
+        if not ledger:
+            return {'user_id': user_id, 'snapshots_written': 0, 'message': 'No transactions to replay'}
+
+        first_day = ledger[0]['transaction_date'][:10]
+        start = max(start_date, first_day) if start_date else first_day
+        end = end_date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        # Replay from the first transaction so positions are right at `start`, then trim
+        dates = np.arange(np.datetime64(first_day, 'D'), np.datetime64(end, 'D') + np.timedelta64(1, 'D'))
+        if not len(dates):
+            return {'user_id': user_id, 'snapshots_written': 0, 'message': 'No transactions before end_date'}
+
+        symbols, positions, cash, trade_prices = build_daily_positions(ledger, dates)
+        # Ledger quantities are share counts as traded, so value them at the closes quoted then
+        closes = get_close_price_matrix(symbols, first_day, end, adjusted=False)[1] if symbols else np.empty((len(dates), 0))
+        values = compute_daily_values(positions, cash, closes, trade_prices)
+
+        in_range = dates >= np.datetime64(start, 'D')
+        dates, values = dates[in_range], values[in_range]
+        missing_symbols = [s for j, s in enumerate(symbols) if np.isnan(closes[:, j]).all()]
+
+        client = get_supabase_client()
+        written = 0
+        skipped = 0
+        with user_lock(user_id):
+            existing = set()
+            if not overwrite:
+                rows = fetch_all_rows(
+                    lambda: client.table('portfolio_snapshots')
+                    .select('date')
+                    .eq('user_id', user_id)
+                    .gte('date', start)
+                    .order('date')
+                )
+                existing = {row['date'] for row in rows}
+
+            created_at = datetime.now(timezone.utc).isoformat()
+            pending = [
+                {'user_id': user_id, 'date': day, 'total_value': round(value, 4), 'created_at': created_at}
+                for day, value in zip(dates.astype(str).tolist(), values.tolist())
+                if day not in existing
+            ]
+            skipped = len(dates) - len(pending)
+            for chunk_start in range(0, len(pending), chunk_size):
+                client.table('portfolio_snapshots')\
+                    .upsert(pending[chunk_start:chunk_start + chunk_size], on_conflict='user_id,date')\
+                    .execute()
+                written += len(pending[chunk_start:chunk_start + chunk_size])
+
+            if written:
+                rebuild_snapshot_rollups(user_id, start)
+
+        invalidate_returns_cache(user_id)
+        invalidate_risk_cache(user_id)
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Backfilled {written} snapshots for user {user_id} ({len(symbols)} symbols) in {elapsed:.2f}s")
+        return {
+            'user_id': user_id,
+            'start_date': start,
+            'end_date': end,
+            'days': int(len(dates)),
+            'symbols': symbols,
+            'missing_price_symbols': missing_symbols,
+            'snapshots_written': written,
+            'skipped_existing': skipped,
+            'elapsed_seconds': round(elapsed, 3)
+        }
+    except Exception as e:
+        logger.error(f"Error backfilling snapshots for user {user_id}: {e}")
+        raise Exception("Failed to backfill portfolio snapshots")
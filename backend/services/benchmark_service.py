@@ -0,0 +1,101 @@
+"""
+Benchmark-relative performance
+Compares a user's flow-adjusted snapshot series with an index such as SPY or QQQ
+"""
+
+import logging
+import numpy as np
+from datetime import datetime, timezone
+from utils.downsampling import lttb_indices
+from services.returns_service import get_flow_adjusted_series, period_returns, RETURNS_MIN_POINTS
+from services.risk_service import annualization_factor
+from services.market_service import get_benchmark_history, align_closes
+
+logger = logging.getLogger(__name__)
+
+def compute_benchmark_comparison(dates: np.ndarray, values: np.ndarray, flows: np.ndarray,
+                                 benchmark_closes: np.ndarray) -> dict:
+    """Normalized portfolio and benchmark indexes (both start at 100) plus relative statistics
+
+    The portfolio index chains flow-adjusted period returns, so deposits and withdrawals do
+    not show up as performance. Statistics use only the periods where the benchmark has a close.
+    """
+    portfolio_returns = period_returns(values, flows)
+    portfolio_index = 100 * np.concatenate(([1.0], np.cumprod(1 + portfolio_returns)))
+
+    benchmark_index = np.full(len(dates), np.nan)
+    has_close = ~np.isnan(benchmark_closes)
+    if has_close.any():
+        base = benchmark_closes[np.argmax(has_close)]
+        benchmark_index = 100 * benchmark_closes / base
+
+    benchmark_returns = benchmark_index[1:] / benchmark_index[:-1] - 1
+    valid = ~np.isnan(benchmark_returns)
+    active = portfolio_returns[valid] - benchmark_returns[valid]
+    periods_per_year = annualization_factor(dates)
+
+    portfolio_return = portfolio_index[-1] / 100 - 1
+    last_benchmark = benchmark_index[has_close][-1] if has_close.any() else np.nan
+    benchmark_return = last_benchmark / 100 - 1
+    tracking_error = float(active.std(ddof=1) * np.sqrt(periods_per_year)) if len(active) > 1 else None
+    annual_active = float(active.mean() * periods_per_year) if len(active) else None
+
+    return {
+        'portfolio_index': portfolio_index,
+        'benchmark_index': benchmark_index,
+        'portfolio_return_percent': round(float(portfolio_return) * 100, 2),
+        'benchmark_return_percent': round(float(benchmark_return) * 100, 2) if not np.isnan(benchmark_return) else None,
+        'relative_return_percent': (
+            round(float(portfolio_return - benchmark_return) * 100, 2) if not np.isnan(benchmark_return) else None
+        ),
+        'tracking_error_percent': round(tracking_error * 100, 2) if tracking_error is not None else None,
+        'information_ratio': (
+            round(annual_active / tracking_error, 3) if tracking_error else None
+        ),
+        'observations': int(valid.sum())
+    }
+
+def compare_to_benchmark(user_id: str, days: int = 365, benchmark: str = 'SPY', max_points: int = None):
+    """User's snapshot series next to a benchmark's, both normalized to 100 at the first snapshot"""
+    try:
+        history, dates, values, flows, _ = get_flow_adjusted_series(user_id, days, RETURNS_MIN_POINTS)
+        if len(history) < 2:
+            return {
+                'period_days': days,
+                'benchmark': benchmark,
+                'insufficient_data': True,
+                'message': 'Need at least 2 portfolio snapshots for a benchmark comparison',
+                'calculated_at': datetime.now(timezone.utc).isoformat()
+            }
+
+        benchmark_dates, closes = get_benchmark_history(benchmark)
+        benchmark_closes = align_closes(dates, benchmark_dates, closes)
+        comparison = compute_benchmark_comparison(dates, values, flows, benchmark_closes)
+
+        portfolio_index = comparison.pop('portfolio_index')
+        benchmark_index = comparison.pop('benchmark_index')
+        keep = lttb_indices(dates.astype(float), portfolio_index, max_points) if max_points else np.arange(len(dates))
+        series = [
+            {
+                'date': str(dates[i]),
+                'total_value': round(float(values[i]), 2),
+                'portfolio_index': round(float(portfolio_index[i]), 4),
+                'benchmark_index': round(float(benchmark_index[i]), 4) if not np.isnan(benchmark_index[i]) else None,
+                'benchmark_close': round(float(benchmark_closes[i]), 4) if not np.isnan(benchmark_closes[i]) else None
+            }
+            for i in keep.tolist()
+        ]
+
+        return {
+            'period_days': days,
+            'benchmark': benchmark.upper(),
+            'start_date': history[0]['date'],
+            'end_date': history[-1]['date'],
+            **comparison,
+            'series': series,
+            'original_points': len(history),
+            'calculated_at': datetime.now(timezone.utc).isoformat()
+        }
+    except Exception as e:
+        logger.error(f"Error comparing user {user_id} to benchmark {benchmark}: {e}")
+        raise Exception("Failed to compare portfolio to benchmark")
@@ -0,0 +1,155 @@
+"""
+Holdings correlation and diversification analytics
+Correlation/covariance of holdings' daily returns, risk contributions and effective number of bets
+"""
+
+import logging
+import time
+import numpy as np
+from datetime import datetime, timezone
+from utils.cache import TTLCache
+from services.holdings_service import get_portfolio_valuation
+from services.market_service import get_close_price_matrix
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+MIN_RETURN_OBSERVATIONS = 20
+
+# (sorted symbols, days, as_of_date) -> (symbols, covariance, correlation, observations); shared across users
+_covariance_cache = TTLCache(maxsize=256)
+
+def daily_returns_matrix(dates: np.ndarray, closes: np.ndarray):
+    """Simple daily returns on business days, keeping only rows where every symbol has a return"""
+    business = np.is_busday(dates)
+    closes = closes[business]
+    returns = closes[1:] / closes[:-1] - 1
+    complete = ~np.isnan(returns).any(axis=1)
+    return returns[complete]
+
+def covariance_and_correlation(returns: np.ndarray):
+    """Sample covariance and correlation matrices of the columns of `returns`"""
+    covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+    std = np.sqrt(np.diag(covariance))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = covariance / np.outer(std, std)
+    correlation[~np.isfinite(correlation)] = 0.0
+    np.fill_diagonal(correlation, 1.0)
+    return covariance, correlation
+
+def get_symbol_covariance(symbols: list, days: int):
+    """Memoized covariance/correlation for a symbol set (order-independent, recomputed daily)
+
+    Returns (symbols, covariance, correlation, observations) with symbols sorted; symbols
+    without any price history are dropped.
+    """
+    key_symbols = tuple(sorted(set(symbols)))
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    cache_key = (key_symbols, days, today)
+    cached = _covariance_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    start = str(np.datetime64(today, 'D') - np.timedelta64(days, 'D'))
+    dates, closes = get_close_price_matrix(list(key_symbols), start, today)
+    priced = ~np.isnan(closes).all(axis=0)
+    kept = [s for s, ok in zip(key_symbols, priced) if ok]
+    returns = daily_returns_matrix(dates, closes[:, priced])
+    if len(kept) == 0 or len(returns) < 2:
+        return kept, np.empty((0, 0)), np.empty((0, 0)), len(returns)
+
+    covariance, correlation = covariance_and_correlation(returns)
+    return _covariance_cache.set(cache_key, (kept, covariance, correlation, len(returns)))
+
+def diversification_metrics(weights: np.ndarray, covariance: np.ndarray) -> dict:
+    """Risk contributions and diversification scores for portfolio weights
+
+    Risk contribution of holding i is w_i (Σw)_i / w'Σw, so contributions sum to 1. The
+    effective number of bets is exp(entropy) of the variance each principal component
+    carries (Meucci 2009); it ranges from 1 (one driver) to the number of holdings.
+    """
+    marginal = covariance @ weights
+    variance = float(weights @ marginal)
+    contributions = weights * marginal / variance if variance > 0 else np.zeros(len(weights))
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    exposures = eigenvectors.T @ weights
+    component_share = np.clip(exposures ** 2 * eigenvalues, 0, None)
+    component_share = component_share / component_share.sum() if component_share.sum() > 0 else component_share
+    nonzero = component_share[component_share > 0]
+    effective_bets = float(np.exp(-(nonzero * np.log(nonzero)).sum())) if len(nonzero) else 0.0
+
+    volatilities = np.sqrt(np.diag(covariance))
+    portfolio_volatility = np.sqrt(variance)
+    return {
+        'variance': variance,
+        'contributions': contributions,
+        'effective_number_of_bets': effective_bets,
+        'effective_number_of_holdings': float(1 / np.sum(weights ** 2)) if weights.any() else 0.0,
+        'diversification_ratio': float(weights @ volatilities / portfolio_volatility) if portfolio_volatility > 0 else None
+    }
+
+def calculate_diversification(user_id: str, days: int = 365):
+    """Correlation matrix, risk contributions and diversification scores for a user's stock holdings"""
+    try:
+        holdings = [
+            h for h in get_portfolio_valuation(user_id)['holdings']
+            if h['symbol'] != 'CASH' and h['quantity'] > 0 and h['market_value'] > 0
+        ]
+        if len(holdings) < 2:
+            return {
+                'period_days': days,
+                'insufficient_data': True,
+                'message': 'Need at least 2 stock holdings for a correlation analysis',
+                'calculated_at': datetime.now(timezone.utc).isoformat()
+            }
+
+        started = time.perf_counter()
+        symbols, covariance, correlation, observations = get_symbol_covariance([h['symbol'] for h in holdings], days)
+        missing = sorted({h['symbol'] for h in holdings} - set(symbols))
+        if len(symbols) < 2 or observations < MIN_RETURN_OBSERVATIONS:
+            return {
+                'period_days': days,
+                'insufficient_data': True,
+                'message': f'Need daily price history for at least 2 holdings ({observations} common return days found)',
+                'missing_price_symbols': missing,
+                'calculated_at': datetime.now(timezone.utc).isoformat()
+            }
+
+        value_by_symbol = {h['symbol']: h['market_value'] for h in holdings}
+        values = np.array([value_by_symbol[s] for s in symbols])
+        weights = values / values.sum()
+        metrics = diversification_metrics(weights, covariance)
+        volatilities = np.sqrt(np.diag(covariance) * TRADING_DAYS_PER_YEAR)
+        off_diagonal = correlation[~np.eye(len(symbols), dtype=bool)]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        return {
+            'period_days': days,
+            'symbols': symbols,
+            'observations': observations,
+            'correlation_matrix': np.round(correlation, 4).tolist(),
+            'covariance_matrix_annualized': np.round(covariance * TRADING_DAYS_PER_YEAR, 6).tolist(),
+            'average_correlation': round(float(off_diagonal.mean()), 4),
+            'holdings': [
+                {
+                    'symbol': symbol,
+                    'weight_percent': round(float(weights[i]) * 100, 2),
+                    'volatility_percent': round(float(volatilities[i]) * 100, 2),
+                    'risk_contribution_percent': round(float(metrics['contributions'][i]) * 100, 2)
+                }
+                for i, symbol in enumerate(symbols)
+            ],
+            'portfolio_volatility_percent': round(float(np.sqrt(metrics['variance'] * TRADING_DAYS_PER_YEAR)) * 100, 2),
+            'effective_number_of_bets': round(metrics['effective_number_of_bets'], 2),
+            'effective_number_of_holdings': round(metrics['effective_number_of_holdings'], 2),
+            'diversification_ratio': (
+                round(metrics['diversification_ratio'], 3) if metrics['diversification_ratio'] is not None else None
+            ),
+            'missing_price_symbols': missing,
+            'computation_ms': round(elapsed_ms, 3),
+            'calculated_at': datetime.now(timezone.utc).isoformat()
+        }
+    except Exception as e:
+        logger.error(f"Error calculating diversification for user {user_id}: {e}")
+        raise Exception("Failed to calculate holdings correlation")
@@ -3,9 +3,14 @@ from decimal import Decimal
 from utils.database import get_supabase_client
 from services.market_service import get_cached_price
 from utils.validators import validate_positive_number
+from utils.cache import TTLCache
+from utils.versions import data_version
 
 logger = logging.getLogger(__name__)
 
+# (user_id, user_version, price_epoch) -> {'holdings', 'totals'}; the TTL only covers out-of-band DB edits
+_valuation_cache = TTLCache(maxsize=1024, ttl=900)
+
 def get_user_holdings(user_id: str):
     """Get all holdings for a user with current market values (from cached prices)"""
     try:
@@ -35,7 +40,9 @@ def get_user_holdings(user_id: str):
                     'day_change': 0.0,
                     'day_change_percent': 0.0,
                     'realized_gain_loss': 0.0,
-                    'sector': None
+                    'sector': None,
+                    'asset_type': 'CASH',
+                    'currency': 'USD'
                 })
             else:
                 # Get current price from CACHED market_prices table (no yfinance call)
@@ -46,6 +53,8 @@ def get_user_holdings(user_id: str):
                 asset_data = get_asset_info(symbol)
                 company_name = asset_data.get('name', symbol) if asset_data else symbol
                 sector = asset_data.get('sector') if asset_data else None
+                asset_type = asset_data.get('asset_type') if asset_data else None
+                currency = asset_data.get('currency') if asset_data else None
                 
                 # Calculate values using USER'S cost basis vs CURRENT market price
                 market_value = quantity * current_price
@@ -66,7 +75,9 @@ def get_user_holdings(user_id: str):
                     'day_change': float(price_data.get('day_change', 0)) if price_data else 0.0,
                     'day_change_percent': float(price_data.get('day_change_percent', 0)) if price_data else 0.0,
                     'realized_gain_loss': float(realized_gain_loss_total),
-                    'sector': sector
+                    'sector': sector,
+                    'asset_type': asset_type or 'STOCK',
+                    'currency': currency or 'USD'
                 })
         
         return holdings
@@ -120,10 +131,11 @@ def get_user_symbols(user_id: str):
         logger.error(f"Error getting user symbols: {e}")
         return []
 
-def calculate_portfolio_totals(user_id: str):
-    """Calculate total portfolio value using cached market prices"""
+def calculate_portfolio_totals(user_id: str, holdings: list = None):
+    """Calculate total portfolio value using cached market prices (pass holdings to skip reloading them)"""
     try:
-        holdings = get_user_holdings(user_id)
+        if holdings is None:
+            holdings = get_user_holdings(user_id)
         
         total_market_value = sum(holding['market_value'] for holding in holdings)
         total_cost_basis = sum(holding['total_cost'] for holding in holdings)
@@ -157,6 +169,18 @@ def calculate_portfolio_totals(user_id: str):
             'holdings_count': 0
         }
 
+def get_portfolio_valuation(user_id: str):
+    """Holdings and totals valued once per (ledger version, price epoch) and shared by the analytics"""
+    cache_key = (user_id, *data_version(user_id))
+    cached = _valuation_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    holdings = get_user_holdings(user_id)
+    valuation = {'holdings': holdings, 'totals': calculate_portfolio_totals(user_id, holdings)}
+    # An empty result may be a failed read; don't pin it for the TTL
+    return _valuation_cache.set(cache_key, valuation) if holdings else valuation
+
 def get_holdings_for_symbol_refresh(user_id: str):
     """Get holdings that need price updates (non-zero positions, excluding cash)"""
     try:
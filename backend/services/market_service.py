@@ -4,13 +4,32 @@ SIMPLIFIED: Portfolio-focused, minimal individual stock research features
 """
 
 import logging
+import numpy as np
 import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timezone, timedelta
-from utils.database import get_supabase_client
+from utils.database import get_supabase_client, fetch_all_rows
 from utils.validators import validate_stock_symbol
+from utils.cache import TTLCache
+from utils.downsampling import lttb_indices
+from utils.locks import user_lock
+from utils.versions import bump_price_epoch
+from utils.price_store import get_price_store, empty_bars, BAR_DTYPE, total_return_closes, as_traded_closes
 
 logger = logging.getLogger(__name__)
 
+# (symbol, as_of_date) -> (dates, closes); one benchmark load per day shared by every user
+_benchmark_cache = TTLCache(maxsize=32)
+BENCHMARK_HISTORY_DAYS = 3660
+# An empty load (unknown symbol, provider outage) is retried after a few minutes, not the next day
+BENCHMARK_EMPTY_TTL_SECONDS = 300
+
+# Cached quotes older than this are refreshed on read paths that want live-ish prices
+QUOTE_MAX_AGE_SECONDS = 300
+# Shared by read paths that fan out to yfinance; calls that miss a deadline keep
+# running here and still land in market_prices for the next request
+_quote_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='quotes')
+
 def search_symbols(query: str, fuzzy: bool = True):
     """
     Search for stock symbols using yfinance with optional fuzzy search.
@@ -135,10 +154,79 @@ def get_cached_price(symbol: str):
         logger.error(f"Error getting cached price for {symbol}: {e}")
         return None
 
-def cache_price(symbol: str, price_data: dict):
-    """Cache price data in database"""
+def get_cached_prices(symbols: list) -> dict:
+    """{symbol: market_prices row with 'name'} for every cached symbol, in two queries"""
+    if not symbols:
+        return {}
+    try:
+        client = get_supabase_client()
+        rows = client.table('market_prices').select('*').in_('symbol', symbols).execute().data or []
+        assets = client.table('assets').select('symbol, name').in_('symbol', symbols).execute().data or []
+        names = {asset['symbol']: asset.get('name') for asset in assets}
+        return {row['symbol']: {**row, 'name': names.get(row['symbol']) or row['symbol']} for row in rows}
+    except Exception as e:
+        logger.error(f"Error getting cached prices for {len(symbols)} symbols: {e}")
+        return {}
+
+def is_quote_stale(price_data: dict, max_age_seconds: float = QUOTE_MAX_AGE_SECONDS) -> bool:
+    """True if a cached quote is missing its timestamp or older than max_age_seconds"""
+    last_updated = price_data.get('last_updated') if price_data else None
+    if not last_updated:
+        return True
+    try:
+        updated = datetime.fromisoformat(str(last_updated).replace('Z', '+00:00'))
+    except ValueError:
+        return True
+    if updated.tzinfo is None:
+        updated = updated.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - updated).total_seconds() > max_age_seconds
+
+def submit_market_fetch(fn, *args):
+    """Run a yfinance-bound call on the shared market data pool; returns its Future"""
+    return _quote_pool.submit(fn, *args)
+
+def _fetch_and_cache_price(symbol: str):
+    """(price_data, whether the cached current_price changed)"""
+    price_data = fetch_current_price(symbol)
+    changed = bool(price_data) and cache_price(symbol, price_data)
+    return price_data, changed
+
+def refresh_prices(symbols: list, timeout: float) -> dict:
+    """Fetch and cache fresh quotes for symbols concurrently, waiting at most `timeout` seconds
+
+    Returns {symbol: price_data} for the fetches that finished in time. The price epoch
+    is bumped at most once, and only if some cached current_price actually changed.
+    """
+    if not symbols:
+        return {}
+    futures = {submit_market_fetch(_fetch_and_cache_price, symbol): symbol for symbol in symbols}
+    done, pending = wait(futures, timeout=timeout)
+    if pending:
+        logger.warning(f"Quote refresh deadline hit: {len(pending)}/{len(symbols)} symbols still loading")
+
+    fresh = {}
+    changed = False
+    for future in done:
+        try:
+            price_data, price_changed = future.result()
+        except Exception as e:
+            logger.error(f"Error refreshing price for {futures[future]}: {e}")
+            continue
+        changed = changed or price_changed
+        if price_data:
+            fresh[futures[future]] = price_data
+    if changed:
+        bump_price_epoch()
+    return fresh
+
+def cache_price(symbol: str, price_data: dict) -> bool:
+    """Cache price data in database; True if the cached current_price changed
+
+    Callers bump the price epoch (once per batch) when this returns True.
+    """
     try:
         client = get_supabase_client()
+        previous = client.table('market_prices').select('current_price').eq('symbol', symbol).execute().data
         
         # Ensure asset exists in assets table before caching price
         from services.holdings_service import add_new_asset_if_needed
@@ -157,11 +245,12 @@ def cache_price(symbol: str, price_data: dict):
         # Remove None values
         cache_data = {k: v for k, v in cache_data.items() if v is not None}
         
-        response = client.table('market_prices').upsert(cache_data, on_conflict='symbol').execute()
-        return response.data[0] if response.data else None
+        client.table('market_prices').upsert(cache_data, on_conflict='symbol').execute()
+        
+        return not previous or previous[0].get('current_price') != cache_data.get('current_price')
     except Exception as e:
         logger.error(f"Error caching price for {symbol}: {e}")
-        return None
+        return False
 
 def get_current_price(symbol: str, force_fresh: bool = False):
     """Get current price for individual stock lookup (for adding to portfolio)"""
@@ -170,7 +259,8 @@ def get_current_price(symbol: str, force_fresh: bool = False):
         if force_fresh:
             price_data = fetch_current_price(symbol)
             if price_data:
-                cache_price(symbol, price_data)
+                if cache_price(symbol, price_data):
+                    bump_price_epoch()
                 return price_data
             return None
         
@@ -182,7 +272,8 @@ def get_current_price(symbol: str, force_fresh: bool = False):
         # If not cached, fetch fresh price
         price_data = fetch_current_price(symbol)
         if price_data:
-            cache_price(symbol, price_data)
+            if cache_price(symbol, price_data):
+                bump_price_epoch()
             return price_data
         
         return None
@@ -204,6 +295,7 @@ def refresh_all_prices(user_id: str):
         
         updated_count = 0
         failed_symbols = []
+        changed = False
         
         for symbol in symbols:
             try:
@@ -211,7 +303,7 @@ def refresh_all_prices(user_id: str):
                 price_data = fetch_current_price(symbol)
                 if price_data:
                     # Cache the price data
-                    cache_price(symbol, price_data)
+                    changed = cache_price(symbol, price_data) or changed
                     updated_count += 1
                     logger.info(f"Updated price for {symbol}: ${price_data['current_price']}")
                 else:
@@ -221,6 +313,10 @@ def refresh_all_prices(user_id: str):
                 logger.error(f"Error updating price for {symbol}: {e}")
                 failed_symbols.append(symbol)
         
+        if changed:
+            # Every portfolio holding these symbols is now valued differently
+            bump_price_epoch()
+        
         logger.info(f"Refreshed {updated_count}/{len(symbols)} prices for user {user_id}")
         
         if failed_symbols:
@@ -276,8 +372,268 @@ def fetch_sector_info(symbol: str):
             'name': symbol
         }
 
+def _download_bars(symbol: str, start_date: str, end_date: str) -> np.ndarray:
+    """Daily split-adjusted OHLCV bars with dividends and splits from yfinance for start_date <= date <= end_date"""
+    end = str(np.datetime64(end_date, 'D') + np.timedelta64(1, 'D'))  # yfinance's end is exclusive
+    history = yf.Ticker(symbol).history(start=start_date, end=end, auto_adjust=False, actions=True)
+    if history is None or history.empty:
+        return empty_bars()
+
+    index = history.index.tz_localize(None) if history.index.tz is not None else history.index
+    bars = np.zeros(len(history), dtype=BAR_DTYPE)
+    bars['date'] = index.values.astype('datetime64[D]')
+    for field, column in (('open', 'Open'), ('high', 'High'), ('low', 'Low'), ('close', 'Close'), ('volume', 'Volume'),
+                          ('dividend', 'Dividends'), ('split', 'Stock Splits')):
+        if column in history:
+            bars[field] = history[column].fillna(0).to_numpy(dtype=float)
+    return bars
+
+def get_price_bars(symbol: str, start_date: str, end_date: str = None) -> np.ndarray:
+    """Daily OHLCV bars (BAR_DTYPE records) from the local price store
+
+    Missing completed days are downloaded and appended first; today's unfinished
+    bar is never stored. If the download fails, whatever is stored is returned.
+    """
+    try:
+        symbol = validate_stock_symbol(symbol)
+    except ValueError as e:
+        logger.error(f"Error fetching price history for {symbol}: {e}")
+        return empty_bars()
+
+    store = get_price_store()
+    last_complete = np.datetime64(datetime.now(timezone.utc).strftime('%Y-%m-%d'), 'D') - np.timedelta64(1, 'D')
+    fetch_end = min(np.datetime64(end_date, 'D'), last_complete) if end_date else last_complete
+    try:
+        store.ensure(symbol, start_date, str(fetch_end), _download_bars)
+    except Exception as e:
+        logger.warning(f"Could not update stored price history for {symbol}: {e}")
+
+    bars = store.read_range(symbol, start_date, end_date)
+    if not len(bars):
+        logger.warning(f"No price history found for {symbol}")
+    return bars
+
+def get_price_history(symbol: str, start_date: str, end_date: str = None, adjusted: bool = True):
+    """Get daily closing prices as (dates, closes) NumPy arrays read from the price store
+
+    adjusted=True gives split- and dividend-adjusted closes (for returns); False gives
+    the closes as quoted on each day (for valuing share counts from the ledger).
+    """
+    bars = get_price_bars(symbol, start_date, end_date)
+    if not len(bars):
+        return bars['date'], bars['close']
+    # Adjustments depend on later actions, so compute over everything stored after start_date
+    later = get_price_store().read_range(validate_stock_symbol(symbol), str(bars['date'][0]))
+    closes = total_return_closes(later) if adjusted else as_traded_closes(later)
+    return bars['date'], closes[:len(bars)]
+
+def get_benchmark_history(symbol: str):
+    """Last BENCHMARK_HISTORY_DAYS of daily closes for a benchmark index, loaded once per day
+
+    Every user's comparison slices the same in-memory arrays instead of reading the store.
+    """
+    symbol = symbol.upper()
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    key = (symbol, today)
+    cached = _benchmark_cache.get(key)
+    if cached is not None and (len(cached[0]) or (_benchmark_cache.age(key) or 0) <= BENCHMARK_EMPTY_TTL_SECONDS):
+        return cached
+    
+    start = str(np.datetime64(today, 'D') - np.timedelta64(BENCHMARK_HISTORY_DAYS, 'D'))
+    dates, closes = get_price_history(symbol, start)
+    return _benchmark_cache.set(key, (np.array(dates), np.array(closes)))
+
+def align_closes(dates: np.ndarray, price_dates: np.ndarray, closes: np.ndarray) -> np.ndarray:
+    """Close as of each date (last close on or before it, NaN before any data)"""
+    aligned = np.full(len(dates), np.nan)
+    if len(price_dates) == 0:
+        return aligned
+    idx = np.searchsorted(price_dates, dates, side='right') - 1
+    has_close = idx >= 0
+    aligned[has_close] = closes[idx[has_close]]
+    return aligned
+
+def get_close_price_matrix(symbols: list, start_date: str, end_date: str = None, adjusted: bool = True):
+    """Daily closes for several symbols on one calendar-day axis
+
+    Returns (dates, matrix) where matrix[i, j] is symbols[j]'s close as of dates[i],
+    carried over weekends/holidays and NaN before the symbol's first close. Each
+    symbol is read from the local price store; `adjusted` is as for get_price_history.
+    """
+    start = np.datetime64(start_date, 'D')
+    end = np.datetime64(end_date or datetime.now(timezone.utc).strftime('%Y-%m-%d'), 'D')
+    dates = np.arange(start, end + np.timedelta64(1, 'D'))
+    matrix = np.full((len(dates), len(symbols)), np.nan)
+    
+    # Start a week early so the first days can carry the previous close
+    fetch_start = str(start - np.timedelta64(7, 'D'))
+    for j, symbol in enumerate(symbols):
+        price_dates, closes = get_price_history(symbol, fetch_start, str(end), adjusted)
+        matrix[:, j] = align_closes(dates, price_dates, closes)
+    return dates, matrix
+
 # Portfolio-focused historical data functions
 
+# Look-back windows for the chart periods supported by the portfolio endpoints
+PERIOD_DAYS = {
+    '1W': 7,
+    '1M': 30,
+    '3M': 90,
+    '6M': 180,
+    '1Y': 365,
+    'MAX': 3650  # 10 years for MAX period
+}
+
+def get_period_days(period: str) -> int:
+    """Map a chart period to its look-back window in days (unknown periods default to 1M)"""
+    return PERIOD_DAYS.get(period, 30)
+
+# Approximate days per bucket for the snapshot rollup resolutions, coarsest first
+SNAPSHOT_RESOLUTIONS = {
+    'MONTH': 30.44,
+    'WEEK': 7
+}
+
+def get_rollup_period_start(snapshot_date: str, resolution: str) -> str:
+    """First day of the week (Monday) or month that a snapshot date belongs to"""
+    day = datetime.strptime(snapshot_date, '%Y-%m-%d').date()
+    if resolution == 'WEEK':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    return day.replace(day=1).isoformat()
+
+def get_rollup_period_end(period_start: str, resolution: str) -> str:
+    """Last day of the week or month starting at period_start"""
+    day = datetime.strptime(period_start, '%Y-%m-%d').date()
+    if resolution == 'WEEK':
+        return (day + timedelta(days=6)).isoformat()
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return (next_month - timedelta(days=1)).isoformat()
+
+def choose_snapshot_resolution(days: int, min_points: int = None) -> str:
+    """Coarsest resolution that still yields at least min_points for the window (DAY when unset)"""
+    if not min_points:
+        return 'DAY'
+    for resolution, bucket_days in SNAPSHOT_RESOLUTIONS.items():
+        if days / bucket_days >= min_points:
+            return resolution
+    return 'DAY'
+
+def merge_snapshot_rollup(row: dict, snapshot_date: str, value: float) -> dict:
+    """OHLC fields of a rollup bucket after folding in one snapshot (row is None for a new bucket)"""
+    if not row:
+        return {
+            'open_date': snapshot_date,
+            'open_value': value,
+            'close_date': snapshot_date,
+            'close_value': value,
+            'high_value': value,
+            'low_value': value
+        }
+    
+    rollup = {
+        'open_date': row['open_date'],
+        'open_value': float(row['open_value']),
+        'close_date': row['close_date'],
+        'close_value': float(row['close_value']),
+        'high_value': max(float(row['high_value']), value),
+        'low_value': min(float(row['low_value']), value)
+    }
+    if snapshot_date <= row['open_date']:
+        rollup['open_date'], rollup['open_value'] = snapshot_date, value
+    if snapshot_date >= row['close_date']:
+        rollup['close_date'], rollup['close_value'] = snapshot_date, value
+    return rollup
+
+def update_snapshot_rollups(user_id: str, snapshot_date: str, portfolio_value: float):
+    """Fold one daily snapshot into its weekly and monthly OHLC rollup rows"""
+    update_snapshot_rollups_bulk(snapshot_date, {user_id: portfolio_value})
+
+def update_snapshot_rollups_bulk(snapshot_date: str, values_by_user: dict):
+    """Fold one day's snapshots for many users into their rollups with one read and one upsert per resolution
+
+    Must run after the daily rows are written. A bucket whose date range already
+    covers snapshot_date may hold a replaced value in its high/low, so it is rebuilt
+    from the daily snapshots instead of merged into.
+    """
+    client = get_supabase_client()
+    user_ids = list(values_by_user)
+    updated_at = datetime.now(timezone.utc).isoformat()
+    
+    for resolution in SNAPSHOT_RESOLUTIONS:
+        period_start = get_rollup_period_start(snapshot_date, resolution)
+        existing = client.table('portfolio_snapshot_rollups')\
+            .select('*')\
+            .in_('user_id', user_ids)\
+            .eq('resolution', resolution)\
+            .eq('period_start', period_start)\
+            .execute()
+        existing_by_user = {row['user_id']: row for row in existing.data}
+        
+        rebuild_users = [
+            user_id for user_id, row in existing_by_user.items()
+            if user_id in values_by_user and row['open_date'] <= snapshot_date <= row['close_date']
+        ]
+        rebuilt = {}
+        if rebuild_users:
+            period_end = get_rollup_period_end(period_start, resolution)
+            snapshots = fetch_all_rows(
+                lambda: client.table('portfolio_snapshots')
+                .select('user_id, date, total_value')
+                .in_('user_id', rebuild_users)
+                .gte('date', period_start)
+                .lte('date', period_end)
+                .order('date')
+            )
+            for snapshot in snapshots:
+                user_id = snapshot['user_id']
+                rebuilt[user_id] = merge_snapshot_rollup(rebuilt.get(user_id), snapshot['date'], float(snapshot['total_value']))
+        
+        rows = [
+            {
+                'user_id': user_id,
+                'resolution': resolution,
+                'period_start': period_start,
+                **(rebuilt.get(user_id) or merge_snapshot_rollup(existing_by_user.get(user_id), snapshot_date, float(value))),
+                'updated_at': updated_at
+            }
+            for user_id, value in values_by_user.items()
+        ]
+        client.table('portfolio_snapshot_rollups')\
+            .upsert(rows, on_conflict='user_id,resolution,period_start')\
+            .execute()
+
+def rebuild_snapshot_rollups(user_id: str, start_date: str):
+    """Recompute a user's rollups from daily snapshots, starting at the buckets that contain start_date"""
+    client = get_supabase_client()
+    updated_at = datetime.now(timezone.utc).isoformat()
+    
+    for resolution in SNAPSHOT_RESOLUTIONS:
+        period_start = get_rollup_period_start(start_date, resolution)
+        snapshots = fetch_all_rows(
+            lambda: client.table('portfolio_snapshots')
+            .select('date, total_value')
+            .eq('user_id', user_id)
+            .gte('date', period_start)
+            .order('date')
+        )
+        
+        buckets = {}
+        for snapshot in snapshots:
+            bucket = get_rollup_period_start(snapshot['date'], resolution)
+            buckets[bucket] = merge_snapshot_rollup(buckets.get(bucket), snapshot['date'], float(snapshot['total_value']))
+        
+        if buckets:
+            client.table('portfolio_snapshot_rollups').upsert([
+                {
+                    'user_id': user_id,
+                    'resolution': resolution,
+                    'period_start': bucket,
+                    **rollup,
+                    'updated_at': updated_at
+                }
+                for bucket, rollup in buckets.items()
+            ], on_conflict='user_id,resolution,period_start').execute()
+
 def store_portfolio_snapshot(user_id: str, portfolio_value: float, date: str = None):
     """Store daily portfolio value snapshot for historical tracking"""
     try:
@@ -285,34 +641,92 @@ def store_portfolio_snapshot(user_id: str, portfolio_value: float, date: str = N
         
         snapshot_date = date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
         
-        # Store portfolio value snapshot
-        response = client.table('portfolio_snapshots').upsert({
-            'user_id': user_id,
-            'date': snapshot_date,
-            'total_value': portfolio_value,
-            'created_at': datetime.now(timezone.utc).isoformat()
-        }, on_conflict='user_id,date').execute()
+        # Rollups are read-modify-write, so keep this user's snapshot writes in order
+        with user_lock(user_id):
+            # Store portfolio value snapshot
+            response = client.table('portfolio_snapshots').upsert({
+                'user_id': user_id,
+                'date': snapshot_date,
+                'total_value': portfolio_value,
+                # Set explicitly: an upsert over a batch row would otherwise keep source='batch'
+                'source': 'api',
+                'created_at': datetime.now(timezone.utc).isoformat()
+            }, on_conflict='user_id,date').execute()
+            
+            try:
+                update_snapshot_rollups(user_id, snapshot_date, portfolio_value)
+            except Exception as e:
+                # Daily rows stay authoritative; readers fall back to them when rollups are missing
+                logger.warning(f"Could not update snapshot rollups for user {user_id}: {e}")
+        
+        # Cached returns and risk metrics were computed without this snapshot
+        from services.returns_service import invalidate_returns_cache
+        from services.risk_service import invalidate_risk_cache
+        invalidate_returns_cache(user_id)
+        invalidate_risk_cache(user_id)
         
         return response.data[0] if response.data else None
     except Exception as e:
         logger.error(f"Error storing portfolio snapshot: {e}")
         return None
 
-def get_portfolio_value_history(user_id: str, days: int = 30):
-    """Get portfolio value history for charts with daily net change calculation"""
+def get_snapshot_rollups(user_id: str, resolution: str, cutoff_date: str):
+    """Get rollup buckets closing on or after cutoff_date as chart rows (date = close date)"""
+    client = get_supabase_client()
+    response = client.table('portfolio_snapshot_rollups')\
+        .select('period_start, close_date, open_value, high_value, low_value, close_value')\
+        .eq('user_id', user_id)\
+        .eq('resolution', resolution)\
+        .gte('close_date', cutoff_date)\
+        .order('period_start')\
+        .execute()
+    
+    return [
+        {
+            'date': row['close_date'],
+            'total_value': row['close_value'],
+            'open': row['open_value'],
+            'high': row['high_value'],
+            'low': row['low_value']
+        }
+        for row in response.data
+    ]
+
+def get_portfolio_value_history(user_id: str, days: int = 30, max_points: int = None, min_points: int = None):
+    """Get portfolio value history for charts with daily net change calculation
+
+    When max_points is given and the window holds more snapshots, the series is
+    downsampled with LTTB so long periods keep their shape at a fraction of the size.
+    With max_points or min_points set, long windows are read from the coarsest weekly/
+    monthly rollup that still provides that many points, falling back to daily rows.
+    """
     try:
         client = get_supabase_client()
         cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
         
-        # Get portfolio snapshots
-        response = client.table('portfolio_snapshots')\
-            .select('date, total_value')\
-            .eq('user_id', user_id)\
-            .gte('date', cutoff_date)\
-            .order('date')\
-            .execute()
-        
-        chart_data = response.data
+        needed_points = min_points or max_points
+        resolution = choose_snapshot_resolution(days, needed_points)
+        chart_data = None
+        if resolution != 'DAY':
+            try:
+                chart_data = get_snapshot_rollups(user_id, resolution, cutoff_date)
+            except Exception as e:
+                logger.warning(f"Could not read {resolution} rollups for user {user_id}: {e}")
+            # Short histories (or rollups not yet backfilled) are cheaper and more accurate as daily rows
+            if not chart_data or len(chart_data) < needed_points:
+                chart_data = None
+        
+        if chart_data is None:
+            resolution = 'DAY'
+            # Get portfolio snapshots
+            response = client.table('portfolio_snapshots')\
+                .select('date, total_value')\
+                .eq('user_id', user_id)\
+                .gte('date', cutoff_date)\
+                .order('date')\
+                .execute()
+            
+            chart_data = response.data
         
         # Calculate cumulative changes
         cumulative_changes = []
@@ -337,9 +751,18 @@ def get_portfolio_value_history(user_id: str, days: int = 30):
             }
             cumulative_changes.append(enhanced_data_point)
         
+        original_points = len(cumulative_changes)
+        if max_points and original_points > max_points:
+            day_numbers = np.array([p['date'] for p in cumulative_changes], dtype='datetime64[D]').astype(float)
+            values = [float(p['total_value']) for p in cumulative_changes]
+            keep = lttb_indices(day_numbers, values, max_points)
+            cumulative_changes = [cumulative_changes[i] for i in keep]
+        
         return {
             'chart_data': cumulative_changes,
-            'period_days': days
+            'period_days': days,
+            'resolution': resolution,
+            'original_points': original_points
         }
     except Exception as e:
         logger.error(f"Error getting portfolio value history: {e}")
@@ -347,4 +770,3 @@ def get_portfolio_value_history(user_id: str, days: int = 30):
             'chart_data': [],
             'period_days': days
         }
-
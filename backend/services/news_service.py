@@ -1,66 +1,299 @@
 """
 News service for fetching stock news using yfinance
+Formatted articles are cached per (symbol, tab) and shared by every user
 """
 
+import heapq
 import logging
+import threading
 import yfinance as yf
+from concurrent.futures import wait
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from utils.validators import validate_stock_symbol
+from utils.cache import TTLCache
+from utils.text_index import InvertedIndex
+from services.market_service import submit_market_fetch
+from services.holdings_service import get_user_symbols
+from services.watchlist_service import get_watchlist_symbols
 
 logger = logging.getLogger(__name__)
 
+# Entries younger than NEWS_FRESH_SECONDS are served as is; older ones are still served
+# but refreshed in the background, until NEWS_STALE_SECONDS when they must be refetched
+NEWS_FRESH_SECONDS = 300
+NEWS_STALE_SECONDS = 3600
+# Articles fetched per upstream call, so different `count`s share one entry
+NEWS_FETCH_COUNT = 20
+
+# Portfolio feed: at most this many upstream calls per request, uncached symbols first and
+# then background revalidation of stale ones; the rest warm up on later requests
+NEWS_FEED_UPSTREAM_BUDGET = 8
+NEWS_FEED_TIMEOUT = 5.0
+NEWS_FEED_MAX_PAGE_SIZE = 100
+
+# Every fetched article is indexed for local search; titles count double
+NEWS_INDEX_MAX_AGE_DAYS = 30
+NEWS_INDEX_MAX_ARTICLES = 50000
+NEWS_TITLE_WEIGHT = 2
+_news_index = InvertedIndex(max_age_seconds=NEWS_INDEX_MAX_AGE_DAYS * 86400, max_docs=NEWS_INDEX_MAX_ARTICLES)
+
+# (symbol, tab) -> {'articles', 'fetched_count', 'last_updated'}
+_news_cache = TTLCache(maxsize=512, ttl=NEWS_STALE_SECONDS)
+# (symbol, tab) -> [Lock, number of threads holding or waiting on it]
+_fetch_locks = {}
+_refreshing = set()
+_registry_lock = threading.Lock()
+
+def format_article(article: dict) -> dict:
+    """Flatten one yfinance news item into the API's article shape"""
+    # Extract content from the nested structure
+    content = article.get('content', {})
+
+    # Get the canonical URL for the link
+    canonical_url = content.get('canonicalUrl', {})
+    link = canonical_url.get('url', '') if canonical_url else ''
+
+    # Get provider information
+    provider = content.get('provider', {})
+    publisher = provider.get('displayName', '') if provider else ''
+
+    return {
+        'title': content.get('title', ''),
+        'summary': content.get('summary', ''),
+        'link': link,
+        'publisher': publisher,
+        'published': content.get('pubDate', ''),
+        'type': content.get('contentType', ''),
+        'uuid': content.get('id', '')
+    }
+
+def _published_timestamp(article: dict):
+    try:
+        return datetime.fromisoformat(article['published'].replace('Z', '+00:00')).timestamp()
+    except (AttributeError, KeyError, ValueError):
+        return None
+
+def index_articles(symbol: str, articles: list) -> int:
+    """Add articles to the search index under symbol; returns how many were new"""
+    added = 0
+    for article in articles:
+        doc_id = article.get('uuid') or article.get('link')
+        if not doc_id:
+            continue
+        added += _news_index.add(
+            doc_id,
+            [(article.get('title'), NEWS_TITLE_WEIGHT), (article.get('summary'), 1)],
+            tags=(symbol,),
+            timestamp=_published_timestamp(article),
+            payload=article
+        )
+    return added
+
+def fetch_news(symbol: str, count: int, tab: str) -> dict:
+    """Fetch and format news from yfinance (no caching); new articles are indexed"""
+    news_data = yf.Ticker(symbol).get_news(count=count, tab=tab)
+    articles = [format_article(article) for article in news_data]
+    index_articles(symbol, articles)
+    return {
+        'articles': articles,
+        'fetched_count': count,
+        'last_updated': datetime.now(timezone.utc).isoformat()
+    }
+
+@contextmanager
+def _fetch_lock(key):
+    """Hold the fetch lock for key; it is dropped once nobody holds or waits on it"""
+    with _registry_lock:
+        entry = _fetch_locks.get(key)
+        if entry is None:
+            entry = _fetch_locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _registry_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _fetch_locks[key]
+
+def _refresh(key, count: int):
+    try:
+        _news_cache.set(key, fetch_news(key[0], count, key[1]))
+    except Exception as e:
+        # Keep serving the stale entry; the next request past the fresh window retries
+        logger.warning(f"Background news refresh failed for {key}: {e}")
+    finally:
+        with _registry_lock:
+            _refreshing.discard(key)
+
+def _schedule_refresh(key, count: int):
+    """Refresh key in the background unless a refresh is already running"""
+    with _registry_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    submit_market_fetch(_refresh, key, count)
+
+def get_news_entry(symbol: str, tab: str, count: int):
+    """(entry, age_seconds) for (symbol, tab), fetching on a miss and revalidating when stale"""
+    key = (symbol, tab)
+    entry = _news_cache.get(key)
+    if entry is not None and count <= entry['fetched_count']:
+        age = _news_cache.age(key) or 0.0
+        if age > NEWS_FRESH_SECONDS:
+            _schedule_refresh(key, entry['fetched_count'])
+        return entry, age
+
+    # One upstream call per key however many requests miss at once
+    with _fetch_lock(key):
+        entry = _news_cache.get(key)
+        if entry is None or count > entry['fetched_count']:
+            entry = _news_cache.set(key, fetch_news(symbol, max(count, NEWS_FETCH_COUNT), tab))
+    return entry, _news_cache.age(key) or 0.0
+
+def merge_articles(article_lists: dict, limit: int):
+    """K-way merge of per-symbol article lists, newest first, de-duplicated by uuid
+
+    article_lists maps symbol -> articles. Stops after `limit` unique articles; each
+    returned article lists every symbol it was seen under up to that point.
+    Returns (articles, exhausted) where exhausted means nothing is left past `limit`.
+    """
+    streams = [
+        sorted(({**article, 'symbols': [symbol]} for article in articles),
+               key=lambda a: a.get('published') or '', reverse=True)
+        for symbol, articles in article_lists.items()
+    ]
+    merged = []
+    by_uuid = {}
+    for article in heapq.merge(*streams, key=lambda a: a.get('published') or '', reverse=True):
+        key = article.get('uuid') or article.get('link')
+        seen = by_uuid.get(key) if key else None
+        if seen is not None:
+            if article['symbols'][0] not in seen['symbols']:
+                seen['symbols'].append(article['symbols'][0])
+            continue
+        if len(merged) == limit:
+            return merged, False
+        merged.append(article)
+        if key:
+            by_uuid[key] = article
+    return merged, True
+
+def get_news_feed(user_id: str, page: int = 1, page_size: int = 20, tab: str = 'news',
+                  budget: int = NEWS_FEED_UPSTREAM_BUDGET, timeout: float = NEWS_FEED_TIMEOUT):
+    """One news feed across the user's holdings and watchlist, newest first
+
+    Cached symbols are served from the news cache; uncached ones are fetched
+    concurrently. `budget` caps the upstream calls one request can start: cold
+    symbols are fetched first, and whatever is left revalidates stale entries in the
+    background. Symbols over budget or past the deadline are listed so the client
+    knows the feed is partial.
+    """
+    if page < 1 or not 1 <= page_size <= NEWS_FEED_MAX_PAGE_SIZE:
+        raise ValueError(f"page must be at least 1 and page_size between 1 and {NEWS_FEED_MAX_PAGE_SIZE}")
+
+    symbols = list(dict.fromkeys(get_user_symbols(user_id) + get_watchlist_symbols(user_id)))
+    article_lists = {}
+    misses = []
+    stale = []
+    for symbol in symbols:
+        key = (symbol, tab)
+        entry = _news_cache.get(key)
+        if entry is None:
+            misses.append(symbol)
+            continue
+        article_lists[symbol] = entry['articles']
+        if (_news_cache.age(key) or 0.0) > NEWS_FRESH_SECONDS:
+            stale.append((symbol, entry['fetched_count']))
+
+    skipped = misses[budget:]
+    futures = {submit_market_fetch(get_news_entry, symbol, tab, NEWS_FETCH_COUNT): symbol for symbol in misses[:budget]}
+    revalidate = stale[:max(budget - len(futures), 0)]
+    for symbol, fetched_count in revalidate:
+        _schedule_refresh((symbol, tab), fetched_count)
+    done, not_done = wait(futures, timeout=timeout) if futures else (set(), set())
+    failed = []
+    for future in done:
+        try:
+            article_lists[futures[future]] = future.result()[0]['articles']
+        except Exception as e:
+            logger.warning(f"News feed fetch failed for {futures[future]}: {e}")
+            failed.append(futures[future])
+
+    offset = (page - 1) * page_size
+    merged, exhausted = merge_articles(article_lists, offset + page_size)
+    return {
+        'articles': merged[offset:],
+        'page': page,
+        'page_size': page_size,
+        'has_more': not exhausted,
+        'symbols': symbols,
+        'skipped_symbols': skipped,
+        'stale_symbols': [symbol for symbol, _ in stale[len(revalidate):]],
+        'pending_symbols': [futures[future] for future in not_done],
+        'failed_symbols': failed,
+        'tab': tab,
+        'last_updated': datetime.now(timezone.utc).isoformat()
+    }
+
+def search_news(query: str, symbols: list = None, limit: int = 20):
+    """Ranked search over already-fetched articles (never calls upstream)
+
+    `symbols` restricts results to articles fetched for any of those symbols.
+    """
+    if not query or not query.strip():
+        raise ValueError("Search query is required")
+    if not 1 <= limit <= NEWS_FEED_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {NEWS_FEED_MAX_PAGE_SIZE}")
+
+    results = _news_index.search(query, tags=symbols, limit=limit)
+    return {
+        'query': query,
+        'symbols': symbols,
+        'count': len(results),
+        'articles': [{**article, 'symbols': tags, 'score': round(score, 4)} for score, article, tags in results],
+        'indexed_articles': len(_news_index)
+    }
+
+def search_user_news(user_id: str, query: str, symbols: list = None, scope: str = 'portfolio', limit: int = 20):
+    """search_news over the user's holdings and watchlist, given symbols, or (scope='all') everything"""
+    if symbols:
+        symbols = [validate_stock_symbol(symbol) for symbol in symbols]
+    elif scope == 'portfolio':
+        symbols = list(dict.fromkeys(get_user_symbols(user_id) + get_watchlist_symbols(user_id)))
+    elif scope != 'all':
+        raise ValueError("scope must be 'portfolio' or 'all'")
+    return search_news(query, symbols, limit)
+
 def get_stock_news(symbol: str, count: int = 10, tab: str = 'news'):
     """
     Fetch news for a given stock symbol using yfinance.
-    
+
     Args:
         symbol (str): Stock symbol
         count (int): Number of news articles to fetch (default: 10)
         tab (str): News tab type - "news", "all", or "press releases" (default: "news")
-    
+
     Returns:
         dict: News data with articles list and metadata
     """
     try:
         symbol = validate_stock_symbol(symbol)
-        ticker = yf.Ticker(symbol)
-        
-        # Get news using yfinance
-        news_data = ticker.get_news(count=count, tab=tab)
-        
-        # Format the news data
-        formatted_news = []
-        for article in news_data:
-            # Extract content from the nested structure
-            content = article.get('content', {})
-            
-            # Get the canonical URL for the link
-            canonical_url = content.get('canonicalUrl', {})
-            link = canonical_url.get('url', '') if canonical_url else ''
-            
-            # Get provider information
-            provider = content.get('provider', {})
-            publisher = provider.get('displayName', '') if provider else ''
-            
-            formatted_article = {
-                'title': content.get('title', ''),
-                'summary': content.get('summary', ''),
-                'link': link,
-                'publisher': publisher,
-                'published': content.get('pubDate', ''),
-                'type': content.get('contentType', ''),
-                'uuid': content.get('id', '')
-            }
-            formatted_news.append(formatted_article)
-        
+        entry, age = get_news_entry(symbol, tab, count)
+        articles = entry['articles'][:count]
+
         return {
             'symbol': symbol,
-            'count': len(formatted_news),
+            'count': len(articles),
             'tab': tab,
-            'articles': formatted_news,
-            'last_updated': datetime.now(timezone.utc).isoformat()
+            'articles': articles,
+            'last_updated': entry['last_updated'],
+            'cache_age_seconds': round(age, 1)
         }
-        
+
     except Exception as e:
         logger.error(f"Error fetching news for {symbol}: {e}")
         return {
@@ -70,4 +303,4 @@ def get_stock_news(symbol: str, count: int = 10, tab: str = 'news'):
             'articles': [],
             'error': str(e),
             'last_updated': datetime.now(timezone.utc).isoformat()
-        } 
\ No newline at end of file
+        }
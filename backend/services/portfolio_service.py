@@ -6,8 +6,7 @@ CORRECTED: Works directly with user_id, no portfolios table needed
 import logging
 from utils.database import get_supabase_client
 from utils.validators import validate_required_field
-from services.holdings_service import get_user_holdings, calculate_portfolio_totals
-from services.analytics_service import calculate_portfolio_performance
+from services.holdings_service import get_portfolio_valuation
 
 logger = logging.getLogger(__name__)
 
@@ -62,14 +61,10 @@ def get_portfolio_details(user_id: str):
         # Get user portfolio info
         portfolio = get_user_portfolio(user_id)
         
-        # Get holdings with current market values
-        holdings = get_user_holdings(user_id)
-        
-        # Calculate portfolio totals
-        totals = calculate_portfolio_totals(user_id)
-        
-        # Calculate performance metrics
-        performance = calculate_portfolio_performance(user_id)
+        # Holdings with current market values and totals (cached per ledger version / price epoch)
+        valuation = get_portfolio_valuation(user_id)
+        holdings = valuation['holdings']
+        totals = valuation['totals']
         
         # Combine all data into a single, unified object
         return {
@@ -107,8 +102,9 @@ def update_portfolio(user_id: str, update_data: dict):
 def get_portfolio_summary(user_id: str):
     """Get a quick summary of portfolio key metrics"""
     try:
-        totals = calculate_portfolio_totals(user_id)
-        holdings = get_user_holdings(user_id)
+        valuation = get_portfolio_valuation(user_id)
+        totals = valuation['totals']
+        holdings = valuation['holdings']
         
         # Get top holdings by value
         stock_holdings = [h for h in holdings if h['symbol'] != 'CASH' and h['quantity'] > 0]
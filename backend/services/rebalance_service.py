@@ -0,0 +1,211 @@
+"""
+Target-allocation rebalancing calculator
+Pure in-memory: reads the current valuation, returns a trade list, never writes
+"""
+
+import logging
+import time
+import numpy as np
+from datetime import datetime, timezone
+from services.holdings_service import get_portfolio_valuation
+from services.market_service import get_cached_price
+from utils.validators import validate_stock_symbol
+
+logger = logging.getLogger(__name__)
+
+REBALANCE_TARGET_TYPES = ('symbol', 'sector')
+WEIGHT_TOLERANCE = 1e-6
+
+def parse_target_weights(targets: dict) -> dict:
+    """Validate {key: weight} with weights as fractions (0.25 = 25%) summing to at most 1; the rest is cash"""
+    if not targets or not isinstance(targets, dict):
+        raise ValueError("targets must be a non-empty object of weights")
+    try:
+        weights = {key: float(weight) for key, weight in targets.items()}
+    except (TypeError, ValueError):
+        raise ValueError("Target weights must be numbers")
+    if any(w < 0 for w in weights.values()):
+        raise ValueError("Target weights cannot be negative")
+
+    if sum(weights.values()) > 1 + WEIGHT_TOLERANCE:
+        raise ValueError("Target weights add up to more than 1 (100%)")
+    return weights
+
+def parse_lot_sizes(lot_size):
+    """A non-negative lot size, or {symbol: lot size} with normalised symbols; 0 means fractional shares"""
+    try:
+        if isinstance(lot_size, dict):
+            lot_sizes = {validate_stock_symbol(symbol): float(size) for symbol, size in lot_size.items()}
+        else:
+            lot_sizes = float(lot_size)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid lot_size: {e}")
+    sizes = lot_sizes.values() if isinstance(lot_sizes, dict) else [lot_sizes]
+    if any(size < 0 for size in sizes):
+        raise ValueError("Lot sizes cannot be negative (use 0 for fractional shares)")
+    return lot_sizes
+
+def expand_sector_targets(sector_weights: dict, symbols: list, sectors: list, values: np.ndarray) -> np.ndarray:
+    """Split each sector's target across its holdings pro rata to their current value
+
+    Holdings in sectors without a target get 0; a targeted sector with no value splits evenly.
+    Targets for sectors with no holdings are not placed (see unmatched_sector_targets).
+    """
+    sectors = np.array(sectors, dtype=object)
+    weights = np.zeros(len(symbols))
+    for sector, target in sector_weights.items():
+        members = sectors == sector
+        if not members.any():
+            continue
+        sector_value = values[members].sum()
+        share = values[members] / sector_value if sector_value > 0 else np.full(members.sum(), 1 / members.sum())
+        weights[members] = target * share
+    return weights
+
+def unmatched_sector_targets(sector_weights: dict, sectors: list) -> list:
+    """Targeted sectors that no current holding belongs to; their weight stays in cash"""
+    held = set(sectors)
+    return [sector for sector in sector_weights if sector not in held]
+
+def compute_rebalance(symbols: list, quantities: np.ndarray, prices: np.ndarray, cash: float,
+                      target_weights: np.ndarray, band: float = 0.0, lot_sizes: np.ndarray = None,
+                      min_cash: float = 0.0) -> dict:
+    """Trade quantities that move positions toward target weights
+
+    Positions whose weight is within `band` of target are left alone. Quantities are whole
+    multiples of each symbol's lot size, rounded toward zero so sells never exceed the
+    holding and buys never overshoot. Buys are scaled down if they would take cash below
+    min_cash after the sells settle.
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    lot_sizes = np.ones(len(symbols)) if lot_sizes is None else np.asarray(lot_sizes, dtype=float)
+    values = quantities * prices
+    total_value = values.sum() + cash
+
+    current_weights = values / total_value if total_value > 0 else np.zeros(len(symbols))
+    out_of_band = np.abs(current_weights - target_weights) > band
+    desired = np.where(out_of_band, target_weights * total_value - values, 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw_shares = np.where(prices > 0, desired / prices, 0.0)
+    # Fractional lots (lot size 0) keep six decimals like the holdings table
+    lots = np.where(lot_sizes > 0, lot_sizes, 1e-6)
+    shares = np.trunc(raw_shares / lots) * lots
+    shares = np.maximum(shares, -quantities)
+
+    sells = np.where(shares < 0, -shares * prices, 0.0).sum()
+    buy_amounts = np.where(shares > 0, shares * prices, 0.0)
+    available = cash + sells - min_cash
+    cash_limited = buy_amounts.sum() > available + 1e-9
+    if cash_limited:
+        scale = max(available, 0.0) / buy_amounts.sum()
+        shares = np.where(shares > 0, np.trunc(shares * scale / lots) * lots, shares)
+        buy_amounts = np.where(shares > 0, shares * prices, 0.0)
+
+    new_values = values + shares * prices
+    cash_after = cash + sells - buy_amounts.sum()
+    new_weights = new_values / total_value if total_value > 0 else np.zeros(len(symbols))
+    return {
+        'shares': shares,
+        'current_weights': current_weights,
+        'new_weights': new_weights,
+        'cash_after': cash_after,
+        'total_value': total_value,
+        'turnover': (sells + buy_amounts.sum()) / total_value if total_value > 0 else 0.0,
+        'cash_limited': bool(cash_limited)
+    }
+
+def calculate_rebalance(user_id: str, targets: dict, target_type: str = 'symbol', band_percent: float = 0.0,
+                        lot_size=1, min_cash: float = 0.0):
+    """Trade list that rebalances a user's current holdings to target weights (no writes)"""
+    if target_type not in REBALANCE_TARGET_TYPES:
+        raise ValueError(f"target_type must be one of {', '.join(REBALANCE_TARGET_TYPES)}")
+    if band_percent < 0 or min_cash < 0:
+        raise ValueError("band_percent and min_cash cannot be negative")
+    weights = parse_target_weights(targets)
+    lot_size = parse_lot_sizes(lot_size)
+
+    try:
+        started = time.perf_counter()
+        holdings = get_portfolio_valuation(user_id)['holdings']
+        cash = sum(h['quantity'] for h in holdings if h['symbol'] == 'CASH')
+        positions = [h for h in holdings if h['symbol'] != 'CASH' and h['quantity'] > 0]
+        symbols = [h['symbol'] for h in positions]
+        quantities = [h['quantity'] for h in positions]
+        prices = [h['current_price'] for h in positions]
+        sectors = [h.get('sector') or 'Unknown' for h in positions]
+        missing = []
+        unmatched = []
+
+        if target_type == 'symbol':
+            weights = {validate_stock_symbol(symbol): w for symbol, w in weights.items()}
+            # Targets for symbols not held yet need a price to size the buy
+            for symbol in weights:
+                if symbol in symbols or symbol == 'CASH':
+                    continue
+                price_data = get_cached_price(symbol)
+                price = float(price_data.get('current_price') or 0) if price_data else 0.0
+                if price <= 0:
+                    missing.append(symbol)
+                    continue
+                symbols.append(symbol)
+                quantities.append(0.0)
+                prices.append(price)
+                sectors.append(None)
+            target_weights = np.array([weights.get(symbol, 0.0) for symbol in symbols])
+        else:
+            target_weights = expand_sector_targets(weights, symbols, sectors, np.array(quantities) * np.array(prices))
+            unmatched = unmatched_sector_targets(weights, sectors)
+
+        if isinstance(lot_size, dict):
+            lot_sizes = np.array([lot_size.get(symbol, 1.0) for symbol in symbols])
+        else:
+            lot_sizes = np.full(len(symbols), lot_size)
+
+        result = compute_rebalance(
+            symbols, np.array(quantities), np.array(prices), cash, target_weights,
+            band_percent / 100, lot_sizes, min_cash
+        )
+
+        shares = result['shares']
+        trades = [
+            {
+                'symbol': symbol,
+                'action': 'BUY' if shares[i] > 0 else 'SELL',
+                'quantity': round(float(abs(shares[i])), 6),
+                'price': round(float(prices[i]), 4),
+                'amount': round(float(abs(shares[i]) * prices[i]), 2),
+                'current_weight_percent': round(float(result['current_weights'][i]) * 100, 2),
+                'target_weight_percent': round(float(target_weights[i]) * 100, 2),
+                'resulting_weight_percent': round(float(result['new_weights'][i]) * 100, 2)
+            }
+            for i, symbol in enumerate(symbols)
+            if shares[i] != 0
+        ]
+        # Sells first: they fund the buys
+        trades.sort(key=lambda t: (t['action'] != 'SELL', -t['amount']))
+
+        return {
+            'target_type': target_type,
+            'band_percent': band_percent,
+            'total_value': round(float(result['total_value']), 2),
+            'cash_before': round(float(cash), 2),
+            'cash_after': round(float(result['cash_after']), 2),
+            'target_cash_percent': round((1 - float(target_weights.sum())) * 100, 2),
+            'trades': trades,
+            'turnover_percent': round(float(result['turnover']) * 100, 2),
+            'max_remaining_drift_percent': round(
+                float(np.abs(result['new_weights'] - target_weights).max(initial=0)) * 100, 2
+            ),
+            'cash_limited': result['cash_limited'],
+            'missing_price_symbols': missing,
+            'unmatched_targets': unmatched,
+            'computation_ms': round((time.perf_counter() - started) * 1000, 3),
+            'calculated_at': datetime.now(timezone.utc).isoformat()
+        }
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Error calculating rebalance for user {user_id}: {e}")
+        raise Exception("Failed to calculate rebalance")
@@ -0,0 +1,196 @@
+"""
+Returns engine for portfolio performance
+Time-weighted (TWR) and money-weighted (XIRR) returns from snapshots and cash flows
+"""
+
+import logging
+import numpy as np
+from datetime import datetime, timezone
+from utils.database import get_supabase_client
+from utils.cache import TTLCache
+from services.market_service import get_portfolio_value_history
+
+logger = logging.getLogger(__name__)
+
+# (user_id, days, as_of_date) -> result; cleared per user on new snapshots and cash flows.
+# The nightly batch job writes snapshots from another process, so entries also expire
+RETURNS_CACHE_TTL_SECONDS = 900
+_returns_cache = TTLCache(maxsize=4096, ttl=RETURNS_CACHE_TTL_SECONDS)
+
+# Long windows may be read from weekly/monthly rollups as long as they keep this many points
+RETURNS_MIN_POINTS = 100
+
+# Starting rates for the Newton solver; all are iterated together and the best root wins
+XIRR_GUESSES = np.array([-0.9, -0.5, -0.1, 0.0, 0.1, 0.5, 1.0, 3.0])
+
+def get_cash_flows(user_id: str, start_date: str, end_date: str = None):
+    """Get external cash flows (DEPOSIT positive, WITHDRAWAL negative) after start_date"""
+    try:
+        client = get_supabase_client()
+        query = client.table('transactions')\
+            .select('transaction_type, total_amount, transaction_date')\
+            .eq('user_id', user_id)\
+            .in_('transaction_type', ['DEPOSIT', 'WITHDRAWAL'])\
+            .gte('transaction_date', start_date)
+        if end_date:
+            query = query.lte('transaction_date', f"{end_date}T23:59:59.999999+00:00")
+        response = query.order('transaction_date').execute()
+
+        flows = []
+        for tx in response.data:
+            amount = float(tx['total_amount'])
+            if tx['transaction_type'] == 'WITHDRAWAL':
+                amount = -amount
+            flows.append((tx['transaction_date'][:10], amount))
+        return flows
+    except Exception as e:
+        logger.error(f"Error fetching cash flows for user {user_id}: {e}")
+        raise Exception("Failed to fetch cash flows")
+
+def align_cash_flows(snapshot_dates: np.ndarray, flow_dates: np.ndarray, flow_amounts: np.ndarray) -> np.ndarray:
+    """Sum flows onto the first snapshot taken on or after each flow date
+
+    Flows on or before the first snapshot are already part of its value, and flows
+    after the last snapshot are not reflected in any value yet, so both are dropped.
+    """
+    aligned = np.zeros(len(snapshot_dates))
+    if len(flow_dates) == 0:
+        return aligned
+    idx = np.searchsorted(snapshot_dates, flow_dates, side='left')
+    in_window = (flow_dates > snapshot_dates[0]) & (idx < len(snapshot_dates))
+    np.add.at(aligned, idx[in_window], flow_amounts[in_window])
+    return aligned
+
+def time_weighted_return(values: np.ndarray, flows: np.ndarray) -> float:
+    """Chain-link sub-period returns, treating flows[i] as arriving just before values[i]
+
+    Sub-periods that start from a non-positive value have no defined return and are skipped.
+    """
+    values = np.asarray(values, dtype=float)
+    flows = np.asarray(flows, dtype=float)
+    if len(values) < 2:
+        return 0.0
+    return float(np.prod(1 + period_returns(values, flows)) - 1)
+
+def xirr(day_offsets: np.ndarray, amounts: np.ndarray, tol: float = 1e-9, max_iter: int = 100):
+    """Annual internal rate of return for dated cash flows (investor perspective)
+
+    Runs Newton's method from several starting rates at once as one (guesses x flows)
+    array operation per iteration. Returns None when the flows never change sign or no
+    starting rate converges.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    years = np.asarray(day_offsets, dtype=float) / 365.0
+    if not (np.any(amounts > 0) and np.any(amounts < 0)):
+        return None
+
+    scale = np.abs(amounts).sum()
+    rates = XIRR_GUESSES.copy()
+    converged = np.zeros(len(rates), dtype=bool)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            growth = 1 + rates[:, None]
+            discounted = amounts[None, :] * growth ** (-years[None, :])
+            npv = discounted.sum(axis=1)
+            derivative = (-years[None, :] * discounted / growth).sum(axis=1)
+
+            converged = np.isfinite(npv) & (np.abs(npv) < tol * scale)
+            if converged.all():
+                break
+            step = np.where(converged | (derivative == 0), 0.0, npv / derivative)
+            # Rates at or below -100% are undefined; pull the iterate back inside the domain
+            rates = np.maximum(rates - step, -0.999999)
+
+    candidates = rates[converged & np.isfinite(rates)]
+    if len(candidates) == 0:
+        return None
+    # Several guesses usually land on the same root; prefer the one closest to zero
+    return float(candidates[np.argmin(np.abs(candidates))])
+
+def get_flow_adjusted_series(user_id: str, days: int, min_points: int = None):
+    """Load snapshot dates/values with cash flows aligned to them
+
+    Returns (history, dates, values, aligned_flows, flow_count); arrays are empty when
+    there are no snapshots in the window. min_points lets long windows use rollups.
+    """
+    history = get_portfolio_value_history(user_id, days, min_points=min_points)['chart_data']
+    snapshot_dates = np.array([h['date'] for h in history], dtype='datetime64[D]')
+    values = np.array([float(h['total_value']) for h in history])
+    if len(history) < 2:
+        return history, snapshot_dates, values, np.zeros(len(history)), 0
+
+    # Only flows strictly after the first snapshot change the invested amount
+    first_flow_day = (snapshot_dates[0] + np.timedelta64(1, 'D')).astype(str)
+    flows = get_cash_flows(user_id, first_flow_day, str(snapshot_dates[-1]))
+    flow_dates = np.array([d for d, _ in flows], dtype='datetime64[D]')
+    flow_amounts = np.array([a for _, a in flows], dtype=float)
+    aligned_flows = align_cash_flows(snapshot_dates, flow_dates, flow_amounts)
+    return history, snapshot_dates, values, aligned_flows, len(flows)
+
+def period_returns(values: np.ndarray, flows: np.ndarray) -> np.ndarray:
+    """Flow-adjusted return of each sub-period (0 where the starting value is not positive)"""
+    start = values[:-1]
+    valid = start > 0
+    returns = np.zeros(len(start))
+    returns[valid] = (values[1:][valid] - flows[1:][valid]) / start[valid] - 1
+    return returns
+
+def calculate_returns(user_id: str, days: int = 30):
+    """Calculate time- and money-weighted returns over the last `days` of snapshots"""
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    cache_key = (user_id, days, today)
+    cached = _returns_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        history, snapshot_dates, values, aligned_flows, flow_count = get_flow_adjusted_series(user_id, days, RETURNS_MIN_POINTS)
+        if len(history) < 2:
+            return {
+                'period_days': days,
+                'insufficient_data': True,
+                'message': 'Need at least 2 portfolio snapshots for return calculations',
+                'calculated_at': datetime.now(timezone.utc).isoformat()
+            }
+
+        twr = time_weighted_return(values, aligned_flows)
+        span_days = int((snapshot_dates[-1] - snapshot_dates[0]).astype(int))
+
+        # Money-weighted: start value invested, deposits in, withdrawals out, end value returned
+        offsets = (snapshot_dates - snapshot_dates[0]).astype(float)
+        mwr_amounts = -aligned_flows
+        mwr_amounts[0] -= values[0]
+        mwr_amounts[-1] += values[-1]
+        nonzero = mwr_amounts != 0
+        mwr = xirr(offsets[nonzero], mwr_amounts[nonzero])
+
+        result = {
+            'period_days': days,
+            'start_date': history[0]['date'],
+            'end_date': history[-1]['date'],
+            'start_value': round(float(values[0]), 2),
+            'end_value': round(float(values[-1]), 2),
+            'net_cash_flow': round(float(aligned_flows.sum()), 2),
+            'time_weighted_return_percent': round(twr * 100, 2),
+            'time_weighted_return_annualized_percent': (
+                round(((1 + twr) ** (365.0 / span_days) - 1) * 100, 2) if span_days >= 365 else None
+            ),
+            'money_weighted_return_percent': (
+                round(((1 + mwr) ** (span_days / 365.0) - 1) * 100, 2) if mwr is not None else None
+            ),
+            'money_weighted_return_annualized_percent': round(mwr * 100, 2) if mwr is not None else None,
+            'snapshots_count': len(history),
+            'cash_flows_count': flow_count,
+            'calculated_at': datetime.now(timezone.utc).isoformat()
+        }
+        return _returns_cache.set(cache_key, result)
+    except Exception as e:
+        logger.error(f"Error calculating returns for user {user_id}: {e}")
+        raise Exception("Failed to calculate returns")
+
+def invalidate_returns_cache(user_id: str = None):
+    """Forget cached returns for a user (call after new snapshots or cash flows; None clears every user)"""
+    if user_id is None:
+        _returns_cache.clear()
+    else:
+        _returns_cache.invalidate_user(user_id)
@@ -0,0 +1,155 @@
+"""
+Risk analytics for portfolio snapshots
+Volatility, Sharpe/Sortino, drawdown, rolling volatility and beta, vectorized with NumPy
+"""
+
+import logging
+import time
+import numpy as np
+from datetime import datetime, timezone
+from utils.cache import TTLCache
+from services.returns_service import get_flow_adjusted_series, period_returns
+from services.market_service import get_benchmark_history, align_closes
+
+logger = logging.getLogger(__name__)
+
+# Long windows may be read from weekly/monthly rollups as long as they keep this many returns
+RISK_MIN_POINTS = 250
+
+# (user_id, days, benchmark, risk_free_rate, window, as_of_date) -> metrics; cleared per user on new
+# snapshots, and expiring for those the nightly batch job writes from another process
+RISK_CACHE_TTL_SECONDS = 900
+_risk_cache = TTLCache(maxsize=2048, ttl=RISK_CACHE_TTL_SECONDS)
+
+def annualization_factor(dates: np.ndarray) -> float:
+    """Periods per year implied by the average spacing of the series (365 for daily snapshots)"""
+    if len(dates) < 2:
+        return 365.0
+    mean_gap = float(np.diff(dates).astype(float).mean())
+    return 365.25 / mean_gap if mean_gap > 0 else 365.0
+
+def max_drawdown(dates: np.ndarray, wealth: np.ndarray) -> dict:
+    """Largest peak-to-trough decline of a wealth index, with the dates it started and bottomed"""
+    running_peak = np.maximum.accumulate(wealth)
+    drawdowns = wealth / running_peak - 1
+    trough = int(np.argmin(drawdowns))
+    peak = int(np.argmax(wealth[:trough + 1]))
+
+    # Recovery is the first point after the trough back at (or above) the old peak
+    recovered = np.nonzero(wealth[trough:] >= wealth[peak])[0]
+    recovery = trough + int(recovered[0]) if drawdowns[trough] < 0 and len(recovered) else None
+    return {
+        'max_drawdown_percent': round(float(drawdowns[trough]) * 100, 2),
+        'peak_date': str(dates[peak]),
+        'trough_date': str(dates[trough]),
+        'recovery_date': str(dates[recovery]) if recovery is not None else None
+    }
+
+def rolling_volatility(returns: np.ndarray, window: int, periods_per_year: float) -> np.ndarray:
+    """Annualized sample volatility over each trailing window (O(n) via cumulative sums)"""
+    if window < 2 or len(returns) < window:
+        return np.array([])
+    padded = np.concatenate(([0.0], returns))
+    sums = np.cumsum(padded)
+    sums_sq = np.cumsum(padded ** 2)
+    window_sum = sums[window:] - sums[:-window]
+    window_sum_sq = sums_sq[window:] - sums_sq[:-window]
+    variance = (window_sum_sq - window_sum ** 2 / window) / (window - 1)
+    return np.sqrt(np.clip(variance, 0, None) * periods_per_year)
+
+def compute_risk_metrics(dates: np.ndarray, values: np.ndarray, flows: np.ndarray,
+                         benchmark_closes: np.ndarray = None, risk_free_rate: float = 0.0,
+                         window: int = 21) -> dict:
+    """Compute risk metrics for a snapshot series; all inputs are aligned arrays"""
+    returns = period_returns(values, flows)
+    periods_per_year = annualization_factor(dates)
+    rf_per_period = (1 + risk_free_rate) ** (1 / periods_per_year) - 1
+    excess = returns - rf_per_period
+
+    volatility = float(returns.std(ddof=1)) if len(returns) > 1 else 0.0
+    downside = float(np.sqrt(np.mean(np.minimum(excess, 0) ** 2)))
+    mean_excess = float(excess.mean())
+    sqrt_ppy = np.sqrt(periods_per_year)
+
+    wealth = np.concatenate(([1.0], np.cumprod(1 + returns)))
+    rolling = rolling_volatility(returns, window, periods_per_year)
+
+    metrics = {
+        'observations': int(len(returns)),
+        'periods_per_year': round(periods_per_year, 2),
+        'annualized_return_percent': round(float(wealth[-1] ** (periods_per_year / len(returns)) - 1) * 100, 2),
+        'annualized_volatility_percent': round(volatility * sqrt_ppy * 100, 2),
+        'sharpe_ratio': round(mean_excess / volatility * sqrt_ppy, 3) if volatility > 0 else None,
+        'sortino_ratio': round(mean_excess / downside * sqrt_ppy, 3) if downside > 0 else None,
+        'max_drawdown': max_drawdown(dates, wealth),
+        'rolling_volatility': {
+            'window': window,
+            'dates': [str(d) for d in dates[window:]] if len(rolling) else [],
+            'values': [round(float(v) * 100, 2) for v in rolling]
+        },
+        'beta': None,
+        'correlation': None
+    }
+
+    if benchmark_closes is not None:
+        benchmark_returns = benchmark_closes[1:] / benchmark_closes[:-1] - 1
+        usable = np.isfinite(benchmark_returns)
+        if usable.sum() > 2:
+            p, b = returns[usable], benchmark_returns[usable]
+            covariance = np.cov(p, b, ddof=1)
+            if covariance[1, 1] > 0:
+                metrics['beta'] = round(float(covariance[0, 1] / covariance[1, 1]), 3)
+            if covariance[0, 0] > 0 and covariance[1, 1] > 0:
+                metrics['correlation'] = round(float(covariance[0, 1] / np.sqrt(covariance[0, 0] * covariance[1, 1])), 3)
+
+    return metrics
+
+def calculate_risk_metrics(user_id: str, days: int = 365, benchmark: str = 'SPY',
+                           risk_free_rate: float = 0.0, window: int = 21):
+    """Calculate risk metrics for a user's snapshot history, memoized until the next snapshot"""
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    cache_key = (user_id, days, benchmark, risk_free_rate, window, today)
+    cached = _risk_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        history, dates, values, flows, _ = get_flow_adjusted_series(user_id, days, RISK_MIN_POINTS)
+        if len(history) < 3:
+            return {
+                'period_days': days,
+                'insufficient_data': True,
+                'message': 'Need at least 3 portfolio snapshots for risk analysis',
+                'calculated_at': datetime.now(timezone.utc).isoformat()
+            }
+
+        benchmark_closes = None
+        if benchmark:
+            benchmark_dates, closes = get_benchmark_history(benchmark)
+            benchmark_closes = align_closes(dates, benchmark_dates, closes)
+
+        started = time.perf_counter()
+        metrics = compute_risk_metrics(dates, values, flows, benchmark_closes, risk_free_rate, window)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        result = {
+            'period_days': days,
+            'start_date': history[0]['date'],
+            'end_date': history[-1]['date'],
+            'benchmark': benchmark or None,
+            'risk_free_rate': risk_free_rate,
+            **metrics,
+            'computation_ms': round(elapsed_ms, 3),
+            'calculated_at': datetime.now(timezone.utc).isoformat()
+        }
+        return _risk_cache.set(cache_key, result)
+    except Exception as e:
+        logger.error(f"Error calculating risk metrics for user {user_id}: {e}")
+        raise Exception("Failed to calculate risk metrics")
+
+def invalidate_risk_cache(user_id: str = None):
+    """Forget memoized risk metrics for a user (call after new snapshots or cash flows; None clears every user)"""
+    if user_id is None:
+        _risk_cache.clear()
+    else:
+        _risk_cache.invalidate_user(user_id)
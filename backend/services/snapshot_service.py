@@ -0,0 +1,140 @@
+"""
+Batch portfolio snapshot service
+Values every user's holdings against one price set and bulk-writes daily snapshots
+"""
+
+import logging
+import time
+import numpy as np
+from datetime import datetime, timezone
+from utils.database import get_supabase_client, fetch_all_rows
+from services.market_service import update_snapshot_rollups_bulk
+
+logger = logging.getLogger(__name__)
+
+# portfolio_snapshots.source of rows this job writes; API snapshots keep the default 'api'
+SNAPSHOT_SOURCE = 'batch'
+
+def load_price_map():
+    """Load every cached price once so all users are valued against the same prices"""
+    client = get_supabase_client()
+    rows = fetch_all_rows(lambda: client.table('market_prices').select('symbol, current_price').order('symbol'))
+    prices = {row['symbol']: float(row['current_price']) for row in rows if row.get('current_price') is not None}
+    prices['CASH'] = 1.0
+    return prices
+
+def load_all_holdings():
+    """Load (user_id, symbol, quantity) for every holding row"""
+    client = get_supabase_client()
+    return fetch_all_rows(
+        lambda: client.table('holdings').select('user_id, symbol, quantity').order('id')
+    )
+
+def get_snapshotted_users(snapshot_date: str):
+    """Users this job already snapshotted for snapshot_date (used to resume a partial run)
+
+    Snapshots taken through the API that day don't count, so the end-of-day value still
+    replaces them.
+    """
+    client = get_supabase_client()
+    rows = fetch_all_rows(
+        lambda: client.table('portfolio_snapshots')
+        .select('user_id')
+        .eq('date', snapshot_date)
+        .eq('source', SNAPSHOT_SOURCE)
+        .order('user_id')
+    )
+    return {row['user_id'] for row in rows}
+
+def value_holdings(holdings: list, prices: dict):
+    """Total market value per user, grouped with NumPy
+
+    Returns (user_ids, totals, missing_symbols); positions without a cached price
+    are valued at 0 and reported in missing_symbols.
+    """
+    if not holdings:
+        return np.array([]), np.array([]), []
+
+    users = np.array([h['user_id'] for h in holdings])
+    symbols = np.array([h['symbol'] for h in holdings])
+    quantities = np.array([float(h['quantity']) for h in holdings])
+
+    # Look each distinct symbol up once, then broadcast back to the rows
+    unique_symbols, symbol_index = np.unique(symbols, return_inverse=True)
+    symbol_prices = np.array([prices.get(s, np.nan) for s in unique_symbols])
+    missing = unique_symbols[np.isnan(symbol_prices)].tolist()
+    row_values = quantities * np.nan_to_num(symbol_prices)[symbol_index]
+
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    totals = np.bincount(user_index, weights=row_values, minlength=len(user_ids))
+    return user_ids, totals, missing
+
+def run_batch_snapshot(snapshot_date: str = None, chunk_size: int = 500, resume: bool = True):
+    """Snapshot every user with holdings for snapshot_date using chunked bulk upserts
+
+    Safe to re-run after a partial failure: with resume=True users this job already
+    snapshotted for the date are skipped, and failed chunks are reported so the next run
+    picks them up. This runs outside the web server, whose returns and risk caches pick
+    the new snapshots up when their entries expire.
+    """
+    started = time.perf_counter()
+    snapshot_date = snapshot_date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    client = get_supabase_client()
+
+    prices = load_price_map()
+    holdings = load_all_holdings()
+    user_ids, totals, missing_symbols = value_holdings(holdings, prices)
+    loaded = time.perf_counter()
+
+    done = get_snapshotted_users(snapshot_date) if resume else set()
+    pending = [(user_id, float(total)) for user_id, total in zip(user_ids.tolist(), totals.tolist())
+               if user_id not in done]
+
+    written = 0
+    failed_users = []
+    created_at = datetime.now(timezone.utc).isoformat()
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        try:
+            client.table('portfolio_snapshots').upsert([
+                {
+                    'user_id': user_id,
+                    'date': snapshot_date,
+                    'total_value': round(total, 4),
+                    'source': SNAPSHOT_SOURCE,
+                    'created_at': created_at
+                }
+                for user_id, total in chunk
+            ], on_conflict='user_id,date').execute()
+            written += len(chunk)
+        except Exception as e:
+            logger.error(f"Error writing snapshot chunk starting at {start}: {e}")
+            failed_users.extend(user_id for user_id, _ in chunk)
+            continue
+
+        try:
+            update_snapshot_rollups_bulk(snapshot_date, dict(chunk))
+        except Exception as e:
+            # Daily rows are written; rollups can be rebuilt from them
+            logger.warning(f"Could not update rollups for snapshot chunk starting at {start}: {e}")
+
+    elapsed = time.perf_counter() - started
+    report = {
+        'date': snapshot_date,
+        'users_valued': len(user_ids),
+        'holdings_loaded': len(holdings),
+        'prices_loaded': len(prices),
+        'missing_price_symbols': missing_symbols,
+        'skipped_existing': len(user_ids) - len(pending),
+        'snapshots_written': written,
+        'failed_users': failed_users,
+        'load_seconds': round(loaded - started, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'snapshots_per_second': round(written / elapsed, 1) if elapsed > 0 else None
+    }
+    logger.info(
+        f"Batch snapshot {snapshot_date}: wrote {written}/{len(pending)} pending "
+        f"({report['skipped_existing']} already done, {len(failed_users)} failed) "
+        f"in {report['elapsed_seconds']}s ({report['snapshots_per_second']}/s)"
+    )
+    return report
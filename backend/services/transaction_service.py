@@ -11,9 +11,32 @@ from utils.validators import (
     validate_stock_symbol, validate_positive_number, 
     validate_transaction_type, validate_required_field
 )
+from utils.locks import serialized_per_user
+from services.returns_service import invalidate_returns_cache
+from services.risk_service import invalidate_risk_cache
+from utils.versions import bump_user_version
 
 logger = logging.getLogger(__name__)
 
+def check_sufficient_cash(available_cash: Decimal, quantity: Decimal, price: Decimal):
+    """Raise ValueError if buying quantity at price needs more than available_cash"""
+    required_cash = quantity * price
+    
+    if required_cash > available_cash:
+        raise ValueError(f"Insufficient cash. Available: ${available_cash:.2f}, Required: ${required_cash:.2f}")
+    
+    return True
+
+def check_sufficient_shares(symbol: str, owned_quantity: Decimal, quantity: Decimal):
+    """Raise ValueError if selling quantity exceeds owned_quantity"""
+    if owned_quantity <= 0:
+        raise ValueError(f"You don't own any shares of {symbol}")
+    
+    if quantity > owned_quantity:
+        raise ValueError(f"Insufficient shares. Owned: {owned_quantity}, Trying to sell: {quantity}")
+    
+    return True
+
 def validate_buy_transaction(user_id: str, quantity: Decimal, price: Decimal):
     """Validate buy transaction - ensure user has sufficient cash"""
     try:
@@ -28,12 +51,7 @@ def validate_buy_transaction(user_id: str, quantity: Decimal, price: Decimal):
             .execute()
         
         available_cash = Decimal(str(cash_holding.data['quantity'])) if cash_holding.data else Decimal('0')
-        required_cash = quantity * price
-        
-        if required_cash > available_cash:
-            raise ValueError(f"Insufficient cash. Available: ${available_cash:.2f}, Required: ${required_cash:.2f}")
-        
-        return True
+        return check_sufficient_cash(available_cash, quantity, price)
     except ValueError as e:
         raise e
     except Exception as e:
@@ -57,14 +75,7 @@ def validate_sell_transaction(user_id: str, symbol: str, quantity: Decimal):
             raise ValueError(f"You don't own any shares of {symbol}")
         
         owned_quantity = Decimal(str(holding.data['quantity']))
-        
-        if owned_quantity <= 0:
-            raise ValueError(f"You don't own any shares of {symbol}")
-        
-        if quantity > owned_quantity:
-            raise ValueError(f"Insufficient shares. Owned: {owned_quantity}, Trying to sell: {quantity}")
-        
-        return True
+        return check_sufficient_shares(symbol, owned_quantity, quantity)
     except ValueError as e:
         raise e
     except Exception as e:
@@ -107,6 +118,7 @@ def get_transaction_by_id(user_id: str, transaction_id: str):
         logger.error(f"Error fetching transaction: {e}")
         raise e
 
+@serialized_per_user
 def process_buy_transaction(user_id: str, symbol: str, quantity: Decimal, price: Decimal, transaction_date: str = None, notes: str = None):
     """Process a BUY transaction using USER INPUT data only - no yfinance calls"""
     try:
@@ -140,6 +152,7 @@ def process_buy_transaction(user_id: str, symbol: str, quantity: Decimal, price:
         transaction = create_transaction_record(
             user_id, symbol, 'BUY', quantity, price, total_amount, date, notes
         )
+        bump_user_version(user_id)
         
         return transaction
     except ValueError as e:
@@ -149,6 +162,7 @@ def process_buy_transaction(user_id: str, symbol: str, quantity: Decimal, price:
         logger.error(f"Error processing buy transaction: {e}")
         raise Exception("Failed to process buy transaction")
 
+@serialized_per_user
 def process_sell_transaction(user_id: str, symbol: str, quantity: Decimal, price: Decimal, transaction_date: str = None, notes: str = None):
     """Process a SELL transaction using USER INPUT data only - no yfinance calls"""
     try:
@@ -185,6 +199,7 @@ def process_sell_transaction(user_id: str, symbol: str, quantity: Decimal, price
         transaction = create_transaction_record(
             user_id, symbol, 'SELL', quantity, price, total_amount, date, notes, realized_gain_loss
         )
+        bump_user_version(user_id)
         
         return transaction
     except ValueError as e:
@@ -194,6 +209,7 @@ def process_sell_transaction(user_id: str, symbol: str, quantity: Decimal, price
         logger.error(f"Error processing sell transaction: {e}")
         raise Exception("Failed to process sell transaction")
 
+@serialized_per_user
 def process_cash_deposit(user_id: str, amount: Decimal, transaction_date: str = None, notes: str = None):
     """Process a cash deposit using USER INPUT data"""
     try:
@@ -214,6 +230,11 @@ def process_cash_deposit(user_id: str, amount: Decimal, transaction_date: str =
             user_id, 'CASH', 'DEPOSIT', amount, Decimal('1'), amount, date, notes
         )
         
+        # External cash flows change flow-adjusted returns and risk metrics
+        invalidate_returns_cache(user_id)
+        invalidate_risk_cache(user_id)
+        bump_user_version(user_id)
+        
         return transaction
     except ValueError as e:
         logger.error(f"Validation error in cash deposit: {e}")
@@ -222,6 +243,7 @@ def process_cash_deposit(user_id: str, amount: Decimal, transaction_date: str =
         logger.error(f"Error processing cash deposit: {e}")
         raise Exception("Failed to process cash deposit")
 
+@serialized_per_user
 def process_cash_withdrawal(user_id: str, amount: Decimal, transaction_date: str = None, notes: str = None):
     """Process a cash withdrawal using USER INPUT data"""
     try:
@@ -242,6 +264,11 @@ def process_cash_withdrawal(user_id: str, amount: Decimal, transaction_date: str
             user_id, 'CASH', 'WITHDRAWAL', amount, Decimal('1'), amount, date, notes
         )
         
+        # External cash flows change flow-adjusted returns and risk metrics
+        invalidate_returns_cache(user_id)
+        invalidate_risk_cache(user_id)
+        bump_user_version(user_id)
+        
         return transaction
     except ValueError as e:
         logger.error(f"Validation error in cash withdrawal: {e}")
@@ -251,7 +278,11 @@ def process_cash_withdrawal(user_id: str, amount: Decimal, transaction_date: str
         raise Exception("Failed to process cash withdrawal")
 
 def process_transaction(user_id: str, transaction_data: dict):
-    """Main transaction processing function - ONLY uses user input data"""
+    """Main transaction processing function - ONLY uses user input data
+
+    Each process_* path holds the user's write lock, so concurrent trades for the
+    same user are applied one after another while other users proceed in parallel.
+    """
     try:
         transaction_type = validate_transaction_type(transaction_data.get('transaction_type'))
         
@@ -297,6 +328,10 @@ def process_transaction(user_id: str, transaction_data: dict):
         logger.error(f"Error processing transaction: {e}")
         raise Exception("Failed to process transaction")
 
+def average_cost_after_buy(current_qty: Decimal, current_avg: Decimal, quantity: Decimal, price: Decimal) -> Decimal:
+    """Weighted average cost after adding quantity at price"""
+    return ((current_qty * current_avg) + (quantity * price)) / (current_qty + quantity)
+
 # Helper functions for database operations
 def update_holding_for_buy(user_id: str, symbol: str, quantity: Decimal, price: Decimal):
     """Update holdings for buy transaction using USER'S actual cost basis"""
@@ -316,7 +351,7 @@ def update_holding_for_buy(user_id: str, symbol: str, quantity: Decimal, price:
             current_avg = Decimal(str(existing.data[0]['average_cost']))
             
             new_qty = current_qty + quantity
-            new_avg = ((current_qty * current_avg) + (quantity * price)) / new_qty
+            new_avg = average_cost_after_buy(current_qty, current_avg, quantity, price)
             
             # Update existing holding
             client.table('holdings')\
@@ -493,48 +528,54 @@ def get_user_holding_quantity(user_id: str, symbol: str):
         return 0.0
 
 
+def get_buy_lots(user_id: str, symbol: str):
+    """All BUY transactions for the symbol, oldest first (the FIFO lots)"""
+    client = get_supabase_client()
+    buy_transactions = client.table('transactions')\
+        .select('quantity', 'price', 'transaction_date')\
+        .eq('user_id', user_id)\
+        .eq('symbol', symbol)\
+        .eq('transaction_type', 'BUY')\
+        .order('transaction_date', desc=False)\
+        .execute()
+    return buy_transactions.data or []
+
 def calculate_realized_gain_loss(user_id: str, symbol: str, sell_quantity: Decimal, sell_price: Decimal):
     """Calculate realized gain/loss for a sell transaction using FIFO"""
     try:
-        client = get_supabase_client()
-        
-        # Get all BUY transactions for the symbol, oldest first
-        buy_transactions = client.table('transactions')\
-            .select('quantity', 'price', 'transaction_date')\
-            .eq('user_id', user_id)\
-            .eq('symbol', symbol)\
-            .eq('transaction_type', 'BUY')\
-            .order('transaction_date', desc=False)\
-            .execute()
-
-        if not buy_transactions.data:
+        buy_lots = get_buy_lots(user_id, symbol)
+        if not buy_lots:
             return Decimal('0')
 
-        realized_gain_loss = Decimal('0')
-        remaining_sell_quantity = sell_quantity
-        
-        # Use a copy of the data to manipulate
-        buy_data = list(buy_transactions.data)
-
-        for buy_tx in buy_data:
-            if remaining_sell_quantity <= 0:
-                break
-
-            buy_qty = Decimal(str(buy_tx['quantity']))
-            buy_price = Decimal(str(buy_tx['price']))
-            
-            # Quantity to be sold from this buy transaction
-            qty_to_sell = min(remaining_sell_quantity, buy_qty)
-            
-            # Calculate gain/loss for this portion
-            gain_loss = (sell_price - buy_price) * qty_to_sell
-            realized_gain_loss += gain_loss
-            
-            # Update remaining quantities
-            remaining_sell_quantity -= qty_to_sell
-            buy_tx['quantity'] = str(buy_qty - qty_to_sell) # Update the copy
-
+        realized_gain_loss, _ = fifo_realized_gain_loss(buy_lots, sell_quantity, sell_price)
         return realized_gain_loss
     except Exception as e:
         logger.error(f"Error calculating realized gain/loss: {e}")
-        raise Exception("Failed to calculate realized gain/loss") 
\ No newline at end of file
+        raise Exception("Failed to calculate realized gain/loss") 
+
+def fifo_realized_gain_loss(buy_lots: list, sell_quantity: Decimal, sell_price: Decimal):
+    """Match a sale against buy lots oldest first
+
+    buy_lots are {'quantity', 'price'} dicts in date order. Returns (realized_gain_loss,
+    remaining_lots) where remaining_lots is a new list with the sold quantity taken out.
+    """
+    realized_gain_loss = Decimal('0')
+    remaining_sell_quantity = sell_quantity
+    remaining_lots = []
+
+    for buy_tx in buy_lots:
+        buy_qty = Decimal(str(buy_tx['quantity']))
+        buy_price = Decimal(str(buy_tx['price']))
+        
+        # Quantity to be sold from this buy transaction
+        qty_to_sell = min(remaining_sell_quantity, buy_qty) if remaining_sell_quantity > 0 else Decimal('0')
+        
+        # Calculate gain/loss for this portion
+        realized_gain_loss += (sell_price - buy_price) * qty_to_sell
+        
+        # Update remaining quantities
+        remaining_sell_quantity -= qty_to_sell
+        if buy_qty - qty_to_sell > 0:
+            remaining_lots.append({**buy_tx, 'quantity': str(buy_qty - qty_to_sell)})
+
+    return realized_gain_loss, remaining_lots
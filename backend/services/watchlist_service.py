@@ -1,42 +1,207 @@
 import logging
+import time
 import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor, wait
 from utils.database import get_supabase_client
+from utils.cache import TTLCache
+from utils.validators import validate_stock_symbol
+from utils.versions import bump_watchlist_version
+from services.market_service import get_cached_prices, is_quote_stale, refresh_prices, submit_market_fetch
 
 logger = logging.getLogger(__name__)
 
-def get_watchlist(user_id):
-    """Fetches the user's watchlist with detailed ticker information."""
+# Row fields by where they come from: market_prices, the profile cache, the detail cache
+QUOTE_FIELDS = ('symbol', 'name', 'current_price', 'previousClose', 'day_change', 'day_change_percent',
+                'last_updated', 'stale')
+PROFILE_FIELDS = ('open', 'high', 'low', 'marketCap', 'fiftyTwoWeekHigh', 'fiftyTwoWeekLow')
+DETAIL_FIELDS = ('recommendations', 'sector', 'industry', 'trailingPE', 'forwardPE', 'dividendYield',
+                 'beta', 'averageVolume', 'description')
+# Live quote fields; stale quotes are only refreshed when one of these is requested
+PRICE_FIELDS = ('current_price', 'previousClose', 'day_change', 'day_change_percent')
+
+# Day and 52-week range and market cap move slowly; recommendations and fundamentals slower still
+PROFILE_TTL_SECONDS = 3600
+DETAIL_TTL_SECONDS = 6 * 3600
+_profile_cache = TTLCache(maxsize=1024, ttl=PROFILE_TTL_SECONDS)
+_detail_cache = TTLCache(maxsize=256, ttl=DETAIL_TTL_SECONDS)
+# Longest a watchlist read waits on yfinance before answering with what it has
+WATCHLIST_FETCH_TIMEOUT = 3.0
+# Bulk imports wait longer: every unknown symbol has to be checked before it is added
+BULK_VALIDATION_TIMEOUT = 20.0
+MAX_BULK_SYMBOLS = 200
+# Bulk validation gets its own small pool so an import can't starve the shared quote pool
+_validation_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='bulk-validate')
+
+def parse_fields(fields, default=QUOTE_FIELDS) -> tuple:
+    """Validate a `fields=` projection ("a,b,c" or a list); 'symbol' is always included"""
+    if not fields:
+        return tuple(default)
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    requested = [field.strip() for field in fields if field.strip()]
+    allowed = QUOTE_FIELDS + PROFILE_FIELDS + DETAIL_FIELDS
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(allowed)}")
+    return ('symbol',) + tuple(dict.fromkeys(field for field in requested if field != 'symbol'))
+
+def _profile_from_info(info: dict) -> dict:
+    return {
+        'name': info.get('longName'),
+        'open': info.get('open'),
+        'high': info.get('dayHigh'),
+        'low': info.get('dayLow'),
+        'marketCap': info.get('marketCap'),
+        'fiftyTwoWeekHigh': info.get('fiftyTwoWeekHigh'),
+        'fiftyTwoWeekLow': info.get('fiftyTwoWeekLow')
+    }
+
+def fetch_symbol_profile(symbol: str):
+    """Ticker details from yfinance that don't need to be quote-fresh"""
+    return _profile_from_info(yf.Ticker(symbol).info)
+
+def fetch_symbol_detail(symbol: str):
+    """Analyst recommendations and fundamentals, fetched only when a row is expanded"""
+    ticker = yf.Ticker(symbol)
+    info = ticker.info
+    recommendations = getattr(ticker, 'recommendations', None)
+    # The same info call carries the profile; keep that cache warm too
+    _profile_cache.set(symbol, _profile_from_info(info))
+    return {
+        'recommendations': recommendations.to_dict('records') if recommendations is not None else [],
+        'sector': info.get('sector'),
+        'industry': info.get('industry'),
+        'trailingPE': info.get('trailingPE'),
+        'forwardPE': info.get('forwardPE'),
+        'dividendYield': info.get('dividendYield'),
+        'beta': info.get('beta'),
+        'averageVolume': info.get('averageVolume'),
+        'description': info.get('longBusinessSummary')
+    }
+
+def _load_profile(symbol: str):
+    try:
+        return _profile_cache.set(symbol, fetch_symbol_profile(symbol))
+    except Exception as e:
+        logger.error(f"Error fetching profile for {symbol}: {e}")
+        return None
+
+def _load_detail(symbol: str):
+    try:
+        return _detail_cache.set(symbol, fetch_symbol_detail(symbol))
+    except Exception as e:
+        logger.error(f"Error fetching detail for {symbol}: {e}")
+        return None
+
+def _start_loads(cache: TTLCache, load, symbols: list):
+    """Cached entries plus {future: symbol} for the ones being fetched"""
+    results = {}
+    futures = {}
+    for symbol in symbols:
+        entry = cache.get(symbol)
+        if entry is None:
+            futures[submit_market_fetch(load, symbol)] = symbol
+        else:
+            results[symbol] = entry
+    return results, futures
+
+def _collect(results: dict, futures: dict, timeout: float) -> dict:
+    done, _ = wait(futures, timeout=max(timeout, 0))
+    for future in done:
+        entry = future.result()
+        if entry:
+            results[futures[future]] = entry
+    return results
+
+def get_symbol_profiles(symbols: list, timeout: float = WATCHLIST_FETCH_TIMEOUT) -> dict:
+    """{symbol: profile} from the profile cache, fetching misses concurrently until the deadline"""
+    profiles, futures = _start_loads(_profile_cache, _load_profile, symbols)
+    return _collect(profiles, futures, timeout)
+
+def _build_rows(symbols: list, fields: tuple, timeout: float) -> list:
+    """Rows for symbols with only `fields`, loading just the sources those fields need"""
+    wanted = set(fields)
+    quotes = get_cached_prices(symbols)
+    stale = [symbol for symbol in symbols if is_quote_stale(quotes.get(symbol))]
+
+    # Everything loads side by side under one deadline
+    deadline = time.monotonic() + timeout
+    details, detail_futures = _start_loads(_detail_cache, _load_detail, symbols if wanted & set(DETAIL_FIELDS) else [])
+    # A detail fetch caches the profile from the same info call, so don't fetch it twice
+    detail_loading = set(detail_futures.values())
+    profile_symbols = [symbol for symbol in symbols if symbol not in detail_loading] if wanted & set(PROFILE_FIELDS) else []
+    profiles, profile_futures = _start_loads(_profile_cache, _load_profile, profile_symbols)
+    fresh = refresh_prices(stale, timeout) if wanted & set(PRICE_FIELDS) else {}
+    profiles = _collect(profiles, profile_futures, deadline - time.monotonic())
+    details = _collect(details, detail_futures, deadline - time.monotonic())
+    if wanted & set(PROFILE_FIELDS):
+        for symbol in detail_loading & set(details):
+            profile = _profile_cache.get(symbol)
+            if profile is not None:
+                profiles[symbol] = profile
+
+    rows = []
+    for symbol in symbols:
+        quote = {**quotes.get(symbol, {}), **fresh.get(symbol, {})}
+        profile = profiles.get(symbol, {})
+        detail = details.get(symbol, {})
+        if not quote and not profile and not detail:
+            # Add the symbol with minimal data if nothing could be loaded
+            placeholder = {'symbol': symbol, 'name': 'Data not available'}
+            rows.append({field: placeholder.get(field) for field in fields})
+            continue
+
+        row = {
+            'symbol': symbol,
+            'name': profile.get('name') or quote.get('name'),
+            'current_price': quote.get('current_price'),
+            'previousClose': quote.get('previous_close'),
+            'day_change': quote.get('day_change'),
+            'day_change_percent': quote.get('day_change_percent'),
+            'last_updated': quote.get('last_updated'),
+            'stale': symbol in stale and symbol not in fresh,
+            **{field: profile.get(field) for field in PROFILE_FIELDS},
+            **{field: detail.get(field) for field in DETAIL_FIELDS}
+        }
+        if 'recommendations' in wanted and row['recommendations'] is None:
+            row['recommendations'] = []
+        rows.append({field: row[field] for field in fields})
+    return rows
+
+def get_watchlist(user_id, fields=None):
+    """Fetches the user's watchlist as lean quote rows from market_prices
+
+    `fields` (see parse_fields) adds profile or detail fields; only the caches those
+    fields need are consulted. Missing or stale entries are fetched concurrently and
+    anything not back within WATCHLIST_FETCH_TIMEOUT is served from cache this time.
+    """
+    fields = parse_fields(fields)
+    symbols = get_watchlist_symbols(user_id)
+    if not symbols:
+        return []
+
+    return _build_rows(symbols, fields, WATCHLIST_FETCH_TIMEOUT)
+
+def get_watchlist_symbols(user_id) -> list:
+    """Symbols on the user's watchlist, in stored order"""
     client = get_supabase_client()
     response = client.table('watchlist').select('symbol').eq('user_id', user_id).execute()
-    if not response.data:
-        return []
+    return [item['symbol'] for item in response.data or []]
 
-    watchlist_details = []
-    for item in response.data:
-        try:
-            ticker = yf.Ticker(item['symbol'])
-            info = ticker.info
-            
-            # Extract comprehensive details
-            watchlist_details.append({
-                'symbol': item['symbol'],
-                'name': info.get('longName'),
-                'current_price': info.get('currentPrice'),
-                'open': info.get('open'),
-                'high': info.get('dayHigh'),
-                'low': info.get('dayLow'),
-                'previousClose': info.get('previousClose'),
-                'marketCap': info.get('marketCap'),
-                'fiftyTwoWeekHigh': info.get('fiftyTwoWeekHigh'),
-                'fiftyTwoWeekLow': info.get('fiftyTwoWeekLow'),
-                'recommendations': ticker.recommendations.to_dict('records') if hasattr(ticker, 'recommendations') else []
-            })
-        except Exception as e:
-            logger.error(f"Error fetching info for {item['symbol']}: {e}")
-            # Add the symbol with minimal data if yfinance fails
-            watchlist_details.append({'symbol': item['symbol'], 'name': 'Data not available'})
+def get_symbol_detail(symbol: str, fields=None):
+    """Quote, profile, recommendations and fundamentals for one symbol (for an expanded row)"""
+    symbol = validate_stock_symbol(symbol)
+    fields = parse_fields(fields, QUOTE_FIELDS + PROFILE_FIELDS + DETAIL_FIELDS)
+    return _build_rows([symbol], fields, WATCHLIST_FETCH_TIMEOUT)[0]
 
-    return watchlist_details
+def _asset_row_from_info(symbol: str, info: dict) -> dict:
+    quote_type = info.get('quoteType')
+    asset_type = 'STOCK' if quote_type == 'EQUITY' else quote_type
+    return {
+        'symbol': symbol,
+        'name': info.get('longName'),
+        'asset_type': asset_type
+    }
 
 def add_to_watchlist(user_id, symbol):
     """Adds a ticker to the user's watchlist."""
@@ -47,14 +212,7 @@ def add_to_watchlist(user_id, symbol):
         # If not, fetch from yfinance and add it
         try:
             ticker = yf.Ticker(symbol)
-            info = ticker.info
-            quote_type = info.get('quoteType')
-            asset_type = 'STOCK' if quote_type == 'EQUITY' else quote_type
-            asset_data = {
-                'symbol': symbol,
-                'name': info.get('longName'),
-                'asset_type': asset_type
-            }
+            asset_data = _asset_row_from_info(symbol, ticker.info)
             client.table('assets').upsert(asset_data).execute()
         except Exception as e:
             logger.error(f"Failed to fetch info for new asset {symbol}: {e}")
@@ -62,10 +220,102 @@ def add_to_watchlist(user_id, symbol):
 
     # Add to watchlist
     response = client.table('watchlist').insert({'user_id': user_id, 'symbol': symbol}).execute()
+    bump_watchlist_version(user_id)
     return response.data
 
+def fetch_asset_row(symbol: str) -> dict:
+    """assets row for a symbol yfinance knows; raises ValueError if it doesn't"""
+    info = yf.Ticker(symbol).info or {}
+    if not info.get('quoteType') or not (info.get('longName') or info.get('shortName')):
+        raise ValueError(f"Invalid symbol: {symbol}")
+    row = _asset_row_from_info(symbol, info)
+    row['name'] = row['name'] or info.get('shortName')
+    return row
+
+def _normalize_symbols(symbols) -> tuple:
+    """(unique upper-cased symbols in order, {raw: error} for malformed ones)"""
+    if not symbols or not isinstance(symbols, list):
+        raise ValueError("symbols must be a non-empty list")
+    if len(symbols) > MAX_BULK_SYMBOLS:
+        raise ValueError(f"At most {MAX_BULK_SYMBOLS} symbols per request")
+
+    valid, failed = [], {}
+    for raw in symbols:
+        try:
+            symbol = validate_stock_symbol(raw)
+        except ValueError as e:
+            failed[str(raw)] = str(e)
+            continue
+        if symbol not in valid:
+            valid.append(symbol)
+    return valid, failed
+
+def add_many_to_watchlist(user_id, symbols, timeout: float = BULK_VALIDATION_TIMEOUT):
+    """Add many symbols at once
+
+    Known symbols are found with one `assets` query, unknown ones are validated against
+    yfinance concurrently on a dedicated pool (validations still queued at the deadline
+    are cancelled), and the new `assets` and `watchlist` rows go in one batch each.
+    Returns {'added', 'already_present', 'failed': [{'symbol', 'error'}]}.
+    """
+    symbols, failed = _normalize_symbols(symbols)
+    client = get_supabase_client()
+
+    existing = client.table('watchlist').select('symbol').eq('user_id', user_id).in_('symbol', symbols).execute().data or []
+    already_present = {row['symbol'] for row in existing}
+    pending = [symbol for symbol in symbols if symbol not in already_present]
+
+    known = client.table('assets').select('symbol').in_('symbol', pending).execute().data if pending else []
+    known = {row['symbol'] for row in known or []}
+    unknown = [symbol for symbol in pending if symbol not in known]
+
+    new_assets = []
+    if unknown:
+        futures = {_validation_pool.submit(fetch_asset_row, symbol): symbol for symbol in unknown}
+        done, not_done = wait(futures, timeout=timeout)
+        for future in done:
+            try:
+                new_assets.append(future.result())
+            except Exception as e:
+                logger.warning(f"Rejected watchlist symbol {futures[future]}: {e}")
+                failed[futures[future]] = str(e) if isinstance(e, ValueError) else f"Invalid symbol: {futures[future]}"
+        for future in not_done:
+            future.cancel()
+            failed[futures[future]] = "Timed out validating symbol"
+
+    if new_assets:
+        client.table('assets').upsert(new_assets, on_conflict='symbol').execute()
+
+    validated = known | {row['symbol'] for row in new_assets}
+    to_add = [symbol for symbol in pending if symbol in validated]
+    if to_add:
+        client.table('watchlist').insert([{'user_id': user_id, 'symbol': symbol} for symbol in to_add]).execute()
+        bump_watchlist_version(user_id)
+
+    logger.info(f"Bulk watchlist add for user {user_id}: {len(to_add)} added, {len(failed)} failed")
+    return {
+        'added': to_add,
+        'already_present': [symbol for symbol in symbols if symbol in already_present],
+        'failed': [{'symbol': symbol, 'error': error} for symbol, error in failed.items()]
+    }
+
+def remove_many_from_watchlist(user_id, symbols):
+    """Remove many symbols in one delete; returns {'removed', 'not_found', 'failed'}"""
+    symbols, failed = _normalize_symbols(symbols)
+    client = get_supabase_client()
+    response = client.table('watchlist').delete().eq('user_id', user_id).in_('symbol', symbols).execute()
+    removed = {row['symbol'] for row in response.data or []}
+    if removed:
+        bump_watchlist_version(user_id)
+    return {
+        'removed': [symbol for symbol in symbols if symbol in removed],
+        'not_found': [symbol for symbol in symbols if symbol not in removed],
+        'failed': [{'symbol': symbol, 'error': error} for symbol, error in failed.items()]
+    }
+
 def remove_from_watchlist(user_id, symbol):
     """Removes a ticker from the user's watchlist."""
     client = get_supabase_client()
     response = client.table('watchlist').delete().match({'user_id': user_id, 'symbol': symbol}).execute()
+    bump_watchlist_version(user_id)
     return response.data
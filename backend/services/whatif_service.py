@@ -0,0 +1,218 @@
+"""
+What-if trade simulation
+Applies hypothetical BUY/SELL actions to an in-memory copy of the current valuation; never writes
+"""
+
+import logging
+import time
+from decimal import Decimal
+from datetime import datetime, timezone
+from services.holdings_service import get_portfolio_valuation
+from services.market_service import get_cached_price
+from services.analytics_service import build_allocation
+from services.transaction_service import (
+    check_sufficient_cash, check_sufficient_shares, average_cost_after_buy,
+    fifo_realized_gain_loss, get_buy_lots
+)
+from utils.validators import validate_stock_symbol, validate_positive_number
+
+logger = logging.getLogger(__name__)
+
+WHAT_IF_ACTIONS = ('BUY', 'SELL')
+MAX_WHAT_IF_ACTIONS = 50
+
+def parse_actions(actions: list) -> list:
+    """Validate [{action, symbol, quantity, price?}] into normalized dicts (price None = current price)"""
+    if not actions or not isinstance(actions, list):
+        raise ValueError("actions must be a non-empty list")
+    if len(actions) > MAX_WHAT_IF_ACTIONS:
+        raise ValueError(f"At most {MAX_WHAT_IF_ACTIONS} actions per request")
+
+    parsed = []
+    for i, action in enumerate(actions):
+        try:
+            if not isinstance(action, dict):
+                raise ValueError("must be an object")
+            action_type = str(action.get('action') or action.get('transaction_type') or '').upper()
+            if action_type not in WHAT_IF_ACTIONS:
+                raise ValueError(f"action must be one of {', '.join(WHAT_IF_ACTIONS)}")
+            symbol = validate_stock_symbol(action.get('symbol'))
+            if symbol == 'CASH':
+                raise ValueError("CASH cannot be traded")
+            quantity = validate_positive_number(action.get('quantity'), 'Quantity')
+            price = action.get('price')
+            price = validate_positive_number(price, 'Price') if price is not None else None
+        except ValueError as e:
+            raise ValueError(f"Action {i + 1}: {e}")
+        parsed.append({'action': action_type, 'symbol': symbol, 'quantity': quantity, 'price': price})
+    return parsed
+
+def concentration_metrics(holdings: list) -> dict:
+    """Largest position, top-5 share and Herfindahl index of the non-cash positions"""
+    total_value = sum(h['market_value'] for h in holdings if h['quantity'] > 0)
+    values = sorted(
+        (h['market_value'] for h in holdings if h['symbol'] != 'CASH' and h['quantity'] > 0),
+        reverse=True
+    )
+    invested = sum(values)
+    if total_value <= 0 or invested <= 0:
+        return {'largest_position_percent': 0, 'top5_percent': 0, 'hhi': 0, 'effective_positions': 0}
+
+    hhi = sum((v / invested) ** 2 for v in values)
+    return {
+        'largest_position_percent': round(values[0] / total_value * 100, 2),
+        'top5_percent': round(sum(values[:5]) / total_value * 100, 2),
+        'hhi': round(hhi, 4),
+        'effective_positions': round(1 / hhi, 2)
+    }
+
+def _snapshot(holdings: list) -> dict:
+    """Headline totals for a list of holdings rows"""
+    cash = sum(h['quantity'] for h in holdings if h['symbol'] == 'CASH')
+    positions = [h for h in holdings if h['symbol'] != 'CASH' and h['quantity'] > 0]
+    invested = sum(h['market_value'] for h in positions)
+    cost_basis = sum(h['total_cost'] for h in positions)
+    return {
+        'total_value': round(cash + invested, 2),
+        'cash_balance': round(cash, 2),
+        'invested_value': round(invested, 2),
+        'unrealized_gain_loss': round(invested - cost_basis, 2),
+        'positions_count': len(positions),
+        'concentration': concentration_metrics(holdings)
+    }
+
+def _holding_row(symbol: str, quantity: Decimal, average_cost: Decimal, price: Decimal, template: dict = None) -> dict:
+    """Holdings-shaped row for a simulated position"""
+    row = dict(template or {'symbol': symbol, 'name': symbol, 'sector': None, 'asset_type': 'STOCK', 'currency': 'USD'})
+    market_value = quantity * price
+    total_cost = quantity * average_cost
+    row.update({
+        'quantity': float(quantity),
+        'average_cost': float(average_cost),
+        'current_price': float(price),
+        'market_value': float(market_value),
+        'total_cost': float(total_cost),
+        'gain_loss': float(market_value - total_cost),
+        'gain_loss_percent': float((market_value - total_cost) / total_cost * 100) if total_cost else 0.0
+    })
+    return row
+
+def apply_actions(holdings: list, actions: list, load_lots, price_lookup) -> dict:
+    """Apply parsed actions in order to a copy of holdings
+
+    Uses the same cash/share checks, weighted average cost and FIFO matching as a real
+    trade. `load_lots(symbol)` returns the symbol's BUY lots and is called at most once
+    per symbol; `price_lookup(symbol)` prices symbols not already held.
+    Returns {'holdings', 'trades', 'realized_gain_loss'}.
+    """
+    rows = {h['symbol']: h for h in holdings}
+    positions = {
+        h['symbol']: {
+            'quantity': Decimal(str(h['quantity'])),
+            'average_cost': Decimal(str(h.get('average_cost') or 0)),
+            'price': Decimal(str(h.get('current_price') or 0))
+        }
+        for h in holdings if h['symbol'] != 'CASH'
+    }
+    cash = Decimal(str(sum(h['quantity'] for h in holdings if h['symbol'] == 'CASH')))
+    lots = {}
+    trades = []
+    realized_total = Decimal('0')
+
+    for i, action in enumerate(actions):
+        symbol, quantity = action['symbol'], action['quantity']
+        position = positions.get(symbol)
+        price = action['price']
+        if price is None:
+            price = position['price'] if position and position['price'] > 0 else price_lookup(symbol)
+        if price is None or price <= 0:
+            raise ValueError(f"Action {i + 1}: no current price for {symbol}; pass a price")
+
+        try:
+            if action['action'] == 'BUY':
+                check_sufficient_cash(cash, quantity, price)
+            else:
+                check_sufficient_shares(symbol, position['quantity'] if position else Decimal('0'), quantity)
+        except ValueError as e:
+            raise ValueError(f"Action {i + 1}: {e}")
+
+        realized = Decimal('0')
+        if action['action'] == 'BUY':
+            if position is None:
+                position = positions[symbol] = {'quantity': Decimal('0'), 'average_cost': Decimal('0'), 'price': price}
+            if position['quantity'] > 0:
+                position['average_cost'] = average_cost_after_buy(
+                    position['quantity'], position['average_cost'], quantity, price
+                )
+            else:
+                position['average_cost'] = price
+            position['quantity'] += quantity
+            cash -= quantity * price
+            if symbol not in lots:
+                lots[symbol] = list(load_lots(symbol))
+            lots[symbol].append({'quantity': str(quantity), 'price': str(price)})
+        else:
+            if symbol not in lots:
+                lots[symbol] = list(load_lots(symbol))
+            realized, lots[symbol] = fifo_realized_gain_loss(lots[symbol], quantity, price)
+            position['quantity'] -= quantity
+            cash += quantity * price
+            realized_total += realized
+
+        if action['price'] is None and position['price'] <= 0:
+            position['price'] = price
+        trades.append({
+            'action': action['action'],
+            'symbol': symbol,
+            'quantity': float(quantity),
+            'price': float(price),
+            'amount': round(float(quantity * price), 2),
+            'realized_gain_loss': round(float(realized), 2)
+        })
+
+    result_holdings = [
+        _holding_row(symbol, p['quantity'], p['average_cost'], p['price'], rows.get(symbol))
+        for symbol, p in positions.items()
+    ]
+    cash_row = dict(rows.get('CASH') or {'symbol': 'CASH', 'name': 'Cash', 'asset_type': 'CASH', 'currency': 'USD'})
+    cash_row.update({'quantity': float(cash), 'average_cost': 1.0, 'current_price': 1.0,
+                     'market_value': float(cash), 'total_cost': float(cash)})
+    result_holdings.append(cash_row)
+
+    return {'holdings': result_holdings, 'trades': trades, 'realized_gain_loss': realized_total}
+
+def simulate_trades(user_id: str, actions: list, top_n: int = None):
+    """Effect of hypothetical trades on cash, totals, allocation, realized P&L and concentration (no writes)"""
+    parsed = parse_actions(actions)
+
+    try:
+        started = time.perf_counter()
+        holdings = get_portfolio_valuation(user_id)['holdings']
+
+        def price_lookup(symbol):
+            price_data = get_cached_price(symbol)
+            price = price_data.get('current_price') if price_data else None
+            return Decimal(str(price)) if price else None
+
+        result = apply_actions(holdings, parsed, lambda symbol: get_buy_lots(user_id, symbol), price_lookup)
+        before = _snapshot(holdings)
+        after = _snapshot(result['holdings'])
+
+        return {
+            'trades': result['trades'],
+            'before': before,
+            'after': after,
+            'change': {
+                key: round(after[key] - before[key], 2)
+                for key in ('total_value', 'cash_balance', 'invested_value', 'unrealized_gain_loss', 'positions_count')
+            },
+            'realized_gain_loss': round(float(result['realized_gain_loss']), 2),
+            'allocation': build_allocation(result['holdings'], top_n),
+            'computation_ms': round((time.perf_counter() - started) * 1000, 3),
+            'calculated_at': datetime.now(timezone.utc).isoformat()
+        }
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Error simulating trades for user {user_id}: {e}")
+        raise Exception("Failed to simulate trades")
@@ -4,6 +4,9 @@ Pytest configuration and fixtures for backend testing
 import pytest
 import os
 import sys
+import threading
+import time
+import uuid
 from unittest.mock import Mock, patch
 from flask import Flask
 
@@ -69,4 +72,155 @@ def mock_yfinance():
     mock_ticker.history.return_value = Mock()
     
     with patch('yfinance.Ticker', return_value=mock_ticker) as mock:
-        yield mock 
\ No newline at end of file
+        yield mock 
+
+class FakeQuery:
+    """Chainable stand-in for a supabase-py table query backed by plain lists."""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.action = 'select'
+        self.payload = None
+        self.on_conflict = None
+        self.order_by = None
+        self.limit_count = None
+        self.offset_count = 0
+        self.single_row = False
+
+    def select(self, *columns, **kwargs):
+        self.action = 'select'
+        return self
+
+    def insert(self, payload):
+        self.action, self.payload = 'insert', payload
+        return self
+
+    def upsert(self, payload, on_conflict=None, **kwargs):
+        self.action, self.payload, self.on_conflict = 'upsert', payload, on_conflict
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = 'update', payload
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) <= value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def match(self, criteria):
+        for column, value in criteria.items():
+            self.eq(column, value)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def offset(self, count):
+        self.offset_count = count
+        return self
+
+    def range(self, start, end):
+        self.offset_count, self.limit_count = start, end - start + 1
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def _matches(self, row):
+        return all(f(row) for f in self.filters)
+
+    def execute(self):
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        with self.db.lock:
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.action == 'select':
+                data = [dict(r) for r in rows if self._matches(r)]
+                if self.order_by:
+                    column, desc = self.order_by
+                    data.sort(key=lambda r: r.get(column), reverse=desc)
+                data = data[self.offset_count:]
+                if self.limit_count is not None:
+                    data = data[:self.limit_count]
+                if self.single_row:
+                    data = data[0] if data else None
+            elif self.action == 'insert':
+                new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+                data = []
+                for row in new_rows:
+                    row = {'id': str(uuid.uuid4()), **row}
+                    rows.append(row)
+                    data.append(dict(row))
+            elif self.action == 'upsert':
+                new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+                keys = (self.on_conflict or 'id').split(',')
+                data = []
+                for row in new_rows:
+                    existing = next((r for r in rows if all(r.get(k) == row.get(k) for k in keys)), None)
+                    if existing is None:
+                        existing = {'id': str(uuid.uuid4())}
+                        rows.append(existing)
+                    existing.update(row)
+                    data.append(dict(existing))
+            elif self.action == 'update':
+                data = []
+                for row in rows:
+                    if self._matches(row):
+                        row.update(self.payload)
+                        data.append(dict(row))
+            else:
+                data = [dict(r) for r in rows if self._matches(r)]
+                self.db.tables[self.table] = [r for r in rows if not self._matches(r)]
+            return Mock(data=data)
+
+
+class FakeSupabaseClient:
+    """In-memory supabase client; `latency` sleeps before every query to widen race windows."""
+
+    def __init__(self, latency=0.0):
+        self.tables = {}
+        self.latency = latency
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rows(self, name):
+        return self.tables.get(name, [])
+
+
+@pytest.fixture
+def fake_supabase():
+    """In-memory supabase client installed as the shared client from utils.database."""
+    client = FakeSupabaseClient()
+    with patch('utils.database.supabase', client):
+        yield client
@@ -0,0 +1,208 @@
+"""
+Unit tests for the AI chat portfolio context
+"""
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+from services import ai_chat_service
+from services.ai_chat_service import (
+    get_portfolio_context, gather_context_data, format_portfolio_context, AIChatService
+)
+from utils.versions import bump_user_version, bump_price_epoch, bump_watchlist_version
+
+
+VALUATION = {
+    'holdings': [
+        {'symbol': 'CASH', 'name': 'Cash', 'quantity': 500.0, 'market_value': 500.0, 'asset_type': 'CASH'},
+        {'symbol': 'AAPL', 'name': 'Apple', 'quantity': 10.0, 'average_cost': 150.0, 'current_price': 200.0,
+         'market_value': 2000.0, 'gain_loss': 500.0, 'gain_loss_percent': 33.33, 'sector': 'Technology'},
+    ],
+    'totals': {'total_market_value': 2500.0, 'cash_balance': 500.0, 'total_gain_loss': 500.0,
+               'total_gain_loss_percent': 33.33},
+}
+TRANSACTIONS = [{'transaction_date': '2025-07-01', 'transaction_type': 'BUY', 'quantity': 10,
+                 'symbol': 'AAPL', 'price': '150.00'}]
+
+
+def _slow(value, delay=0.2):
+    def load(*args, **kwargs):
+        time.sleep(delay)
+        return value
+    return load
+
+
+@pytest.fixture
+def sources():
+    ai_chat_service._context_cache.clear()
+    with patch.object(ai_chat_service, 'get_portfolio_valuation', side_effect=_slow(VALUATION)) as valuation, \
+            patch.object(ai_chat_service, 'get_transaction_history', side_effect=_slow(TRANSACTIONS)), \
+            patch.object(ai_chat_service, 'get_watchlist_symbols', side_effect=_slow(['MSFT'])), \
+            patch.object(ai_chat_service, 'get_cached_prices', return_value={'MSFT': {'current_price': 410.5}}):
+        yield valuation
+    ai_chat_service._context_cache.clear()
+
+
+class TestPortfolioContext:
+
+    def test_sources_load_concurrently(self, sources):
+        start = time.perf_counter()
+        data = gather_context_data('user-1')
+        elapsed = time.perf_counter() - start
+
+        # Three 0.2s loads one after another would take 0.6s
+        assert elapsed < 0.45
+        assert data['watchlist'] == [{'symbol': 'MSFT', 'current_price': 410.5}]
+
+    def test_context_sections(self, sources):
+        context = get_portfolio_context('user-1')
+
+        assert '- Total Value: $2,500.00' in context
+        assert '- AAPL: 10.0 shares @ $150.00 avg, Current: $200.00' in context
+        assert '- 2025-07-01: BUY 10 AAPL @ $150.00' in context
+        assert '- Technology: 80.0%' in context
+        assert '- MSFT: $410.50' in context
+        assert 'CASH:' not in context.split('CURRENT HOLDINGS:')[1].split('RECENT')[0]
+
+    def test_rebuilt_only_on_version_change(self, sources):
+        get_portfolio_context('user-cache')
+        get_portfolio_context('user-cache')
+        assert sources.call_count == 1
+
+        bump_user_version('user-cache')
+        get_portfolio_context('user-cache')
+        bump_price_epoch()
+        get_portfolio_context('user-cache')
+        bump_watchlist_version('user-cache')
+        get_portfolio_context('user-cache')
+        assert sources.call_count == 4
+
+    def test_failed_source_is_skipped(self, sources):
+        with patch.object(ai_chat_service, 'get_transaction_history', side_effect=RuntimeError('db down')):
+            context = format_portfolio_context(gather_context_data('user-1'))
+
+        assert 'RECENT TRANSACTIONS' not in context
+        assert 'PORTFOLIO OVERVIEW' in context
+
+    def test_no_market_provider_calls(self, sources):
+        with patch('yfinance.Ticker') as ticker:
+            get_portfolio_context('user-1')
+
+        ticker.assert_not_called()
+
+
+CHAT_CONTEXT = "PORTFOLIO OVERVIEW:\n- Total Value: $1.00\n- Cash Balance: $1.00\n\nWATCHLIST:\n- MSFT: $410.50\n- NVDA: $120.00"
+
+
+@pytest.fixture
+def chat_service(monkeypatch):
+    monkeypatch.setenv('GOOGLE_GENAI_API_KEY', 'test-key')
+    monkeypatch.delenv('CHAT_SESSION_DIR', raising=False)
+    context = {'text': CHAT_CONTEXT}
+    with patch.object(ai_chat_service.genai, 'Client') as client_cls, \
+            patch.object(ai_chat_service, 'get_portfolio_context', side_effect=lambda user_id: context['text']):
+        client = client_cls.return_value
+        client.models.generate_content.side_effect = lambda model, contents, config: MagicMock(
+            text=f'answer {len(contents)}', usage_metadata=MagicMock(prompt_token_count=42))
+        service = AIChatService()
+        service.context = context
+        yield service
+
+
+def _sent(service):
+    call = service.client.models.generate_content.call_args.kwargs
+    return [c['parts'][0]['text'] for c in call['contents']], call['config']
+
+
+class TestChatSessions:
+
+    def test_context_sent_once_then_as_diff(self, chat_service):
+        first = chat_service.chat('user-1', 'first?')
+        texts, config = _sent(chat_service)
+        assert texts == [f'PORTFOLIO CONTEXT:\n{CHAT_CONTEXT}\n\nUSER QUESTION: first?']
+        assert config.system_instruction == chat_service.system_instruction
+        assert first['usage']['context'] == 'full'
+        assert first['usage']['prompt_tokens'] == 42
+
+        second = chat_service.chat('user-1', 'second?')
+        texts, _ = _sent(chat_service)
+        assert texts[1:] == ['answer 1', 'second?']
+        assert second['usage']['context'] == 'unchanged'
+
+        chat_service.context['text'] = CHAT_CONTEXT.replace('$1.00', '$2.00', 1)
+        third = chat_service.chat('user-1', 'third?')
+        texts, _ = _sent(chat_service)
+        assert third['usage']['context'] == 'diff'
+        assert texts[-1].endswith('-- Total Value: $1.00\n+- Total Value: $2.00\n\nUSER QUESTION: third?')
+        assert 'Cash Balance' not in texts[-1]
+        assert third['history'][-2:] == [{'role': 'user', 'content': 'third?'},
+                                         {'role': 'model', 'content': 'answer 5'}]
+
+    def test_budget_trims_old_turns_and_resends_context(self, chat_service):
+        chat_service.chat('user-1', 'q' * 400)
+        with patch.object(ai_chat_service, 'CHAT_PROMPT_TOKEN_BUDGET', 150):
+            result = chat_service.chat('user-1', 'short?')
+        texts, _ = _sent(chat_service)
+
+        # The first turn (~140 tokens with its context) no longer fits next to the new one
+        assert result['usage']['omitted_messages'] == 2
+        assert len(texts) == 1 and texts[0].startswith('PORTFOLIO CONTEXT:')
+        assert result['usage']['context'] == 'full'
+
+    def test_history_capped_and_cleared(self, chat_service):
+        with patch.object(chat_service.sessions, 'max_history', 4):
+            for i in range(4):
+                chat_service.chat('user-1', f'q{i}')
+
+        assert [m['content'] for m in chat_service.get_chat_history('user-1')][::2] == ['q2', 'q3']
+        assert chat_service.clear_chat_history('user-1') is True
+        assert chat_service.get_chat_history('user-1') == []
+
+
+class TestStreamingChat:
+
+    @staticmethod
+    def _stream(*pieces, delay=0.0, fail=False):
+        def generate(model, contents, config):
+            for piece in pieces:
+                time.sleep(delay)
+                yield MagicMock(text=piece, usage_metadata=None)
+            if fail:
+                raise RuntimeError('stream broke')
+            yield MagicMock(text='', usage_metadata=MagicMock(prompt_token_count=42))
+        return generate
+
+    def test_chunks_then_done_and_history_stored_once(self, chat_service):
+        chat_service.client.models.generate_content_stream.side_effect = self._stream('Hel', 'lo', delay=0.05)
+
+        events = list(chat_service.stream_chat('user-1', 'hi?'))
+
+        assert events[:2] == [('chunk', {'text': 'Hel'}), ('chunk', {'text': 'lo'})]
+        event, done = events[2]
+        assert event == 'done' and done['response'] == 'Hello'
+        assert done['usage']['prompt_tokens'] == 42
+        assert 40 <= done['usage']['first_token_ms'] <= done['usage']['total_ms']
+        assert chat_service.get_chat_history('user-1')[-1]['content'] == 'Hello'
+        assert len(chat_service.get_chat_history('user-1')) == 2
+
+    def test_failed_stream_stores_nothing(self, chat_service):
+        chat_service.client.models.generate_content_stream.side_effect = self._stream('partial', fail=True)
+
+        events = list(chat_service.stream_chat('user-1', 'hi?'))
+
+        assert [event for event, _ in events] == ['chunk', 'error']
+        assert chat_service.get_chat_history('user-1') == []
+
+    def test_stream_endpoint_emits_sse(self, client):
+        service = MagicMock()
+        service.stream_chat.return_value = iter([('chunk', {'text': 'Hi'}), ('done', {'response': 'Hi'})])
+
+        with patch('app.get_ai_chat_service', return_value=service):
+            response = client.post('/api/chat/user-1/stream', json={'message': 'hello'})
+            body = response.get_data(as_text=True)
+            missing = client.post('/api/chat/user-1/stream', json={})
+
+        assert response.mimetype == 'text/event-stream'
+        assert body == 'event: chunk\ndata: {"text": "Hi"}\n\nevent: done\ndata: {"response": "Hi"}\n\n'
+        service.stream_chat.assert_called_once_with('user-1', 'hello')
+        assert missing.status_code == 400
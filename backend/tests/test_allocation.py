@@ -0,0 +1,100 @@
+"""
+Unit tests for the allocation engine and valuation cache
+"""
+from unittest.mock import patch
+
+from services.analytics_service import build_allocation, calculate_asset_allocation, calculate_portfolio_performance
+from services import holdings_service, analytics_service
+from utils.versions import bump_user_version, bump_price_epoch
+
+
+def _holding(symbol, value, sector=None, asset_type='STOCK', currency='USD', quantity=1.0):
+    return {
+        'symbol': symbol, 'name': symbol, 'quantity': quantity, 'market_value': value,
+        'sector': sector, 'asset_type': asset_type, 'currency': currency,
+        'total_cost': value, 'day_change': 0.0
+    }
+
+
+HOLDINGS = [
+    _holding('CASH', 100.0, asset_type='CASH'),
+    _holding('AAPL', 400.0, 'Technology'),
+    _holding('MSFT', 300.0, 'Technology'),
+    _holding('SAP', 150.0, 'Technology', currency='EUR'),
+    _holding('XOM', 50.0, 'Energy'),
+    _holding('GONE', 0.0, 'Energy', quantity=0.0),
+]
+
+
+class TestBuildAllocation:
+
+    def test_groups_every_dimension(self):
+        allocation = build_allocation(HOLDINGS)
+
+        assert allocation['total_value'] == 1000.0
+        assert allocation['by_asset_type'][0] == {'name': 'Stocks', 'value': 900.0, 'count': 4, 'percentage': 90.0}
+        assert [(s['name'], s['percentage']) for s in allocation['by_sector']] == [
+            ('Technology', 85.0), ('Cash', 10.0), ('Energy', 5.0)
+        ]
+        assert {c['name']: c['value'] for c in allocation['by_currency']} == {'USD': 850.0, 'EUR': 150.0}
+        assert [p['symbol'] for p in allocation['by_symbol']] == ['AAPL', 'MSFT', 'SAP', 'CASH', 'XOM']
+
+    def test_top_n_rolls_up_the_rest(self):
+        positions = build_allocation(HOLDINGS, top_n=2)['by_symbol']
+
+        assert [p['symbol'] for p in positions] == ['AAPL', 'MSFT', 'OTHER']
+        assert positions[-1]['value'] == 300.0
+        assert positions[-1]['percentage'] == 30.0
+
+    def test_missing_sector_is_unknown(self):
+        allocation = build_allocation([_holding('NEW', 10.0)])
+
+        assert allocation['by_sector'][0]['name'] == 'Unknown'
+
+
+class TestValuationCache:
+
+    def setup_method(self):
+        holdings_service._valuation_cache.clear()
+        analytics_service._analytics_cache.clear()
+
+    def test_allocation_and_performance_share_one_holdings_load(self):
+        with patch.object(holdings_service, 'get_user_holdings', return_value=HOLDINGS) as load, \
+                patch.object(holdings_service, 'get_total_realized_gain_loss_for_user', return_value=0):
+            calculate_portfolio_performance('user-1')
+            calculate_asset_allocation('user-1')
+            calculate_asset_allocation('user-1', top_n=3)
+
+        assert load.call_count == 1
+
+    def test_repeat_polls_are_cache_hits(self):
+        with patch.object(holdings_service, 'get_user_holdings', return_value=HOLDINGS), \
+                patch.object(holdings_service, 'get_total_realized_gain_loss_for_user', return_value=0):
+            first = calculate_portfolio_performance('user-2')
+            with patch.object(analytics_service, 'get_portfolio_valuation') as valuation:
+                for _ in range(100):
+                    assert calculate_portfolio_performance('user-2') is first
+
+        valuation.assert_not_called()
+
+    def test_ledger_version_and_price_epoch_recompute(self):
+        with patch.object(holdings_service, 'get_user_holdings', return_value=HOLDINGS) as load, \
+                patch.object(holdings_service, 'get_total_realized_gain_loss_for_user', return_value=0):
+            calculate_asset_allocation('user-3')
+            bump_user_version('user-3')
+            calculate_asset_allocation('user-3')
+            bump_price_epoch()
+            calculate_asset_allocation('user-3')
+            calculate_asset_allocation('user-3')
+
+        assert load.call_count == 3
+
+    def test_other_users_survive_a_ledger_write(self):
+        with patch.object(holdings_service, 'get_user_holdings', return_value=HOLDINGS) as load, \
+                patch.object(holdings_service, 'get_total_realized_gain_loss_for_user', return_value=0):
+            calculate_asset_allocation('user-4')
+            calculate_asset_allocation('user-5')
+            bump_user_version('user-4')
+            calculate_asset_allocation('user-5')
+
+        assert load.call_count == 2
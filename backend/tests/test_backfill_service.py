@@ -0,0 +1,126 @@
+"""
+Unit tests for backfill_service.py
+"""
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from services.backfill_service import (
+    forward_fill, build_daily_positions, compute_daily_values, backfill_user_snapshots
+)
+
+
+def _dates(start, n):
+    return np.datetime64(start, 'D') + np.arange(n).astype('timedelta64[D]')
+
+
+def _tx(client, user_id, tx_type, day, symbol='CASH', quantity=0.0, price=1.0, total=0.0):
+    client.table('transactions').insert({
+        'user_id': user_id,
+        'symbol': symbol,
+        'transaction_type': tx_type,
+        'quantity': quantity,
+        'price': price,
+        'total_amount': total,
+        'transaction_date': f'{day}T15:00:00+00:00'
+    }).execute()
+
+
+class TestBackfillMath:
+
+    def test_forward_fill_keeps_leading_nans(self):
+        matrix = np.array([[np.nan, 1.0], [2.0, np.nan], [np.nan, np.nan], [3.0, 4.0]])
+
+        filled = forward_fill(matrix)
+
+        assert np.isnan(filled[0, 0])
+        assert filled[:, 0][1:].tolist() == [2.0, 2.0, 3.0]
+        assert filled[:, 1].tolist() == [1.0, 1.0, 1.0, 4.0]
+
+    def test_positions_and_cash_replay(self):
+        dates = _dates('2025-01-01', 5)
+        ledger = [
+            {'symbol': 'CASH', 'transaction_type': 'DEPOSIT', 'quantity': 0, 'price': 1,
+             'total_amount': 1000, 'transaction_date': '2025-01-01T10:00:00'},
+            {'symbol': 'AAPL', 'transaction_type': 'BUY', 'quantity': 4, 'price': 100,
+             'total_amount': 400, 'transaction_date': '2025-01-02T10:00:00'},
+            {'symbol': 'AAPL', 'transaction_type': 'SELL', 'quantity': 1, 'price': 120,
+             'total_amount': 120, 'transaction_date': '2025-01-04T10:00:00'},
+        ]
+
+        symbols, positions, cash, trade_prices = build_daily_positions(ledger, dates)
+
+        assert symbols == ['AAPL']
+        assert positions[:, 0].tolist() == [0, 4, 4, 3, 3]
+        assert cash.tolist() == [1000, 600, 600, 720, 720]
+        assert trade_prices[2:, 0].tolist() == [100, 120, 120]
+
+    def test_transactions_after_last_date_are_ignored(self):
+        dates = _dates('2025-01-01', 3)
+        ledger = [
+            {'symbol': 'CASH', 'transaction_type': 'DEPOSIT', 'quantity': 0, 'price': 1,
+             'total_amount': 1000, 'transaction_date': '2025-01-01T10:00:00'},
+            {'symbol': 'AAPL', 'transaction_type': 'BUY', 'quantity': 1, 'price': 100,
+             'total_amount': 100, 'transaction_date': '2025-02-01T10:00:00'},
+        ]
+
+        symbols, positions, cash, _ = build_daily_positions(ledger, dates)
+
+        assert symbols == []
+        assert positions.shape == (3, 0)
+        assert cash.tolist() == [1000, 1000, 1000]
+
+    def test_values_fall_back_to_trade_price(self):
+        positions = np.array([[2.0], [2.0], [2.0]])
+        cash = np.array([10.0, 10.0, 10.0])
+        closes = np.array([[np.nan], [50.0], [55.0]])
+        trade_prices = np.array([[40.0], [40.0], [40.0]])
+
+        values = compute_daily_values(positions, cash, closes, trade_prices)
+
+        assert values.tolist() == [90.0, 110.0, 120.0]
+
+
+class TestBackfillUserSnapshots:
+
+    def _close_matrix(self, symbols, start_date, end_date=None, adjusted=True):
+        # Ledger share counts must be valued at as-traded (split-unadjusted) closes
+        assert adjusted is False
+        dates = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + np.timedelta64(1, 'D'))
+        closes = np.full((len(dates), len(symbols)), 110.0)
+        closes[0] = np.nan
+        return dates, closes
+
+    def test_backfill_writes_missing_days_only(self, fake_supabase):
+        _tx(fake_supabase, 'u1', 'DEPOSIT', '2025-03-01', total=1000.0)
+        _tx(fake_supabase, 'u1', 'BUY', '2025-03-01', 'AAPL', 5.0, 100.0, 500.0)
+        fake_supabase.table('portfolio_snapshots').insert(
+            {'user_id': 'u1', 'date': '2025-03-03', 'total_value': 999.0}
+        ).execute()
+
+        with patch('services.backfill_service.get_close_price_matrix', side_effect=self._close_matrix):
+            report = backfill_user_snapshots('u1', end_date='2025-03-05', chunk_size=2)
+
+        snapshots = {r['date']: r['total_value'] for r in fake_supabase.rows('portfolio_snapshots')}
+        assert report['snapshots_written'] == 4
+        assert report['skipped_existing'] == 1
+        assert snapshots['2025-03-01'] == pytest.approx(1000.0)
+        assert snapshots['2025-03-02'] == pytest.approx(1050.0)
+        assert snapshots['2025-03-03'] == 999.0
+        assert len([r for r in fake_supabase.rows('portfolio_snapshot_rollups') if r['resolution'] == 'MONTH']) == 1
+
+    def test_overwrite_replaces_existing(self, fake_supabase):
+        _tx(fake_supabase, 'u1', 'DEPOSIT', '2025-03-01', total=1000.0)
+        fake_supabase.table('portfolio_snapshots').insert(
+            {'user_id': 'u1', 'date': '2025-03-02', 'total_value': 5.0}
+        ).execute()
+
+        with patch('services.backfill_service.get_close_price_matrix', side_effect=self._close_matrix):
+            report = backfill_user_snapshots('u1', end_date='2025-03-02', overwrite=True)
+
+        snapshots = {r['date']: r['total_value'] for r in fake_supabase.rows('portfolio_snapshots')}
+        assert report['snapshots_written'] == 2
+        assert snapshots['2025-03-02'] == pytest.approx(1000.0)
+
+    def test_no_transactions(self, fake_supabase):
+        assert backfill_user_snapshots('nobody')['snapshots_written'] == 0
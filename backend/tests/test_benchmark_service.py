@@ -0,0 +1,79 @@
+"""
+Unit tests for benchmark_service.py and the shared benchmark history cache
+"""
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from services import market_service
+from services.benchmark_service import compute_benchmark_comparison, compare_to_benchmark
+
+
+def _daily_dates(n, start='2025-01-01'):
+    return np.datetime64(start) + np.arange(n).astype('timedelta64[D]')
+
+
+class TestBenchmarkComparison:
+
+    def test_identical_series_has_zero_tracking_error(self):
+        closes = np.array([100.0, 102.0, 101.0, 105.0])
+        values = closes * 10
+
+        result = compute_benchmark_comparison(_daily_dates(4), values, np.zeros(4), closes)
+
+        assert result['benchmark_index'].tolist() == pytest.approx([100.0, 102.0, 101.0, 105.0])
+        assert result['relative_return_percent'] == 0.0
+        assert result['tracking_error_percent'] == 0.0
+
+    def test_deposits_are_not_outperformance(self):
+        closes = np.array([100.0, 100.0, 100.0])
+        values = np.array([1000.0, 2000.0, 2000.0])
+        flows = np.array([0.0, 1000.0, 0.0])
+
+        result = compute_benchmark_comparison(_daily_dates(3), values, flows, closes)
+
+        assert result['portfolio_return_percent'] == 0.0
+        assert result['relative_return_percent'] == 0.0
+
+    def test_benchmark_gap_at_start(self):
+        closes = np.array([np.nan, 50.0, 55.0])
+        values = np.array([100.0, 100.0, 100.0])
+
+        result = compute_benchmark_comparison(_daily_dates(3), values, np.zeros(3), closes)
+
+        assert np.isnan(result['benchmark_index'][0])
+        assert result['benchmark_return_percent'] == 10.0
+        assert result['observations'] == 1
+
+
+class TestSharedBenchmarkHistory:
+
+    def setup_method(self):
+        market_service._benchmark_cache.clear()
+
+    def test_many_users_load_the_benchmark_once(self):
+        dates = _daily_dates(30)
+        history = [{'date': str(d), 'total_value': 1000.0 + i} for i, d in enumerate(dates)]
+        series = (history, dates, np.array([h['total_value'] for h in history]), np.zeros(30), 0)
+
+        with patch('services.benchmark_service.get_flow_adjusted_series', return_value=series), \
+                patch.object(market_service, 'get_price_history',
+                             return_value=(dates, np.linspace(400, 430, 30))) as load:
+            results = [compare_to_benchmark(f'user-{i}', 30, 'spy', max_points=10) for i in range(50)]
+
+        assert load.call_count == 1
+        assert results[0]['benchmark'] == 'SPY'
+        assert len(results[0]['series']) == 10
+        assert results[0]['series'][-1]['benchmark_index'] == pytest.approx(107.5)
+
+    def test_empty_history_is_cached_briefly(self):
+        empty = (np.array([], dtype='datetime64[D]'), np.array([]))
+
+        with patch.object(market_service, 'get_price_history', return_value=empty) as load:
+            market_service.get_benchmark_history('NOPE')
+            market_service.get_benchmark_history('NOPE')
+            assert load.call_count == 1
+
+            with patch.object(market_service, 'BENCHMARK_EMPTY_TTL_SECONDS', -1):
+                market_service.get_benchmark_history('NOPE')
+            assert load.call_count == 2
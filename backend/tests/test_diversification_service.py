@@ -0,0 +1,94 @@
+"""
+Unit tests for diversification_service.py
+"""
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from services import diversification_service
+from services.diversification_service import (
+    daily_returns_matrix, covariance_and_correlation, diversification_metrics,
+    get_symbol_covariance, calculate_diversification
+)
+
+
+def _price_matrix(symbols, start_date, end_date=None):
+    """Deterministic random walks, one column per symbol, MSFT moving 1:1 with AAPL"""
+    dates = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + np.timedelta64(1, 'D'))
+    rng = np.random.default_rng(7)
+    base = rng.normal(0, 0.01, (len(dates), 1))
+    noise = rng.normal(0, 0.01, (len(dates), len(symbols)))
+    returns = np.where(np.array(symbols) == 'MSFT', base[:, 0:1], noise)
+    returns[:, [i for i, s in enumerate(symbols) if s == 'AAPL']] = base
+    closes = 100 * np.cumprod(1 + returns, axis=0)
+    closes[:, [i for i, s in enumerate(symbols) if s == 'NOPE']] = np.nan
+    return dates, closes
+
+
+class TestDiversificationMath:
+
+    def test_returns_skip_weekends_and_incomplete_rows(self):
+        dates = np.arange(np.datetime64('2025-03-06'), np.datetime64('2025-03-12'))  # Thu..Tue
+        closes = np.array([[10.0, np.nan], [11.0, 20.0], [99.0, 99.0], [99.0, 99.0], [11.0, 22.0], [12.1, 22.0]])
+
+        returns = daily_returns_matrix(dates, closes)
+
+        assert np.allclose(returns, [[0.0, 0.1], [0.1, 0.0]])
+
+    def test_correlation_of_identical_columns(self):
+        x = np.random.default_rng(0).normal(size=200)
+        _, correlation = covariance_and_correlation(np.column_stack([x, 2 * x, -x]))
+
+        assert correlation == pytest.approx(np.array([[1, 1, -1], [1, 1, -1], [-1, -1, 1]]))
+
+    def test_independent_equal_weight_bets(self):
+        covariance = np.diag([0.04, 0.04, 0.04, 0.04])
+
+        metrics = diversification_metrics(np.full(4, 0.25), covariance)
+
+        assert metrics['effective_number_of_bets'] == pytest.approx(4.0)
+        assert metrics['contributions'] == pytest.approx(np.full(4, 0.25))
+
+    def test_perfectly_correlated_is_one_bet(self):
+        covariance = np.full((3, 3), 0.04)
+
+        metrics = diversification_metrics(np.array([0.5, 0.3, 0.2]), covariance)
+
+        assert metrics['effective_number_of_bets'] == pytest.approx(1.0)
+        assert metrics['contributions'].sum() == pytest.approx(1.0)
+        assert metrics['diversification_ratio'] == pytest.approx(1.0)
+
+
+class TestCovarianceMemo:
+
+    def setup_method(self):
+        diversification_service._covariance_cache.clear()
+
+    def test_same_symbol_set_is_computed_once(self):
+        with patch.object(diversification_service, 'get_close_price_matrix', side_effect=_price_matrix) as load:
+            first = get_symbol_covariance(['MSFT', 'AAPL', 'XOM'], 180)
+            second = get_symbol_covariance(['XOM', 'AAPL', 'MSFT'], 180)
+
+        assert load.call_count == 1
+        assert first is second
+        assert first[0] == ['AAPL', 'MSFT', 'XOM']
+
+    def test_user_report(self):
+        holdings = [
+            {'symbol': 'CASH', 'quantity': 500.0, 'market_value': 500.0},
+            {'symbol': 'AAPL', 'quantity': 5.0, 'market_value': 500.0},
+            {'symbol': 'MSFT', 'quantity': 5.0, 'market_value': 500.0},
+            {'symbol': 'XOM', 'quantity': 10.0, 'market_value': 1000.0},
+            {'symbol': 'NOPE', 'quantity': 1.0, 'market_value': 10.0},
+        ]
+        with patch.object(diversification_service, 'get_close_price_matrix', side_effect=_price_matrix), \
+                patch.object(diversification_service, 'get_portfolio_valuation', return_value={'holdings': holdings}):
+            report = calculate_diversification('user-1', 365)
+
+        assert report['symbols'] == ['AAPL', 'MSFT', 'XOM']
+        assert report['missing_price_symbols'] == ['NOPE']
+        assert report['correlation_matrix'][0][1] == pytest.approx(1.0)
+        assert [h['weight_percent'] for h in report['holdings']] == [25.0, 25.0, 50.0]
+        assert sum(h['risk_contribution_percent'] for h in report['holdings']) == pytest.approx(100.0, abs=0.05)
+        # AAPL and MSFT are the same bet, XOM is independent
+        assert 1.0 < report['effective_number_of_bets'] <= 2.0
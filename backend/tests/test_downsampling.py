@@ -0,0 +1,36 @@
+"""
+Unit tests for utils/downsampling.py
+"""
+import numpy as np
+
+from utils.downsampling import lttb_indices
+
+
+class TestLTTB:
+
+    def test_short_series_is_untouched(self):
+        assert lttb_indices(np.arange(5), np.arange(5), 10).tolist() == [0, 1, 2, 3, 4]
+
+    def test_keeps_endpoints_and_point_count(self):
+        x = np.arange(3650)
+        y = np.sin(x / 100.0)
+
+        keep = lttb_indices(x, y, 300)
+
+        assert len(keep) == 300
+        assert keep[0] == 0 and keep[-1] == 3649
+        assert np.all(np.diff(keep) > 0)
+
+    def test_preserves_spikes(self):
+        x = np.arange(1000)
+        y = np.zeros(1000)
+        y[437] = 50.0
+        y[812] = -30.0
+
+        keep = lttb_indices(x, y, 20)
+
+        assert 437 in keep
+        assert 812 in keep
+
+    def test_small_threshold_returns_everything(self):
+        assert len(lttb_indices(np.arange(100), np.arange(100), 2)) == 100
@@ -0,0 +1,248 @@
+"""
+Unit tests for news_service.py
+"""
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+from services import news_service
+from services.news_service import get_stock_news, get_news_feed, merge_articles, search_news, search_user_news
+from utils.text_index import InvertedIndex
+
+
+def _raw_article(i):
+    return {'content': {'id': f'uuid-{i}', 'title': f'Headline {i}', 'summary': 's',
+                        'canonicalUrl': {'url': f'https://news.example/{i}'},
+                        'provider': {'displayName': 'Wire'}, 'pubDate': '2025-07-28T12:00:00Z',
+                        'contentType': 'STORY'}}
+
+
+@pytest.fixture
+def ticker():
+    news_service._news_cache.clear()
+    mock_ticker = MagicMock()
+    mock_ticker.get_news.side_effect = lambda count, tab: [_raw_article(i) for i in range(count)]
+    with patch.object(news_service.yf, 'Ticker', return_value=mock_ticker), \
+            patch.object(news_service, '_news_index', InvertedIndex()):
+        yield mock_ticker
+        # Background refreshes must not outlive the patches or refill the cleared cache
+        deadline = time.monotonic() + 2
+        while news_service._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+    news_service._news_cache.clear()
+
+
+def _age_entry(key, seconds):
+    stamp, value = news_service._news_cache._data[key]
+    news_service._news_cache._data[key] = (stamp - seconds, value)
+
+
+class TestNewsCache:
+
+    def test_repeat_requests_share_one_fetch(self, ticker):
+        first = get_stock_news('aapl', count=5)
+        second = get_stock_news('AAPL', count=10)
+
+        assert ticker.get_news.call_count == 1
+        assert first['count'] == 5 and second['count'] == 10
+        assert first['articles'][0] == {
+            'title': 'Headline 0', 'summary': 's', 'link': 'https://news.example/0', 'publisher': 'Wire',
+            'published': '2025-07-28T12:00:00Z', 'type': 'STORY', 'uuid': 'uuid-0'
+        }
+
+    def test_concurrent_misses_share_one_fetch_and_release_the_lock(self, ticker):
+        def slow_news(count, tab):
+            time.sleep(0.1)
+            return [_raw_article(i) for i in range(count)]
+        ticker.get_news.side_effect = slow_news
+
+        threads = [threading.Thread(target=get_stock_news, args=('AAPL',)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert ticker.get_news.call_count == 1
+        assert news_service._fetch_locks == {}
+
+    def test_tabs_are_cached_separately(self, ticker):
+        get_stock_news('AAPL', tab='news')
+        get_stock_news('AAPL', tab='press releases')
+
+        assert ticker.get_news.call_count == 2
+
+    def test_larger_count_refetches(self, ticker):
+        get_stock_news('AAPL', count=5)
+        result = get_stock_news('AAPL', count=30)
+
+        assert result['count'] == 30
+        assert ticker.get_news.call_args.kwargs['count'] == 30
+
+    def test_stale_entry_served_while_revalidating(self, ticker):
+        get_stock_news('AAPL')
+        _age_entry(('AAPL', 'news'), news_service.NEWS_FRESH_SECONDS + 1)
+
+        stale = get_stock_news('AAPL')
+        get_stock_news('AAPL')  # a second stale hit doesn't start another refresh
+        time.sleep(0.1)
+
+        assert stale['cache_age_seconds'] > news_service.NEWS_FRESH_SECONDS
+        assert ticker.get_news.call_count == 2
+        assert get_stock_news('AAPL')['cache_age_seconds'] < 1
+
+    def test_failed_refresh_keeps_stale_entry(self, ticker):
+        get_stock_news('AAPL')
+        _age_entry(('AAPL', 'news'), news_service.NEWS_FRESH_SECONDS + 1)
+        ticker.get_news.side_effect = RuntimeError('rate limited')
+
+        get_stock_news('AAPL')
+        time.sleep(0.1)
+        result = get_stock_news('AAPL')
+
+        assert result['count'] == 10
+        assert 'error' not in result
+
+    def test_errors_are_not_cached(self, ticker):
+        ticker.get_news.side_effect = RuntimeError('down')
+        assert get_stock_news('AAPL')['error'] == 'down'
+
+        ticker.get_news.side_effect = lambda count, tab: [_raw_article(0)]
+        assert get_stock_news('AAPL')['count'] == 1
+
+
+def _article(uuid, published):
+    return {'uuid': uuid, 'title': uuid, 'published': published, 'link': f'https://news.example/{uuid}'}
+
+
+class TestMergeArticles:
+
+    def test_merges_newest_first_and_dedupes(self):
+        lists = {
+            'AAPL': [_article('a1', '2025-07-28T10:00:00Z'), _article('shared', '2025-07-28T09:00:00Z')],
+            'MSFT': [_article('m1', '2025-07-28T11:00:00Z'), _article('shared', '2025-07-28T09:00:00Z'),
+                     _article('m2', '2025-07-27T08:00:00Z')],
+        }
+
+        merged, exhausted = merge_articles(lists, 10)
+
+        assert [a['uuid'] for a in merged] == ['m1', 'a1', 'shared', 'm2']
+        assert sorted(merged[2]['symbols']) == ['AAPL', 'MSFT']
+        assert exhausted is True
+
+    def test_limit_reports_more(self):
+        lists = {'AAPL': [_article(f'a{i}', f'2025-07-2{i}T00:00:00Z') for i in range(5)]}
+
+        merged, exhausted = merge_articles(lists, 2)
+
+        assert [a['uuid'] for a in merged] == ['a4', 'a3']
+        assert exhausted is False
+
+    def test_cached_articles_are_not_mutated(self):
+        articles = [_article('a1', '2025-07-28T10:00:00Z')]
+        merge_articles({'AAPL': articles}, 10)
+
+        assert 'symbols' not in articles[0]
+
+
+class TestNewsFeed:
+
+    @pytest.fixture
+    def feed_env(self, ticker):
+        symbols = ['S0', 'S1', 'S2', 'S3', 'S4']
+
+        def slow_news(count, tab):
+            time.sleep(0.2)
+            return [_raw_article(i) for i in range(3)]
+
+        ticker.get_news.side_effect = slow_news
+        with patch.object(news_service, 'get_user_symbols', return_value=symbols[:3]), \
+                patch.object(news_service, 'get_watchlist_symbols', return_value=['S2'] + symbols[3:]):
+            yield ticker
+
+    def test_feed_fans_out_concurrently_and_dedupes(self, feed_env):
+        start = time.perf_counter()
+        feed = get_news_feed('user-1', page_size=10)
+        elapsed = time.perf_counter() - start
+
+        assert feed['symbols'] == ['S0', 'S1', 'S2', 'S3', 'S4']
+        assert elapsed < 0.6
+        # The same three stories under every symbol collapse to three articles
+        assert [a['uuid'] for a in feed['articles']] == ['uuid-0', 'uuid-1', 'uuid-2']
+        assert sorted(feed['articles'][0]['symbols']) == feed['symbols']
+        assert feed['has_more'] is False
+
+    def test_upstream_budget_limits_fetches(self, feed_env):
+        first = get_news_feed('user-1', budget=2)
+        second = get_news_feed('user-1', budget=2)
+
+        assert first['skipped_symbols'] == ['S2', 'S3', 'S4']
+        assert second['skipped_symbols'] == ['S4']
+        assert feed_env.get_news.call_count == 4
+
+    def test_stale_revalidation_shares_the_budget(self, feed_env):
+        get_news_feed('user-1', budget=5)
+        for symbol in ['S0', 'S1', 'S2', 'S3', 'S4']:
+            _age_entry((symbol, 'news'), news_service.NEWS_FRESH_SECONDS + 1)
+        calls = feed_env.get_news.call_count
+
+        feed = get_news_feed('user-1', budget=2)
+        time.sleep(0.4)  # let the background refreshes finish inside the patches
+
+        assert feed_env.get_news.call_count == calls + 2
+        assert feed['stale_symbols'] == ['S2', 'S3', 'S4']
+        assert len(feed['articles']) == 3
+
+    def test_pagination(self, feed_env):
+        page_one = get_news_feed('user-1', page=1, page_size=2)
+        page_two = get_news_feed('user-1', page=2, page_size=2)
+
+        assert [a['uuid'] for a in page_one['articles']] == ['uuid-0', 'uuid-1']
+        assert page_one['has_more'] is True
+        assert [a['uuid'] for a in page_two['articles']] == ['uuid-2']
+        assert page_two['has_more'] is False
+
+    def test_invalid_page(self):
+        with pytest.raises(ValueError):
+            get_news_feed('user-1', page=0)
+
+
+class TestNewsSearch:
+
+    def test_fetched_articles_are_searchable_without_upstream(self, ticker):
+        ticker.get_news.side_effect = lambda count, tab: [
+            {'content': {'id': 'e1', 'title': 'Record quarterly earnings', 'summary': 'Revenue up',
+                         'pubDate': '2025-07-28T12:00:00Z'}},
+            {'content': {'id': 'p1', 'title': 'New product launch', 'summary': 'Earnings impact unclear',
+                         'pubDate': '2025-07-28T13:00:00Z'}},
+        ]
+        get_stock_news('AAPL')
+        ticker.get_news.side_effect = lambda count, tab: [
+            {'content': {'id': 'x1', 'title': 'Refinery earnings fall', 'pubDate': '2025-07-28T12:00:00Z'}}
+        ]
+        get_stock_news('XOM')
+        calls = ticker.get_news.call_count
+
+        results = search_news('earnings', ['AAPL'])
+
+        assert ticker.get_news.call_count == calls
+        assert [a['uuid'] for a in results['articles']] == ['e1', 'p1']
+        assert results['articles'][0]['symbols'] == ['AAPL']
+        assert results['indexed_articles'] == 3
+
+    def test_portfolio_scope_uses_user_symbols(self, ticker):
+        get_stock_news('AAPL')
+        get_stock_news('MSFT')
+
+        with patch.object(news_service, 'get_user_symbols', return_value=['MSFT']), \
+                patch.object(news_service, 'get_watchlist_symbols', return_value=[]):
+            portfolio = search_user_news('user-1', 'headline')
+        everything = search_user_news('user-1', 'headline', scope='all')
+
+        assert portfolio['symbols'] == ['MSFT']
+        assert all(a['symbols'] == ['AAPL', 'MSFT'] for a in everything['articles'])
+        assert portfolio['count'] == everything['count'] == news_service.NEWS_FETCH_COUNT
+
+    def test_empty_query_rejected(self):
+        with pytest.raises(ValueError, match='required'):
+            search_news('  ')
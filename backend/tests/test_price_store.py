@@ -0,0 +1,143 @@
+"""
+Unit tests for utils/price_store.py and the market_service price history readers
+"""
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from utils.price_store import PriceStore, BAR_DTYPE, total_return_closes, as_traded_closes
+from services import market_service
+
+
+def _bars(start, end):
+    dates = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + np.timedelta64(1, 'D'))
+    dates = dates[np.is_busday(dates)]
+    bars = np.zeros(len(dates), dtype=BAR_DTYPE)
+    bars['date'] = dates
+    bars['close'] = 100 + np.arange(len(dates))
+    return bars
+
+
+class FakeProvider:
+    """Serves bars for any range and records each request"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbol, start, end):
+        self.calls.append((symbol, start, end))
+        return _bars(start, end)
+
+
+class TestPriceStore:
+
+    def test_only_missing_days_are_fetched(self, tmp_path):
+        store = PriceStore(str(tmp_path))
+        provider = FakeProvider()
+
+        store.ensure('AAPL', '2025-03-03', '2025-03-07', provider)
+        store.ensure('AAPL', '2025-03-03', '2025-03-07', provider)
+        store.ensure('AAPL', '2025-03-04', '2025-03-14', provider)
+
+        assert provider.calls == [('AAPL', '2025-03-03', '2025-03-07'), ('AAPL', '2025-03-08', '2025-03-14')]
+        dates = store.read('AAPL')['date']
+        assert len(dates) == 10
+        assert np.all(np.diff(dates) > np.timedelta64(0, 'D'))
+
+    def test_earlier_start_refetches_whole_range(self, tmp_path):
+        store = PriceStore(str(tmp_path))
+        provider = FakeProvider()
+
+        store.ensure('MSFT', '2025-03-10', '2025-03-14', provider)
+        store.ensure('MSFT', '2025-03-03', '2025-03-14', provider)
+
+        assert provider.calls[-1] == ('MSFT', '2025-03-03', '2025-03-14')
+        assert len(store.read('MSFT')) == 10
+        assert str(store.read('MSFT')['date'][0]) == '2025-03-03'
+        assert store.coverage('MSFT') == (np.datetime64('2025-03-03'), np.datetime64('2025-03-14'))
+
+    def test_read_range_is_a_memmap_view(self, tmp_path):
+        store = PriceStore(str(tmp_path))
+        store.ensure('SPY', '2025-03-03', '2025-03-14', FakeProvider())
+
+        window = store.read_range('SPY', '2025-03-05', '2025-03-11')
+
+        assert isinstance(window, np.memmap)
+        assert [str(d) for d in window['date']] == ['2025-03-05', '2025-03-06', '2025-03-07', '2025-03-10', '2025-03-11']
+
+    def test_failed_fetch_does_not_advance_coverage(self, tmp_path):
+        store = PriceStore(str(tmp_path))
+        store.ensure('QQQ', '2025-03-03', '2025-03-07', FakeProvider())
+
+        def failing(symbol, start, end):
+            raise Exception("rate limited")
+
+        with pytest.raises(Exception):
+            store.ensure('QQQ', '2025-03-03', '2025-03-14', failing)
+
+        assert store.coverage('QQQ')[1] == np.datetime64('2025-03-07')
+
+    def test_empty_fetch_does_not_advance_coverage(self, tmp_path):
+        store = PriceStore(str(tmp_path))
+        provider = FakeProvider()
+        store.ensure('QQQ', '2025-03-03', '2025-03-07', provider)
+
+        # Transient provider errors come back as an empty frame
+        store.ensure('QQQ', '2025-03-03', '2025-03-14', lambda symbol, start, end: _bars(start, start)[:0])
+        assert store.coverage('QQQ')[1] == np.datetime64('2025-03-07')
+
+        # A weekend-only range legitimately has no bars
+        store.ensure('QQQ', '2025-03-03', '2025-03-09', lambda symbol, start, end: _bars(start, start)[:0])
+        assert store.coverage('QQQ')[1] == np.datetime64('2025-03-09')
+
+        store.ensure('QQQ', '2025-03-03', '2025-03-14', provider)
+        assert provider.calls[-1] == ('QQQ', '2025-03-10', '2025-03-14')
+        assert len(store.read('QQQ')) == 10
+
+    def test_new_split_refetches_history(self, tmp_path):
+        store = PriceStore(str(tmp_path))
+        store.ensure('NVDA', '2025-03-03', '2025-03-07', FakeProvider())
+
+        def after_split(symbol, start, end):
+            bars = _bars(start, end)
+            bars['close'] /= 2
+            bars['split'][bars['date'] == np.datetime64('2025-03-10')] = 2.0
+            return bars
+
+        store.ensure('NVDA', '2025-03-03', '2025-03-14', after_split)
+
+        # Bars stored before the split are replaced by the re-based download
+        assert store.read('NVDA')['close'][0] == 50.0
+        assert as_traded_closes(store.read('NVDA'))[[0, 5]].tolist() == [100.0, 52.5]
+
+    def test_dividends_adjust_earlier_closes(self):
+        bars = np.zeros(3, dtype=BAR_DTYPE)
+        bars['close'] = [100.0, 100.0, 99.0]
+        bars['dividend'] = [0.0, 0.0, 2.0]
+
+        assert total_return_closes(bars).tolist() == [98.0, 98.0, 99.0]
+        assert as_traded_closes(bars).tolist() == [100.0, 100.0, 99.0]
+
+    def test_missing_symbol_reads_empty(self, tmp_path):
+        assert len(PriceStore(str(tmp_path)).read_range('NONE', '2025-01-01')) == 0
+
+
+class TestMarketServicePriceHistory:
+
+    def test_history_and_matrix_read_through_store(self, tmp_path):
+        store = PriceStore(str(tmp_path))
+        provider = FakeProvider()
+
+        with patch.object(market_service, 'get_price_store', return_value=store), \
+                patch.object(market_service, '_download_bars', side_effect=provider):
+            dates, closes = market_service.get_price_history('aapl', '2025-03-03', '2025-03-07')
+            calendar, matrix = market_service.get_close_price_matrix(['AAPL', 'MSFT'], '2025-03-08', '2025-03-10')
+
+        assert closes.tolist() == [100, 101, 102, 103, 104]
+        assert calendar.astype(str).tolist() == ['2025-03-08', '2025-03-09', '2025-03-10']
+        # Weekend carries Friday's close; the earlier start refetched AAPL's range once
+        assert matrix[:2, 0].tolist() == [104.0, 104.0]
+        assert [call for call in provider.calls if call[0] == 'AAPL'] == [
+            ('AAPL', '2025-03-03', '2025-03-07'),
+            ('AAPL', '2025-03-01', '2025-03-10'),
+        ]
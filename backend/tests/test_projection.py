@@ -0,0 +1,76 @@
+"""
+Unit tests for the Monte Carlo projection engine in analytics_service.py
+"""
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from services import analytics_service
+from services.analytics_service import simulate_growth, project_portfolio
+
+
+HOLDINGS = [
+    {'symbol': 'CASH', 'quantity': 1000.0, 'market_value': 1000.0},
+    {'symbol': 'AAPL', 'quantity': 10.0, 'market_value': 3000.0},
+]
+
+
+def _price_matrix(symbols, start_date, end_date=None):
+    dates = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + np.timedelta64(1, 'D'))
+    rng = np.random.default_rng(3)
+    closes = 100 * np.cumprod(1 + rng.normal(0.0005, 0.015, (len(dates), len(symbols))), axis=0)
+    return dates, closes
+
+
+class TestSimulation:
+
+    def test_constant_returns_compound_exactly(self):
+        growth = simulate_growth(np.full(50, 0.01), paths=10, horizon=5, seed=0)
+
+        assert growth.shape == (10, 5)
+        assert np.allclose(growth[:, -1], 1.01 ** 5)
+
+    def test_seeded_runs_match_across_chunking_modes(self):
+        returns = np.random.default_rng(0).normal(0, 0.01, 300)
+        with patch.object(analytics_service, 'PROJECTION_CHUNK_PATHS', 100):
+            serial = simulate_growth(returns, 450, 30, 'parametric', seed=42, parallel=False)
+            pooled = simulate_growth(returns, 450, 30, 'parametric', seed=42, parallel=True)
+
+        assert np.allclose(serial, pooled)
+
+
+class TestProjection:
+
+    def setup_method(self):
+        analytics_service._projection_cache.clear()
+
+    def test_percentile_bands_and_cash_dampening(self):
+        with patch.object(analytics_service, 'get_close_price_matrix', side_effect=_price_matrix):
+            result = project_portfolio(HOLDINGS, horizon_days=60, paths=2000, seed=1)
+
+        bands = result['percentiles']
+        assert result['start_value'] == 4000.0
+        assert len(result['dates']) == len(bands['p50']) == 61
+        assert all(lo <= hi for lo, hi in zip(bands['p5'], bands['p95']))
+        assert bands['p5'][-1] < result['final_value']['p50'] < bands['p95'][-1]
+        assert 0 < result['probability_of_loss_percent'] < 100
+
+    def test_budget_caps_paths(self):
+        with patch.object(analytics_service, 'get_close_price_matrix', side_effect=_price_matrix), \
+                patch.object(analytics_service, 'PROJECTION_MAX_STEPS', 10_000):
+            result = project_portfolio(HOLDINGS, horizon_days=100, paths=5000, seed=1)
+
+        assert result['paths'] == 100
+        assert result['budget_limited'] is True
+
+    def test_repeat_views_hit_the_cache(self):
+        with patch.object(analytics_service, 'get_close_price_matrix', side_effect=_price_matrix) as load:
+            first = project_portfolio(HOLDINGS, horizon_days=20, paths=500)
+            second = project_portfolio(list(reversed(HOLDINGS)), horizon_days=20, paths=500)
+
+        assert load.call_count == 1
+        assert first is second
+
+    def test_unknown_method(self):
+        with pytest.raises(ValueError):
+            project_portfolio(HOLDINGS, method='garch')
@@ -0,0 +1,124 @@
+"""
+Unit tests for rebalance_service.py
+"""
+import time
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from services import rebalance_service
+from services.rebalance_service import compute_rebalance, expand_sector_targets, calculate_rebalance
+
+
+def _holding(symbol, quantity, price, sector=None):
+    return {'symbol': symbol, 'quantity': quantity, 'current_price': price,
+            'market_value': quantity * price, 'sector': sector}
+
+
+HOLDINGS = [
+    _holding('CASH', 1000.0, 1.0),
+    _holding('AAPL', 30.0, 100.0, 'Technology'),
+    _holding('MSFT', 10.0, 200.0, 'Technology'),
+    _holding('XOM', 40.0, 25.0, 'Energy'),
+]
+
+
+def _rebalance(targets, **kwargs):
+    with patch.object(rebalance_service, 'get_portfolio_valuation', return_value={'holdings': HOLDINGS}), \
+            patch.object(rebalance_service, 'get_cached_price', return_value={'current_price': 50.0}):
+        return calculate_rebalance('user-1', targets, **kwargs)
+
+
+class TestComputeRebalance:
+
+    def test_reaches_targets_in_whole_lots(self):
+        result = compute_rebalance(
+            ['A', 'B'], np.array([10.0, 0.0]), np.array([10.0, 30.0]), 100.0, np.array([0.25, 0.5])
+        )
+
+        # 200 total: A 50 -> sell 5; B 100 -> buy 3 (90), truncated rather than overshooting
+        assert result['shares'].tolist() == [-5.0, 3.0]
+        assert result['cash_after'] == pytest.approx(60.0)
+
+    def test_band_leaves_small_drift_alone(self):
+        result = compute_rebalance(
+            ['A', 'B'], np.array([51.0, 49.0]), np.array([1.0, 1.0]), 0.0, np.array([0.5, 0.5]), band=0.02
+        )
+
+        assert result['shares'].tolist() == [0.0, 0.0]
+
+    def test_cash_constraint_scales_buys(self):
+        result = compute_rebalance(
+            ['A', 'B'], np.array([0.0, 0.0]), np.array([10.0, 10.0]), 100.0, np.array([0.5, 0.5]), min_cash=40.0
+        )
+
+        assert result['cash_limited'] is True
+        assert result['shares'].tolist() == [3.0, 3.0]
+        assert result['cash_after'] >= 40.0
+
+    def test_never_sells_more_than_held(self):
+        result = compute_rebalance(['A'], np.array([2.5]), np.array([10.0]), 0.0, np.array([0.0]), lot_sizes=np.array([0.0]))
+
+        assert result['shares'].tolist() == [-2.5]
+
+    def test_sector_targets_split_pro_rata(self):
+        weights = expand_sector_targets({'Tech': 0.6}, ['A', 'B', 'C'], ['Tech', 'Tech', 'Energy'],
+                                        np.array([300.0, 100.0, 100.0]))
+
+        assert weights.tolist() == pytest.approx([0.45, 0.15, 0.0])
+
+    def test_few_hundred_positions_is_interactive(self):
+        n = 500
+        rng = np.random.default_rng(0)
+        args = (list(range(n)), rng.integers(1, 100, n).astype(float), rng.uniform(5, 500, n), 10000.0, np.full(n, 1 / n))
+        compute_rebalance(*args)
+
+        started = time.perf_counter()
+        compute_rebalance(*args, band=0.001)
+        assert time.perf_counter() - started < 0.01
+
+
+class TestCalculateRebalance:
+
+    def test_symbol_targets_with_new_position(self):
+        result = _rebalance({'AAPL': 0.3, 'MSFT': 0.2, 'VTI': 0.4})
+
+        trades = {t['symbol']: t for t in result['trades']}
+        assert result['total_value'] == 7000.0
+        assert trades['XOM']['action'] == 'SELL' and trades['XOM']['quantity'] == 40.0
+        assert trades['AAPL']['action'] == 'SELL' and trades['AAPL']['quantity'] == 9.0
+        assert trades['VTI']['action'] == 'BUY' and trades['VTI']['quantity'] == 56.0
+        assert trades['MSFT']['action'] == 'SELL' and trades['MSFT']['quantity'] == 3.0
+        assert result['trades'][0]['action'] == 'SELL'
+        assert result['cash_after'] >= 0
+
+    def test_sector_targets(self):
+        result = _rebalance({'Technology': 0.5, 'Energy': 0.5}, target_type='sector')
+
+        trades = {t['symbol']: t for t in result['trades']}
+        assert trades['XOM']['action'] == 'BUY'
+        assert trades['AAPL']['action'] == 'SELL'
+
+    def test_invalid_targets(self):
+        with pytest.raises(ValueError):
+            _rebalance({'AAPL': 0.8, 'MSFT': 0.4})
+        with pytest.raises(ValueError):
+            _rebalance({'AAPL': 0.5}, target_type='country')
+
+    def test_unmatched_sector_targets_are_reported(self):
+        result = _rebalance({'Technology': 0.5, 'Utilities': 0.3}, target_type='sector')
+
+        assert result['unmatched_targets'] == ['Utilities']
+        assert result['target_cash_percent'] == 50.0
+
+    def test_lot_size_keys_are_normalised(self):
+        result = _rebalance({'AAPL': 0.3, 'MSFT': 0.2, 'VTI': 0.4}, lot_size={'vti': 10})
+
+        trades = {t['symbol']: t for t in result['trades']}
+        assert trades['VTI']['quantity'] == 50.0
+
+    def test_negative_lot_size_rejected(self):
+        with pytest.raises(ValueError):
+            _rebalance({'AAPL': 0.5}, lot_size=-1)
+        with pytest.raises(ValueError):
+            _rebalance({'AAPL': 0.5}, lot_size={'AAPL': -5})
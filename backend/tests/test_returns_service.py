@@ -0,0 +1,107 @@
+"""
+Unit tests for returns_service.py
+"""
+import numpy as np
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from services.market_service import get_portfolio_value_history
+from services.returns_service import (
+    align_cash_flows, time_weighted_return, xirr,
+    calculate_returns, invalidate_returns_cache
+)
+
+
+def _days_ago(n):
+    return (datetime.now(timezone.utc) - timedelta(days=n)).strftime('%Y-%m-%d')
+
+
+class TestReturnMath:
+
+    def test_twr_ignores_deposits(self):
+        # 10% gain, then a 1000 deposit with no market move, then another 10% gain
+        values = np.array([1000.0, 1100.0, 2100.0, 2310.0])
+        flows = np.array([0.0, 0.0, 1000.0, 0.0])
+
+        assert time_weighted_return(values, flows) == pytest.approx(0.21)
+
+    def test_twr_without_flows_is_simple_return(self):
+        values = np.array([100.0, 90.0, 120.0])
+
+        assert time_weighted_return(values, np.zeros(3)) == pytest.approx(0.2)
+
+    def test_twr_skips_empty_starting_periods(self):
+        values = np.array([0.0, 500.0, 550.0])
+        flows = np.array([0.0, 500.0, 0.0])
+
+        assert time_weighted_return(values, flows) == pytest.approx(0.1)
+
+    def test_xirr_single_period(self):
+        # Invest 1000, receive 1100 exactly one year later
+        assert xirr(np.array([0, 365]), np.array([-1000.0, 1100.0])) == pytest.approx(0.1)
+
+    def test_xirr_with_intermediate_deposit(self):
+        offsets = np.array([0, 182, 365])
+        amounts = np.array([-1000.0, -1000.0, 2150.0])
+        rate = xirr(offsets, amounts)
+
+        years = offsets / 365.0
+        assert np.sum(amounts * (1 + rate) ** -years) == pytest.approx(0, abs=1e-5)
+
+    def test_xirr_handles_losses(self):
+        assert xirr(np.array([0, 365]), np.array([-1000.0, 500.0])) == pytest.approx(-0.5)
+
+    def test_xirr_requires_sign_change(self):
+        assert xirr(np.array([0, 365]), np.array([-1000.0, -50.0])) is None
+
+    def test_align_cash_flows_to_next_snapshot(self):
+        snapshots = np.array(['2025-01-01', '2025-01-03', '2025-01-05'], dtype='datetime64[D]')
+        flow_dates = np.array(['2025-01-01', '2025-01-02', '2025-01-03', '2025-01-09'], dtype='datetime64[D]')
+        amounts = np.array([50.0, 100.0, -30.0, 999.0])
+
+        aligned = align_cash_flows(snapshots, flow_dates, amounts)
+
+        assert aligned.tolist() == [0.0, 70.0, 0.0]
+
+
+class TestCalculateReturns:
+
+    def _seed(self, client, user_id):
+        for days_ago, value in [(10, 1000.0), (5, 2100.0), (0, 2310.0)]:
+            client.table('portfolio_snapshots').insert({
+                'user_id': user_id, 'date': _days_ago(days_ago), 'total_value': value
+            }).execute()
+        client.table('transactions').insert({
+            'user_id': user_id, 'symbol': 'CASH', 'transaction_type': 'DEPOSIT',
+            'total_amount': 1000.0, 'transaction_date': f"{_days_ago(6)}T12:00:00+00:00"
+        }).execute()
+
+    def test_calculate_returns_from_snapshots_and_flows(self, fake_supabase):
+        self._seed(fake_supabase, 'user-a')
+
+        result = calculate_returns('user-a', 30)
+
+        assert result['time_weighted_return_percent'] == pytest.approx(21.0)
+        assert result['net_cash_flow'] == pytest.approx(1000.0)
+        assert result['money_weighted_return_percent'] > 0
+        invalidate_returns_cache('user-a')
+
+    def test_calculate_returns_insufficient_data(self, fake_supabase):
+        result = calculate_returns('nobody', 30)
+
+        assert result['insufficient_data'] is True
+
+    def test_results_cached_until_invalidated(self, fake_supabase):
+        self._seed(fake_supabase, 'user-b')
+
+        with patch('services.returns_service.get_portfolio_value_history',
+                   wraps=get_portfolio_value_history) as history:
+            calculate_returns('user-b', 30)
+            calculate_returns('user-b', 30)
+            assert history.call_count == 1
+
+            invalidate_returns_cache('user-b')
+            calculate_returns('user-b', 30)
+            assert history.call_count == 2
+        invalidate_returns_cache('user-b')
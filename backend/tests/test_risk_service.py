@@ -0,0 +1,86 @@
+"""
+Unit tests for risk_service.py
+"""
+import time
+import numpy as np
+import pytest
+
+from services.risk_service import (
+    annualization_factor, max_drawdown, rolling_volatility, compute_risk_metrics
+)
+from services.market_service import align_closes
+
+
+def _daily_dates(n, start='2015-01-01'):
+    return np.datetime64(start) + np.arange(n).astype('timedelta64[D]')
+
+
+class TestRiskMath:
+
+    def test_annualization_factor_daily_and_weekly(self):
+        assert annualization_factor(_daily_dates(10)) == pytest.approx(365.25)
+        weekly = np.datetime64('2024-01-01') + (np.arange(10) * 7).astype('timedelta64[D]')
+        assert annualization_factor(weekly) == pytest.approx(365.25 / 7)
+
+    def test_max_drawdown_dates(self):
+        dates = _daily_dates(6)
+        wealth = np.array([1.0, 1.2, 0.9, 0.6, 1.0, 1.3])
+
+        result = max_drawdown(dates, wealth)
+
+        assert result['max_drawdown_percent'] == pytest.approx(-50.0)
+        assert result['peak_date'] == str(dates[1])
+        assert result['trough_date'] == str(dates[3])
+        assert result['recovery_date'] == str(dates[5])
+
+    def test_rolling_volatility_matches_naive(self):
+        rng = np.random.default_rng(0)
+        returns = rng.normal(0, 0.01, 100)
+
+        rolling = rolling_volatility(returns, 20, 252)
+        naive = np.array([returns[i:i + 20].std(ddof=1) for i in range(81)]) * np.sqrt(252)
+
+        assert np.allclose(rolling, naive)
+
+    def test_align_benchmark_forward_fills(self):
+        dates = np.array(['2025-01-04', '2025-01-06', '2025-01-07'], dtype='datetime64[D]')
+        bench_dates = np.array(['2025-01-03', '2025-01-06'], dtype='datetime64[D]')
+
+        aligned = align_closes(dates, bench_dates, np.array([100.0, 110.0]))
+
+        assert aligned.tolist() == [100.0, 110.0, 110.0]
+
+    def test_beta_of_levered_benchmark(self):
+        rng = np.random.default_rng(1)
+        bench_returns = rng.normal(0.0005, 0.01, 500)
+        benchmark = 100 * np.concatenate(([1.0], np.cumprod(1 + bench_returns)))
+        values = 1000 * np.concatenate(([1.0], np.cumprod(1 + 2 * bench_returns)))
+
+        metrics = compute_risk_metrics(_daily_dates(501), values, np.zeros(501), benchmark)
+
+        assert metrics['beta'] == pytest.approx(2.0, abs=1e-3)
+        assert metrics['correlation'] == pytest.approx(1.0, abs=1e-3)
+
+    def test_deposits_do_not_count_as_returns(self):
+        values = np.array([1000.0, 1000.0, 2000.0, 2000.0])
+        flows = np.array([0.0, 0.0, 1000.0, 0.0])
+
+        metrics = compute_risk_metrics(_daily_dates(4), values, flows)
+
+        assert metrics['annualized_volatility_percent'] == 0.0
+        assert metrics['max_drawdown']['max_drawdown_percent'] == 0.0
+
+    def test_ten_year_daily_series_is_fast(self):
+        rng = np.random.default_rng(2)
+        n = 3650
+        values = 10000 * np.cumprod(1 + rng.normal(0.0003, 0.01, n))
+        benchmark = 400 * np.cumprod(1 + rng.normal(0.0003, 0.01, n))
+        dates = _daily_dates(n)
+        compute_risk_metrics(dates, values, np.zeros(n), benchmark)
+
+        start = time.perf_counter()
+        metrics = compute_risk_metrics(dates, values, np.zeros(n), benchmark, 0.04, 21)
+        elapsed = time.perf_counter() - start
+
+        assert metrics['observations'] == n - 1
+        assert elapsed < 0.05
@@ -0,0 +1,70 @@
+"""
+Unit tests for utils/session_store.py
+"""
+import os
+import time
+
+from utils.session_store import SessionStore, message_size
+
+
+def _message(role, content):
+    return {'role': role, 'content': content}
+
+
+class TestSessionStore:
+
+    def test_history_is_capped(self):
+        store = SessionStore(max_history=4)
+        for i in range(5):
+            store.append('u1', _message('user', f'q{i}'), _message('model', f'a{i}'))
+
+        history = store.get('u1')
+        assert [m['content'] for m in history] == ['q3', 'a3', 'q4', 'a4']
+        assert store.stats()['bytes'] == sum(message_size(m) for m in history)
+
+    def test_least_recently_used_is_evicted(self):
+        store = SessionStore(max_sessions=2)
+        store.append('u1', _message('user', 'one'))
+        store.append('u2', _message('user', 'two'))
+        store.get('u1')
+        store.append('u3', _message('user', 'three'))
+
+        assert store.get('u2') == []
+        assert [m['content'] for m in store.get('u1')] == ['one']
+        assert store.stats()['evictions'] == 1
+
+    def test_byte_budget_evicts_others_first(self):
+        store = SessionStore(max_bytes=3 * message_size(_message('model', 'x' * 100)))
+        store.append('u1', _message('user', 'x' * 100))
+        store.append('u2', _message('user', 'x' * 100), _message('model', 'x' * 100))
+        store.append('u2', _message('user', 'x' * 100))
+
+        assert len(store) == 1
+        assert len(store.get('u2')) == 3
+        assert store.stats()['bytes'] <= store.max_bytes
+
+    def test_idle_sessions_expire(self):
+        store = SessionStore(idle_timeout=0.05)
+        store.append('u1', _message('user', 'hi'))
+        time.sleep(0.1)
+
+        assert store.get('u1') == []
+        assert store.stats()['sessions'] == 0
+
+    def test_evicted_session_resumes_from_disk(self, tmp_path):
+        store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+        store.append('u1', _message('user', 'remember me'))
+        store.append('u2', _message('user', 'hi'))
+
+        assert len(os.listdir(tmp_path)) == 1
+        assert [m['content'] for m in store.get('u1')] == ['remember me']
+        assert store.stats()['resumed'] == 1
+
+    def test_clear_removes_spilled_copy(self, tmp_path):
+        store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+        store.append('u1', _message('user', 'secret'))
+        store.append('u2', _message('user', 'hi'))
+
+        assert store.clear('u1') is False
+        assert os.listdir(tmp_path) == []
+        assert store.get('u1') == []
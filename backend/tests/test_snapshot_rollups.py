@@ -0,0 +1,81 @@
+"""
+Unit tests for weekly/monthly snapshot rollups in market_service.py
+"""
+import pytest
+from datetime import datetime, timedelta
+
+from services.market_service import (
+    store_portfolio_snapshot, get_portfolio_value_history,
+    choose_snapshot_resolution, get_rollup_period_start, get_rollup_period_end
+)
+
+
+def _rollup(client, resolution, period_start):
+    return next(r for r in client.rows('portfolio_snapshot_rollups')
+                if r['resolution'] == resolution and r['period_start'] == period_start)
+
+
+class TestSnapshotRollups:
+
+    def test_period_start(self):
+        assert get_rollup_period_start('2025-07-31', 'WEEK') == '2025-07-28'
+        assert get_rollup_period_start('2025-07-31', 'MONTH') == '2025-07-01'
+        assert get_rollup_period_end('2025-07-28', 'WEEK') == '2025-08-03'
+        assert get_rollup_period_end('2024-02-01', 'MONTH') == '2024-02-29'
+
+    def test_choose_resolution(self):
+        assert choose_snapshot_resolution(3650, None) == 'DAY'
+        assert choose_snapshot_resolution(365, 400) == 'DAY'
+        assert choose_snapshot_resolution(3650, 400) == 'WEEK'
+        assert choose_snapshot_resolution(3650, 100) == 'MONTH'
+
+    def test_rollups_track_ohlc(self, fake_supabase):
+        for date, value in [('2025-07-29', 100.0), ('2025-07-28', 90.0),
+                            ('2025-07-30', 130.0), ('2025-07-31', 80.0), ('2025-08-01', 110.0)]:
+            store_portfolio_snapshot('user-a', value, date)
+
+        week = _rollup(fake_supabase, 'WEEK', '2025-07-28')
+        assert (week['open_date'], week['open_value']) == ('2025-07-28', 90.0)
+        assert (week['close_date'], week['close_value']) == ('2025-08-01', 110.0)
+        assert week['high_value'] == 130.0
+        assert week['low_value'] == 80.0
+
+        july = _rollup(fake_supabase, 'MONTH', '2025-07-01')
+        assert july['close_value'] == 80.0
+        august = _rollup(fake_supabase, 'MONTH', '2025-08-01')
+        assert august['open_value'] == august['close_value'] == 110.0
+
+    def test_resnapshot_same_day_replaces_high_and_low(self, fake_supabase):
+        store_portfolio_snapshot('user-a', 100.0, '2025-07-28')
+        store_portfolio_snapshot('user-a', 150.0, '2025-07-29')
+        # Intraday re-snapshot of the same day with a lower value
+        store_portfolio_snapshot('user-a', 70.0, '2025-07-29')
+        store_portfolio_snapshot('user-a', 120.0, '2025-07-29')
+
+        for resolution, period_start in (('WEEK', '2025-07-28'), ('MONTH', '2025-07-01')):
+            rollup = _rollup(fake_supabase, resolution, period_start)
+            assert rollup['high_value'] == 120.0
+            assert rollup['low_value'] == 100.0
+            assert (rollup['open_value'], rollup['close_value']) == (100.0, 120.0)
+
+    def test_long_history_reads_rollups(self, fake_supabase):
+        today = datetime.now().date()
+        for offset in range(0, 1400):
+            date = (today - timedelta(days=offset)).isoformat()
+            store_portfolio_snapshot('user-b', 1000.0 + offset, date)
+
+        history = get_portfolio_value_history('user-b', 3650, max_points=150)
+
+        assert history['resolution'] == 'WEEK'
+        assert len(history['chart_data']) == 150
+        assert history['chart_data'][-1]['total_value'] == pytest.approx(1000.0)
+
+    def test_short_history_falls_back_to_daily(self, fake_supabase):
+        today = datetime.now().date()
+        for offset in range(0, 20):
+            store_portfolio_snapshot('user-c', 500.0, (today - timedelta(days=offset)).isoformat())
+
+        history = get_portfolio_value_history('user-c', 3650, max_points=100)
+
+        assert history['resolution'] == 'DAY'
+        assert history['original_points'] == 20
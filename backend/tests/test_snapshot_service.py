@@ -0,0 +1,100 @@
+"""
+Unit tests for snapshot_service.py
+"""
+import pytest
+
+from services.market_service import store_portfolio_snapshot
+from services.snapshot_service import value_holdings, run_batch_snapshot
+
+
+def _seed(client, users=5):
+    client.table('market_prices').insert({'symbol': 'AAPL', 'current_price': 200.0}).execute()
+    client.table('market_prices').insert({'symbol': 'MSFT', 'current_price': 400.0}).execute()
+    for i in range(users):
+        user_id = f'user-{i}'
+        client.table('holdings').insert({'user_id': user_id, 'symbol': 'CASH', 'quantity': 100.0 * i}).execute()
+        client.table('holdings').insert({'user_id': user_id, 'symbol': 'AAPL', 'quantity': 1.0}).execute()
+        client.table('holdings').insert({'user_id': user_id, 'symbol': 'MSFT', 'quantity': 0.5}).execute()
+
+
+def _snapshot_values(client, date):
+    return {r['user_id']: r['total_value'] for r in client.rows('portfolio_snapshots') if r['date'] == date}
+
+
+class TestSnapshotService:
+
+    def test_value_holdings_groups_by_user(self):
+        holdings = [
+            {'user_id': 'a', 'symbol': 'CASH', 'quantity': 50},
+            {'user_id': 'b', 'symbol': 'AAPL', 'quantity': 2},
+            {'user_id': 'a', 'symbol': 'AAPL', 'quantity': 1},
+            {'user_id': 'b', 'symbol': 'XYZ', 'quantity': 10},
+        ]
+
+        user_ids, totals, missing = value_holdings(holdings, {'CASH': 1.0, 'AAPL': 10.0})
+
+        assert dict(zip(user_ids.tolist(), totals.tolist())) == {'a': 60.0, 'b': 20.0}
+        assert missing == ['XYZ']
+
+    def test_batch_writes_every_user(self, fake_supabase):
+        _seed(fake_supabase)
+
+        report = run_batch_snapshot('2025-07-28', chunk_size=2)
+
+        values = _snapshot_values(fake_supabase, '2025-07-28')
+        assert report['snapshots_written'] == 5
+        assert values['user-3'] == pytest.approx(300.0 + 200.0 + 200.0)
+        assert len([r for r in fake_supabase.rows('portfolio_snapshot_rollups') if r['resolution'] == 'WEEK']) == 5
+
+    def test_batch_resumes_after_failed_chunk(self, fake_supabase):
+        _seed(fake_supabase)
+        original_table = fake_supabase.table
+        failures = {'left': 1}
+
+        def flaky_table(name):
+            query = original_table(name)
+            if name == 'portfolio_snapshots':
+                execute = query.execute
+
+                def maybe_fail():
+                    if query.action == 'upsert' and failures['left']:
+                        failures['left'] -= 1
+                        raise Exception("connection reset")
+                    return execute()
+                query.execute = maybe_fail
+            return query
+
+        fake_supabase.table = flaky_table
+        first = run_batch_snapshot('2025-07-28', chunk_size=2)
+        fake_supabase.table = original_table
+        second = run_batch_snapshot('2025-07-28', chunk_size=2)
+
+        assert first['snapshots_written'] == 3
+        assert len(first['failed_users']) == 2
+        assert second['skipped_existing'] == 3
+        assert second['snapshots_written'] == 2
+        assert len(_snapshot_values(fake_supabase, '2025-07-28')) == 5
+
+    def test_resume_rewrites_intraday_api_snapshots(self, fake_supabase):
+        _seed(fake_supabase, users=2)
+        # An intraday snapshot taken through the API (default source)
+        fake_supabase.table('portfolio_snapshots').insert(
+            {'user_id': 'user-1', 'date': '2025-07-28', 'total_value': 1.0, 'source': 'api'}
+        ).execute()
+
+        first = run_batch_snapshot('2025-07-28')
+        second = run_batch_snapshot('2025-07-28')
+
+        assert first['snapshots_written'] == 2
+        assert _snapshot_values(fake_supabase, '2025-07-28')['user-1'] == pytest.approx(100.0 + 200.0 + 200.0)
+        assert second['skipped_existing'] == 2
+
+    def test_api_snapshot_over_batch_row_is_rewritten_on_resume(self, fake_supabase):
+        _seed(fake_supabase, users=2)
+        run_batch_snapshot('2025-07-28')
+        store_portfolio_snapshot('user-1', 1.0, '2025-07-28')
+
+        rerun = run_batch_snapshot('2025-07-28')
+
+        assert rerun['skipped_existing'] == 1
+        assert _snapshot_values(fake_supabase, '2025-07-28')['user-1'] == pytest.approx(100.0 + 200.0 + 200.0)
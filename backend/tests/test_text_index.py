@@ -0,0 +1,52 @@
+"""
+Unit tests for the in-memory inverted index
+"""
+import time
+
+from utils.text_index import InvertedIndex, tokenize
+
+
+def _index(**kwargs):
+    index = InvertedIndex(**kwargs)
+    now = time.time()
+    index.add('1', [('Apple earnings beat estimates', 2), ('iPhone sales strong', 1)], ('AAPL',), now - 30, 'apple')
+    index.add('2', [('Microsoft cloud growth', 2), ('Azure earnings in line', 1)], ('MSFT',), now - 20, 'msft')
+    index.add('3', [('Oil prices slide', 2), ('Energy stocks fall', 1)], ('XOM',), now - 10, 'xom')
+    return index
+
+
+class TestInvertedIndex:
+
+    def test_tokenize(self):
+        assert tokenize("Apple's Q3 earnings: the BEST yet!") == ['apple', 'q3', 'earnings', 'best', 'yet']
+
+    def test_ranked_search_prefers_title_matches(self):
+        results = _index().search('earnings')
+
+        assert [payload for _, payload, _ in results] == ['apple', 'msft']
+        assert results[0][0] > results[1][0]
+
+    def test_tag_filter(self):
+        results = _index().search('earnings', tags={'MSFT', 'XOM'})
+
+        assert [payload for _, payload, _ in results] == ['msft']
+
+    def test_readding_merges_tags(self):
+        index = _index()
+        assert index.add('3', [('Oil prices slide', 2)], ('CVX',)) is False
+
+        _, _, tags = index.search('oil')[0]
+        assert tags == ['CVX', 'XOM']
+        assert len(index) == 3
+
+    def test_age_and_size_bounds(self):
+        index = _index(max_age_seconds=3600, max_docs=2)
+        assert len(index) == 2
+        assert index.search('apple') == []
+
+        index.add('old', [('Ancient apple news', 1)], ('AAPL',), time.time() - 7200, 'old')
+        assert index.search('ancient') == []
+        assert index.stats()['documents'] == 2
+
+    def test_no_terms_no_results(self):
+        assert _index().search('the and of') == []
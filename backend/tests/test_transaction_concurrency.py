@@ -0,0 +1,125 @@
+"""
+Concurrency tests for per-user transaction serialization
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pytest
+
+from services.transaction_service import (
+    process_transaction, process_cash_deposit, get_user_cash_balance
+)
+from utils.locks import user_lock, active_user_lock_count
+
+
+def _seed_user(client, user_id, cash=10000.0, holdings=None):
+    client.table('holdings').insert({
+        'user_id': user_id, 'symbol': 'CASH', 'quantity': cash, 'average_cost': 1.0
+    }).execute()
+    for symbol, quantity in (holdings or {}).items():
+        client.table('holdings').insert({
+            'user_id': user_id, 'symbol': symbol, 'quantity': quantity, 'average_cost': 100.0
+        }).execute()
+
+
+def _run_concurrently(func, args_list):
+    with ThreadPoolExecutor(max_workers=len(args_list)) as pool:
+        return [f.result() for f in [pool.submit(func, *args) for args in args_list]]
+
+
+class TestUserLock:
+
+    def test_lock_is_reentrant_and_released(self):
+        with user_lock('user-a'):
+            with user_lock('user-a'):
+                assert active_user_lock_count() == 1
+        assert active_user_lock_count() == 0
+
+    def test_same_user_is_serialized(self):
+        inside = []
+        overlaps = []
+
+        def critical(_):
+            with user_lock('user-a'):
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(1)
+                time.sleep(0.01)
+                inside.pop()
+
+        _run_concurrently(critical, [(i,) for i in range(8)])
+        assert overlaps == []
+
+    def test_different_users_do_not_block_each_other(self):
+        started = threading.Barrier(2, timeout=2)
+
+        def critical(user_id):
+            with user_lock(user_id):
+                # Both threads must be inside their locks at the same time to pass the barrier
+                started.wait()
+
+        _run_concurrently(critical, [('user-a',), ('user-b',)])
+
+
+class TestConcurrentTransactions:
+
+    def test_concurrent_deposits_same_user_lose_no_updates(self, fake_supabase):
+        fake_supabase.latency = 0.002
+        _seed_user(fake_supabase, 'user-a', cash=0.0)
+
+        _run_concurrently(
+            process_transaction,
+            [('user-a', {'transaction_type': 'DEPOSIT', 'amount': 10}) for _ in range(20)]
+        )
+
+        assert get_user_cash_balance('user-a') == pytest.approx(200.0)
+        assert len(fake_supabase.rows('transactions')) == 20
+
+    def test_concurrent_buys_and_sells_same_user(self, fake_supabase):
+        fake_supabase.latency = 0.002
+        fake_supabase.table('assets').insert({'symbol': 'AAPL', 'name': 'Apple Inc.', 'asset_type': 'STOCK'}).execute()
+        _seed_user(fake_supabase, 'user-a', cash=10000.0, holdings={'AAPL': 50})
+
+        trades = [('user-a', {'transaction_type': 'BUY', 'symbol': 'AAPL', 'quantity': 1, 'price': 100})] * 10 \
+            + [('user-a', {'transaction_type': 'SELL', 'symbol': 'AAPL', 'quantity': 1, 'price': 110})] * 10
+        _run_concurrently(process_transaction, trades)
+
+        aapl = next(r for r in fake_supabase.rows('holdings') if r['symbol'] == 'AAPL')
+        assert aapl['quantity'] == pytest.approx(50)
+        # 10 buys at 100 and 10 sells at 110
+        assert get_user_cash_balance('user-a') == pytest.approx(10000.0 - 1000.0 + 1100.0)
+
+    def test_insufficient_cash_checked_under_lock(self, fake_supabase):
+        fake_supabase.latency = 0.002
+        fake_supabase.table('assets').insert({'symbol': 'AAPL', 'name': 'Apple Inc.', 'asset_type': 'STOCK'}).execute()
+        _seed_user(fake_supabase, 'user-a', cash=500.0)
+
+        def buy():
+            try:
+                process_transaction('user-a', {'transaction_type': 'BUY', 'symbol': 'AAPL', 'quantity': 1, 'price': 100})
+                return True
+            except ValueError:
+                return False
+
+        results = _run_concurrently(buy, [() for _ in range(10)])
+
+        assert sum(results) == 5
+        assert get_user_cash_balance('user-a') == pytest.approx(0.0)
+
+    def test_different_users_run_in_parallel(self, fake_supabase):
+        fake_supabase.latency = 0.02
+        users = [f'user-{i}' for i in range(8)]
+        for user_id in users:
+            _seed_user(fake_supabase, user_id, cash=0.0)
+
+        start = time.perf_counter()
+        _run_concurrently(process_cash_deposit, [(user_id, Decimal('25')) for user_id in users])
+        elapsed = time.perf_counter() - start
+
+        # Each deposit costs three round trips; run serially this would take 8 * 3 * 0.02s
+        assert elapsed < 0.5 * len(users) * 3 * fake_supabase.latency
+        for user_id in users:
+            assert get_user_cash_balance(user_id) == pytest.approx(25.0)
+        assert active_user_lock_count() == 0
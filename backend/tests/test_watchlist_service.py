@@ -0,0 +1,296 @@
+"""
+Unit tests for watchlist_service.py
+"""
+import threading
+import time
+import pytest
+from datetime import datetime, timezone, timedelta
+from unittest.mock import patch, MagicMock
+
+from services import watchlist_service, market_service
+from utils import versions
+from services.watchlist_service import (
+    get_watchlist, get_symbol_detail, parse_fields, QUOTE_FIELDS, add_many_to_watchlist, remove_many_from_watchlist
+)
+
+
+SYMBOLS = ['AAPL', 'MSFT', 'NVDA', 'AMZN', 'GOOG']
+
+
+def _quote(symbol, price, age_seconds=0):
+    updated = datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+    return {'symbol': symbol, 'current_price': price, 'previous_close': price - 1,
+            'day_change': 1.0, 'day_change_percent': 1.0, 'last_updated': updated.isoformat()}
+
+
+def _profile(symbol):
+    return {'name': f'{symbol} Inc.', 'marketCap': 1000, 'fiftyTwoWeekHigh': 200.0, 'fiftyTwoWeekLow': 100.0,
+            'open': 150.0, 'high': 155.0, 'low': 149.0, 'recommendations': []}
+
+
+@pytest.fixture
+def watchlist_db(fake_supabase):
+    fake_supabase.tables['watchlist'] = [{'user_id': 'user-1', 'symbol': s} for s in SYMBOLS]
+    fake_supabase.tables['assets'] = [{'symbol': s, 'name': f'{s} Inc.'} for s in SYMBOLS]
+    watchlist_service._profile_cache.clear()
+    watchlist_service._detail_cache.clear()
+    yield fake_supabase
+    watchlist_service._profile_cache.clear()
+    watchlist_service._detail_cache.clear()
+
+
+def _slow(result_fn, delay):
+    def fetch(symbol):
+        time.sleep(delay)
+        return result_fn(symbol)
+    return MagicMock(side_effect=fetch)
+
+
+class TestGetWatchlist:
+
+    def test_fresh_cache_makes_no_provider_calls(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote(s, 150.0) for s in SYMBOLS]
+        for s in SYMBOLS:
+            watchlist_service._profile_cache.set(s, _profile(s))
+
+        with patch.object(market_service, 'fetch_current_price') as fetch_price, \
+                patch.object(watchlist_service, 'fetch_symbol_profile') as fetch_profile:
+            watchlist = get_watchlist('user-1', 'current_price,stale,marketCap')
+
+        fetch_price.assert_not_called()
+        fetch_profile.assert_not_called()
+        assert [row['symbol'] for row in watchlist] == SYMBOLS
+        assert watchlist[0]['current_price'] == 150.0
+        assert watchlist[0]['marketCap'] == 1000
+        assert watchlist[0]['stale'] is False
+
+    def test_stale_quotes_and_profiles_fetch_concurrently(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote(s, 100.0, age_seconds=3600) for s in SYMBOLS]
+        fetch_price = _slow(lambda s: {**_quote(s, 120.0), 'name': s}, 0.2)
+        fetch_profile = _slow(_profile, 0.2)
+
+        start = time.perf_counter()
+        with patch.object(market_service, 'fetch_current_price', fetch_price), \
+                patch.object(watchlist_service, 'fetch_symbol_profile', fetch_profile):
+            watchlist = get_watchlist('user-1', 'current_price,stale,marketCap')
+        elapsed = time.perf_counter() - start
+
+        # Ten 0.2s calls serially would take 2s
+        assert elapsed < 1.0
+        assert all(row['current_price'] == 120.0 and row['stale'] is False for row in watchlist)
+        assert {row['current_price'] for row in watchlist_db.rows('market_prices')} == {120.0}
+
+    def test_unchanged_quotes_keep_price_epoch(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote(s, 100.0, age_seconds=3600) for s in SYMBOLS]
+        fetch_price = MagicMock(side_effect=lambda s: {**_quote(s, 100.0), 'name': s})
+        epoch = versions.get_price_epoch()
+
+        with patch.object(market_service, 'fetch_current_price', fetch_price):
+            watchlist = get_watchlist('user-1', 'current_price,stale')
+
+        assert fetch_price.call_count == len(SYMBOLS)
+        assert all(row['stale'] is False for row in watchlist)
+        assert versions.get_price_epoch() == epoch
+
+    def test_changed_quotes_bump_price_epoch_once(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote(s, 100.0, age_seconds=3600) for s in SYMBOLS]
+        fetch_price = MagicMock(side_effect=lambda s: {**_quote(s, 120.0), 'name': s})
+        epoch = versions.get_price_epoch()
+
+        with patch.object(market_service, 'fetch_current_price', fetch_price):
+            get_watchlist('user-1', 'current_price')
+
+        assert versions.get_price_epoch() == epoch + 1
+
+    def test_deadline_serves_cached_quote(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote(s, 100.0, age_seconds=3600) for s in SYMBOLS]
+        fetch_price = _slow(lambda s: {**_quote(s, 120.0), 'name': s}, 0.3)
+        fetch_profile = _slow(_profile, 0.3)
+
+        start = time.perf_counter()
+        with patch.object(watchlist_service, 'WATCHLIST_FETCH_TIMEOUT', 0.1), \
+                patch.object(market_service, 'fetch_current_price', fetch_price), \
+                patch.object(watchlist_service, 'fetch_symbol_profile', fetch_profile):
+            watchlist = get_watchlist('user-1')
+            elapsed = time.perf_counter() - start
+            time.sleep(0.8)  # let the background fetches (two waves on the pool) finish inside the patches
+
+        assert elapsed < 0.25
+        assert all(row['current_price'] == 100.0 and row['stale'] is True for row in watchlist)
+        assert watchlist[0]['name'] == 'AAPL Inc.'
+
+    def test_profiles_are_cached_between_loads(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote(s, 150.0) for s in SYMBOLS]
+        fetch_profile = MagicMock(side_effect=_profile)
+
+        with patch.object(watchlist_service, 'fetch_symbol_profile', fetch_profile):
+            get_watchlist('user-1', ['marketCap'])
+            get_watchlist('user-1', ['marketCap'])
+
+        assert fetch_profile.call_count == len(SYMBOLS)
+
+    def test_unknown_symbol_gets_placeholder(self, watchlist_db):
+        with patch.object(market_service, 'fetch_current_price', return_value=None), \
+                patch.object(watchlist_service, 'fetch_symbol_profile', side_effect=RuntimeError('down')):
+            watchlist = get_watchlist('user-1', 'name,marketCap')
+            lean = get_watchlist('user-1', 'current_price')
+
+        assert watchlist[0] == {'symbol': 'AAPL', 'name': 'Data not available', 'marketCap': None}
+        assert lean[0] == {'symbol': 'AAPL', 'current_price': None}
+
+    def test_default_rows_are_lean_quotes(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote(s, 150.0) for s in SYMBOLS]
+
+        with patch.object(watchlist_service, 'fetch_symbol_profile') as fetch_profile, \
+                patch.object(watchlist_service, 'fetch_symbol_detail') as fetch_detail:
+            watchlist = get_watchlist('user-1')
+
+        fetch_profile.assert_not_called()
+        fetch_detail.assert_not_called()
+        assert tuple(watchlist[0]) == QUOTE_FIELDS
+        assert watchlist[0]['name'] == 'AAPL Inc.'
+
+    def test_fields_projection(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote(s, 150.0, age_seconds=3600) for s in SYMBOLS]
+
+        with patch.object(market_service, 'fetch_current_price') as fetch_price:
+            watchlist = get_watchlist('user-1', 'name')
+
+        # Only the name was asked for, so stale prices are not refreshed
+        fetch_price.assert_not_called()
+        assert watchlist[1] == {'symbol': 'MSFT', 'name': 'MSFT Inc.'}
+
+    def test_parse_fields_rejects_unknown(self):
+        assert parse_fields(' current_price , symbol') == ('symbol', 'current_price')
+        with pytest.raises(ValueError, match='Unknown field'):
+            parse_fields('current_price,bogus')
+
+
+class TestSymbolDetail:
+
+    def test_detail_is_fetched_once_and_cached(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote('AAPL', 150.0)]
+
+        def fetch(symbol):
+            watchlist_service._profile_cache.set(symbol, _profile(symbol))
+            return {'recommendations': [{'period': '0m', 'buy': 20}], 'trailingPE': 30.1}
+        fetch_detail = MagicMock(side_effect=fetch)
+
+        with patch.object(watchlist_service, 'fetch_symbol_detail', fetch_detail), \
+                patch.object(watchlist_service, 'fetch_symbol_profile') as fetch_profile:
+            detail = get_symbol_detail('aapl')
+            again = get_symbol_detail('AAPL', 'recommendations')
+
+        fetch_detail.assert_called_once_with('AAPL')
+        fetch_profile.assert_not_called()
+        assert detail['current_price'] == 150.0
+        assert detail['marketCap'] == 1000
+        assert detail['trailingPE'] == 30.1
+        assert again == {'symbol': 'AAPL', 'recommendations': [{'period': '0m', 'buy': 20}]}
+
+    def test_cold_detail_makes_one_info_call(self, watchlist_db):
+        watchlist_db.tables['market_prices'] = [_quote('AAPL', 150.0)]
+        ticker = MagicMock(info={'longName': 'Apple Inc.', 'marketCap': 3000, 'sector': 'Technology'},
+                           recommendations=None)
+
+        with patch.object(watchlist_service.yf, 'Ticker', return_value=ticker) as make_ticker:
+            detail = get_symbol_detail('AAPL')
+
+        make_ticker.assert_called_once_with('AAPL')
+        assert detail['name'] == 'Apple Inc.'
+        assert detail['marketCap'] == 3000
+        assert detail['sector'] == 'Technology'
+
+    def test_detail_endpoint_validates_fields(self, client):
+        response = client.get('/api/market/details/AAPL?fields=bogus')
+
+        assert response.status_code == 400
+
+
+class TestBulkWatchlist:
+
+    @pytest.fixture
+    def db(self, fake_supabase):
+        fake_supabase.tables['assets'] = [{'symbol': 'AAPL', 'name': 'Apple Inc.'}, {'symbol': 'MSFT', 'name': 'Microsoft'}]
+        fake_supabase.tables['watchlist'] = [{'user_id': 'user-1', 'symbol': 'MSFT'}]
+        return fake_supabase
+
+    @staticmethod
+    def _fetch_asset(symbol):
+        time.sleep(0.2)
+        if symbol == 'NOPE':
+            raise ValueError(f"Invalid symbol: {symbol}")
+        return {'symbol': symbol, 'name': f'{symbol} Corp', 'asset_type': 'STOCK'}
+
+    def test_bulk_add_batches_and_reports_failures(self, db):
+        tables = []
+        original_table = db.table
+        db.table = lambda name: tables.append(name) or original_table(name)
+
+        start = time.perf_counter()
+        with patch.object(watchlist_service, 'fetch_asset_row', side_effect=self._fetch_asset):
+            result = add_many_to_watchlist('user-1', ['aapl', 'MSFT', 'NVDA', 'AMD', 'NOPE', 'bad symbol!', 'AAPL'])
+        elapsed = time.perf_counter() - start
+
+        assert result['added'] == ['AAPL', 'NVDA', 'AMD']
+        assert result['already_present'] == ['MSFT']
+        assert {f['symbol'] for f in result['failed']} == {'NOPE', 'bad symbol!'}
+        # Three unknown symbols validated side by side, not one after another
+        assert elapsed < 0.5
+        # One lookup each for watchlist and assets, then one batched write each
+        assert tables == ['watchlist', 'assets', 'assets', 'watchlist']
+        assert {r['symbol'] for r in db.rows('assets')} == {'AAPL', 'MSFT', 'NVDA', 'AMD'}
+        assert sorted(r['symbol'] for r in db.rows('watchlist')) == ['AAPL', 'AMD', 'MSFT', 'NVDA']
+
+    def test_bulk_validation_stays_off_the_quote_pool(self, db):
+        threads = []
+
+        def fetch_asset(symbol):
+            threads.append(threading.current_thread().name)
+            time.sleep(0.1)
+            return {'symbol': symbol, 'name': symbol, 'asset_type': 'STOCK'}
+
+        symbols = [f'T{i}' for i in range(12)]
+        with patch.object(watchlist_service, 'fetch_asset_row', side_effect=fetch_asset):
+            result = add_many_to_watchlist('user-1', symbols, timeout=0.15)
+
+        # Validations still queued at the deadline are cancelled rather than left running
+        time.sleep(0.3)
+        assert threads and all(name.startswith('bulk-validate') for name in threads)
+        assert len(threads) < len(symbols)
+        assert len(result['added']) + len(result['failed']) == len(symbols)
+
+    def test_bulk_remove_in_one_delete(self, db):
+        db.tables['watchlist'].append({'user_id': 'user-1', 'symbol': 'AAPL'})
+        db.tables['watchlist'].append({'user_id': 'user-2', 'symbol': 'AAPL'})
+
+        result = remove_many_from_watchlist('user-1', ['AAPL', 'msft', 'TSLA'])
+
+        assert result['removed'] == ['AAPL', 'MSFT']
+        assert result['not_found'] == ['TSLA']
+        assert db.rows('watchlist') == [{'user_id': 'user-2', 'symbol': 'AAPL'}]
+
+    def test_watchlist_edits_keep_portfolio_caches(self, db):
+        user_version = versions.get_user_version('user-1')
+        watchlist_version = versions.get_watchlist_version('user-1')
+
+        remove_many_from_watchlist('user-1', ['MSFT'])
+
+        assert versions.get_user_version('user-1') == user_version
+        assert versions.get_watchlist_version('user-1') == watchlist_version + 1
+
+    def test_bulk_limits(self):
+        with pytest.raises(ValueError, match='non-empty'):
+            add_many_to_watchlist('user-1', [])
+        with pytest.raises(ValueError, match='At most'):
+            remove_many_from_watchlist('user-1', ['A'] * (watchlist_service.MAX_BULK_SYMBOLS + 1))
+
+    def test_bulk_endpoints(self, client, db):
+        with patch.object(watchlist_service, 'fetch_asset_row', side_effect=self._fetch_asset):
+            added = client.post('/api/watchlist/user-1/bulk', json={'symbols': ['AAPL']})
+        removed = client.delete('/api/watchlist/user-1/bulk', json={'symbols': ['AAPL']})
+        missing = client.post('/api/watchlist/user-1/bulk', json={})
+
+        assert added.status_code == 201
+        assert removed.get_json()['removed'] == ['AAPL']
+        assert missing.status_code == 400
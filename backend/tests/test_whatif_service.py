@@ -0,0 +1,130 @@
+"""
+Unit tests for whatif_service.py
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+
+from services import whatif_service
+from services.whatif_service import simulate_trades, parse_actions, concentration_metrics
+
+
+def _holding(symbol, quantity, price, average_cost=None, sector=None):
+    average_cost = price if average_cost is None else average_cost
+    return {'symbol': symbol, 'quantity': quantity, 'current_price': price, 'average_cost': average_cost,
+            'market_value': quantity * price, 'total_cost': quantity * average_cost, 'sector': sector}
+
+
+HOLDINGS = [
+    _holding('CASH', 1000.0, 1.0),
+    _holding('AAPL', 30.0, 100.0, 80.0, 'Technology'),
+    _holding('MSFT', 10.0, 200.0, 150.0, 'Technology'),
+]
+
+AAPL_LOTS = [
+    {'quantity': '20', 'price': '70', 'transaction_date': '2024-01-02'},
+    {'quantity': '10', 'price': '100', 'transaction_date': '2024-06-03'},
+]
+
+
+def _simulate(actions, lots=None, cached_price=None):
+    load_lots = MagicMock(return_value=lots if lots is not None else AAPL_LOTS)
+    with patch.object(whatif_service, 'get_portfolio_valuation', return_value={'holdings': HOLDINGS}), \
+            patch.object(whatif_service, 'get_buy_lots', load_lots), \
+            patch.object(whatif_service, 'get_cached_price', return_value=cached_price):
+        return simulate_trades('user-1', actions), load_lots
+
+
+class TestWhatIf:
+
+    def test_sell_uses_fifo_and_frees_cash(self):
+        result, _ = _simulate([{'action': 'SELL', 'symbol': 'AAPL', 'quantity': 25, 'price': 110}])
+
+        # 20 @ 70 and 5 @ 100 sold at 110
+        assert result['realized_gain_loss'] == pytest.approx(20 * 40 + 5 * 10)
+        assert result['after']['cash_balance'] == pytest.approx(1000 + 25 * 110)
+        assert result['change']['positions_count'] == 0
+
+    def test_successive_sells_consume_lots(self):
+        result, load_lots = _simulate([
+            {'action': 'SELL', 'symbol': 'AAPL', 'quantity': 20, 'price': 100},
+            {'action': 'SELL', 'symbol': 'AAPL', 'quantity': 10, 'price': 100},
+        ])
+
+        assert [t['realized_gain_loss'] for t in result['trades']] == [600.0, 0.0]
+        assert result['after']['positions_count'] == 1
+        load_lots.assert_called_once_with('user-1', 'AAPL')
+
+    def test_sell_after_simulated_buy_includes_its_lot(self):
+        result, load_lots = _simulate([
+            {'action': 'BUY', 'symbol': 'AAPL', 'quantity': 5, 'price': 90},
+            {'action': 'SELL', 'symbol': 'AAPL', 'quantity': 35, 'price': 110},
+        ])
+
+        # 20 @ 70, 10 @ 100, then the simulated 5 @ 90, all sold at 110
+        assert result['trades'][1]['realized_gain_loss'] == pytest.approx(20 * 40 + 10 * 10 + 5 * 20)
+        load_lots.assert_called_once_with('user-1', 'AAPL')
+
+    def test_buy_new_symbol_at_cached_price(self):
+        result, _ = _simulate([{'action': 'BUY', 'symbol': 'vti', 'quantity': 4}], cached_price={'current_price': 250.0})
+
+        assert result['trades'][0]['price'] == 250.0
+        assert result['after']['cash_balance'] == 0.0
+        assert result['after']['total_value'] == result['before']['total_value']
+        assert result['after']['positions_count'] == 3
+        assert 'VTI' in [p['name'] for p in result['allocation']['by_symbol']]
+
+    def test_buy_averages_cost(self):
+        result, _ = _simulate([{'action': 'BUY', 'symbol': 'MSFT', 'quantity': 5, 'price': 180}])
+
+        # (10 * 150 + 5 * 180) / 15 = 160, marked at the current 200
+        assert result['after']['unrealized_gain_loss'] == pytest.approx(30 * 20 + 15 * 40)
+
+    def test_insufficient_cash_names_the_action(self):
+        with pytest.raises(ValueError, match=r'Action 2: Insufficient cash'):
+            _simulate([
+                {'action': 'BUY', 'symbol': 'MSFT', 'quantity': 1},
+                {'action': 'BUY', 'symbol': 'MSFT', 'quantity': 5},
+            ])
+
+    def test_sell_more_than_held_rejected(self):
+        with pytest.raises(ValueError, match='Insufficient shares'):
+            _simulate([{'action': 'SELL', 'symbol': 'MSFT', 'quantity': 11}])
+
+    def test_input_holdings_are_not_modified(self):
+        _simulate([{'action': 'SELL', 'symbol': 'AAPL', 'quantity': 30}])
+
+        assert HOLDINGS[1]['quantity'] == 30.0
+        assert HOLDINGS[0]['quantity'] == 1000.0
+
+    def test_parse_actions_validation(self):
+        with pytest.raises(ValueError, match='non-empty'):
+            parse_actions([])
+        with pytest.raises(ValueError, match='Action 1: action must be'):
+            parse_actions([{'action': 'DEPOSIT', 'symbol': 'AAPL', 'quantity': 1}])
+        with pytest.raises(ValueError, match='Action 1: Quantity must be positive'):
+            parse_actions([{'action': 'BUY', 'symbol': 'AAPL', 'quantity': 0}])
+
+    def test_concentration_metrics(self):
+        metrics = concentration_metrics(HOLDINGS)
+
+        # 3000 and 2000 invested out of 6000 total
+        assert metrics['largest_position_percent'] == pytest.approx(50.0)
+        assert metrics['hhi'] == pytest.approx(0.6 ** 2 + 0.4 ** 2)
+        assert metrics['effective_positions'] == pytest.approx(1 / 0.52, abs=0.01)
+
+
+class TestWhatIfEndpoint:
+
+    def test_returns_400_for_invalid_trade(self, client):
+        with patch('app.simulate_trades', side_effect=ValueError('Action 1: Insufficient cash')):
+            response = client.post('/api/portfolio/what-if/user-1', json={'actions': [{}]})
+
+        assert response.status_code == 400
+
+    def test_returns_simulation(self, client):
+        with patch('app.simulate_trades', return_value={'trades': []}) as simulate:
+            response = client.post('/api/portfolio/what-if/user-1', json={'actions': [{'action': 'BUY'}]})
+
+        assert response.status_code == 200
+        assert response.get_json() == {'what_if': {'trades': []}}
+        simulate.assert_called_once_with('user-1', [{'action': 'BUY'}], None)
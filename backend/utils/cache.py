@@ -0,0 +1,82 @@
+"""
+In-process cache helpers
+Thread-safe LRU cache with optional time-to-live, shared by the analytics services
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded LRU cache; entries older than `ttl` seconds are treated as missing"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or self._expired(entry):
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[1]
+
+    def invalidate(self, predicate) -> int:
+        """Drop every entry whose key satisfies predicate(key); returns the number removed"""
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+            return len(stale)
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Drop entries keyed by tuples that start with user_id"""
+        return self.invalidate(lambda key: isinstance(key, tuple) and key and key[0] == user_id)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def age(self, key):
+        """Seconds since key was stored, or None when absent"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return None if entry is _MISSING else time.monotonic() - entry[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+    def _expired(self, entry) -> bool:
+        return self.ttl is not None and time.monotonic() - entry[0] > self.ttl
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -29,4 +29,18 @@ def get_supabase_client():
     global supabase
     if supabase is None:
         supabase = init_database()
-    return supabase 
\ No newline at end of file
+    return supabase
+
+def fetch_all_rows(build_query, page_size: int = 1000):
+    """Read every row of a query in pages (PostgREST caps a single response)
+
+    build_query must return a fresh, ordered query builder on each call.
+    """
+    rows = []
+    start = 0
+    while True:
+        page = build_query().range(start, start + page_size - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
@@ -0,0 +1,42 @@
+"""
+Time-series downsampling helpers for chart payloads
+"""
+
+import numpy as np
+
+def lttb_indices(x, y, max_points: int) -> np.ndarray:
+    """Indices kept by Largest-Triangle-Three-Buckets downsampling
+
+    Always keeps the first and last point; every bucket in between contributes the point
+    that forms the largest triangle with the previously kept point and the average of
+    the next bucket, which preserves peaks and troughs that a plain stride would drop.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if max_points is None or max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (max_points - 2)
+    # Bucket i covers [edges[i], edges[i + 1]); the final edge is the last point itself
+    edges = np.floor(np.arange(max_points - 1) * every).astype(int) + 1
+    edges[-1] = n - 1
+
+    selected = np.empty(max_points, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    anchor = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        # Twice the triangle area for every candidate in the bucket at once
+        areas = np.abs(
+            (x[anchor] - avg_x) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (avg_y - y[anchor])
+        )
+        anchor = start + int(np.argmax(areas))
+        selected[i + 1] = anchor
+    return selected
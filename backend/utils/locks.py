@@ -0,0 +1,45 @@
+"""
+Per-user locking helpers
+Serializes read-modify-write sequences for one user without blocking other users
+"""
+
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+# user_id -> [RLock, number of threads holding or waiting on it]
+_user_locks = {}
+_registry_lock = threading.Lock()
+
+@contextmanager
+def user_lock(user_id: str):
+    """Hold the write lock for a single user (re-entrant, released when the block exits)"""
+    with _registry_lock:
+        entry = _user_locks.get(user_id)
+        if entry is None:
+            entry = [threading.RLock(), 0]
+            _user_locks[user_id] = entry
+        entry[1] += 1
+
+    try:
+        with entry[0]:
+            yield
+    finally:
+        # Drop the lock once nobody holds or waits on it so the registry stays small
+        with _registry_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _user_locks[user_id]
+
+def serialized_per_user(func):
+    """Decorator: run func under the lock of its first argument (user_id)"""
+    @wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        with user_lock(user_id):
+            return func(user_id, *args, **kwargs)
+    return wrapper
+
+def active_user_lock_count() -> int:
+    """Number of users that currently have a lock allocated (for monitoring/tests)"""
+    with _registry_lock:
+        return len(_user_locks)
@@ -0,0 +1,192 @@
+"""
+On-disk daily price history store
+One append-only binary file of fixed-size OHLCV records per symbol, read back as a NumPy memmap
+Closes are stored split-adjusted with the day's dividend and split; adjustments are applied on read
+"""
+
+import json
+import logging
+import os
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# One record per trading day; dates are strictly increasing within a file. Prices are
+# split-adjusted as of the last download; `split` is the ratio effective that day (0 if none)
+BAR_DTYPE = np.dtype([
+    ('date', '<M8[D]'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+    ('dividend', '<f8'),
+    ('split', '<f8'),
+])
+# Bumped whenever BAR_DTYPE changes; files of older layouts are ignored and refetched
+STORE_VERSION = 2
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'prices')
+
+def empty_bars() -> np.ndarray:
+    """Zero-length bar array (no stored history)"""
+    return np.empty(0, dtype=BAR_DTYPE)
+
+def has_trading_days(start, end) -> bool:
+    """Whether [start, end] contains a weekday (a day the provider could have a bar for)"""
+    return np.busday_count(start, end + np.timedelta64(1, 'D')) > 0
+
+def total_return_closes(bars: np.ndarray) -> np.ndarray:
+    """Closes adjusted for splits and dividends (what yfinance's auto_adjust returns)
+
+    Each dividend scales every earlier close by (1 - dividend / previous close).
+    """
+    closes = np.asarray(bars['close'], dtype=float)
+    factors = np.ones(len(closes))
+    paid = np.flatnonzero(bars['dividend'][1:] > 0) + 1
+    factors[paid - 1] = 1 - bars['dividend'][paid] / closes[paid - 1]
+    # Cumulative product of the factors of all later dividends
+    cumulative = np.cumprod(factors[::-1])[::-1]
+    return closes * cumulative
+
+def as_traded_closes(bars: np.ndarray) -> np.ndarray:
+    """Closes at the prices actually quoted on each day (splits undone)"""
+    ratios = np.where(bars['split'] > 0, bars['split'], 1.0)
+    # A split on day t re-prices every bar before t
+    later = np.append(np.cumprod(ratios[::-1])[::-1][1:], 1.0)
+    return np.asarray(bars['close'], dtype=float) * later
+
+class PriceStore:
+    """Per-symbol daily bars under `root`
+
+    `<SYMBOL>.v<STORE_VERSION>.bin` holds the bars, `.json` the date range already
+    covered (so weekends and holidays are not re-downloaded). Coverage only moves over
+    ranges the provider returned bars for, or that have no trading days. Reads are
+    zero-copy memmaps; new days are appended in place, and the whole file is refetched
+    when a new split arrives so older bars stay on the same split basis.
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or os.getenv('PRICE_STORE_DIR') or DEFAULT_ROOT
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+
+    def _lock(self, symbol: str):
+        with self._registry_lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _path(self, symbol: str, ext: str) -> str:
+        return os.path.join(self.root, f"{symbol}.v{STORE_VERSION}.{ext}")
+
+    def coverage(self, symbol: str):
+        """(first, last) dates already fetched for symbol as datetime64[D], or None"""
+        try:
+            with open(self._path(symbol, 'json')) as f:
+                meta = json.load(f)
+            return np.datetime64(meta['start'], 'D'), np.datetime64(meta['through'], 'D')
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_coverage(self, symbol: str, start, through):
+        tmp = self._path(symbol, 'json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'start': str(start), 'through': str(through)}, f)
+        os.replace(tmp, self._path(symbol, 'json'))
+
+    def read(self, symbol: str) -> np.ndarray:
+        """All stored bars for symbol (read-only memmap, empty array if none)"""
+        path = self._path(symbol, 'bin')
+        try:
+            if os.path.getsize(path) < BAR_DTYPE.itemsize:
+                return empty_bars()
+        except OSError:
+            return empty_bars()
+        return np.memmap(path, dtype=BAR_DTYPE, mode='r')
+
+    def read_range(self, symbol: str, start_date: str = None, end_date: str = None) -> np.ndarray:
+        """Bars with start_date <= date <= end_date, as a view into the memmap"""
+        bars = self.read(symbol)
+        lo = np.searchsorted(bars['date'], np.datetime64(start_date, 'D')) if start_date else 0
+        hi = np.searchsorted(bars['date'], np.datetime64(end_date, 'D'), side='right') if end_date else len(bars)
+        return bars[lo:hi]
+
+    def append(self, symbol: str, bars: np.ndarray) -> int:
+        """Append bars newer than the last stored day; returns how many were written"""
+        bars = np.asarray(bars, dtype=BAR_DTYPE)
+        existing = self.read(symbol)
+        if len(existing):
+            bars = bars[bars['date'] > existing['date'][-1]]
+        if not len(bars):
+            return 0
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path(symbol, 'bin'), 'ab') as f:
+            f.write(np.sort(bars, order='date').tobytes())
+        return len(bars)
+
+    def replace(self, symbol: str, bars: np.ndarray) -> int:
+        """Rewrite the symbol's file with exactly these bars"""
+        bars = np.sort(np.asarray(bars, dtype=BAR_DTYPE), order='date')
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._path(symbol, 'bin.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(bars.tobytes())
+        os.replace(tmp, self._path(symbol, 'bin'))
+        return len(bars)
+
+    def ensure(self, symbol: str, start_date: str, end_date: str, fetch) -> int:
+        """Make sure [start_date, end_date] has been fetched, downloading only the missing days
+
+        `fetch(symbol, start, end)` returns BAR_DTYPE records for start <= date <= end; an
+        empty result for a range with trading days is treated as a failed fetch. Missing
+        days after the stored range are appended; an earlier start or a new split
+        refetches the whole range. Returns the number of bars written.
+        """
+        start = np.datetime64(start_date, 'D')
+        end = np.datetime64(end_date, 'D')
+        if end < start:
+            return 0
+
+        with self._lock(symbol):
+            covered = self.coverage(symbol)
+            if covered is None:
+                return self._refetch(symbol, start, end, fetch)
+
+            first, through = covered
+            if start < first:
+                return self._refetch(symbol, start, max(end, through), fetch)
+            if end <= through:
+                return 0
+
+            bars = fetch(symbol, str(through + np.timedelta64(1, 'D')), str(end))
+            if len(bars) and (bars['split'] > 0).any():
+                logger.info(f"Price store: new split for {symbol}, refetching its history")
+                return self._refetch(symbol, first, end, fetch)
+            added = self.append(symbol, bars)
+            if len(bars) or not has_trading_days(through + np.timedelta64(1, 'D'), end):
+                self._write_coverage(symbol, first, end)
+            if added:
+                logger.info(f"Price store: added {added} bars for {symbol}")
+            return added
+
+    def _refetch(self, symbol: str, start, end, fetch) -> int:
+        """Replace the stored bars with a fresh download of [start, end] (lock held)"""
+        bars = fetch(symbol, str(start), str(end))
+        if not len(bars):
+            if not has_trading_days(start, end) and self.coverage(symbol) is None:
+                self._write_coverage(symbol, start, end)
+            return 0
+        written = self.replace(symbol, bars)
+        self._write_coverage(symbol, start, end)
+        logger.info(f"Price store: stored {written} bars for {symbol}")
+        return written
+
+# Shared store instance
+_store: PriceStore = None
+
+def get_price_store() -> PriceStore:
+    """Process-wide store rooted at PRICE_STORE_DIR (default backend/data/prices)"""
+    global _store
+    if _store is None:
+        _store = PriceStore()
+    return _store
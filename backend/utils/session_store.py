@@ -0,0 +1,180 @@
+"""
+Bounded conversation session store
+Per-key message histories with LRU, idle-timeout and total-size eviction; evicted
+sessions can optionally be spilled to disk and resumed on the next access
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Rough per-message bookkeeping cost on top of the text itself
+MESSAGE_OVERHEAD_BYTES = 200
+
+def message_size(message: dict) -> int:
+    """Approximate memory held by one {'role', 'content', ...} message (all its string fields)"""
+    text = sum(len(value.encode('utf-8')) for value in message.values() if isinstance(value, str))
+    return text + MESSAGE_OVERHEAD_BYTES
+
+class SessionStore:
+    """key -> list of messages, bounded in sessions, idle time, history length and bytes
+
+    Least recently used sessions are evicted first when max_sessions or max_bytes is
+    exceeded, and sessions idle for idle_timeout seconds are dropped on the next access.
+    With spill_dir, evicted (not cleared) sessions are written there as JSON and read
+    back when their key is used again within spill_ttl seconds.
+    """
+
+    def __init__(self, max_sessions: int = 500, idle_timeout: float = 1800, max_history: int = 20,
+                 max_bytes: int = 32 * 1024 * 1024, spill_dir: str = None, spill_ttl: float = 86400):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_history = max_history
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_ttl = spill_ttl
+        self._sessions = OrderedDict()  # key -> {'messages', 'bytes', 'last_used'}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.resumed = 0
+
+    def get(self, key) -> list:
+        """A copy of the session's messages (resumed from disk if it was spilled)"""
+        spilled = self._sweep()
+        with self._lock:
+            session = self._touch(key)
+            if session is not None:
+                messages = list(session['messages'])
+        self._spill(spilled)
+        if session is not None:
+            return messages
+
+        messages = self._resume(key)
+        if messages:
+            self.append(key, *messages)
+        return messages
+
+    def append(self, key, *messages) -> list:
+        """Add messages, keeping the newest max_history; returns the resulting history"""
+        with self._lock:
+            session = self._touch(key)
+            if session is None:
+                session = self._sessions[key] = {'messages': [], 'bytes': 0, 'last_used': time.monotonic()}
+            session['messages'].extend(messages)
+            added = sum(message_size(m) for m in messages)
+            dropped = session['messages'][:-self.max_history] if len(session['messages']) > self.max_history else []
+            if dropped:
+                del session['messages'][:len(dropped)]
+            delta = added - sum(message_size(m) for m in dropped)
+            session['bytes'] += delta
+            self._bytes += delta
+            history = list(session['messages'])
+            spilled = self._evict_over_limits(keep=key)
+        self._spill(spilled)
+        return history
+
+    def clear(self, key) -> bool:
+        """Forget a session entirely (memory and any spilled copy)"""
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            if session is not None:
+                self._bytes -= session['bytes']
+        path = self._spill_path(key)
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove spilled session: {e}")
+        return session is not None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'resumed': self.resumed
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _touch(self, key):
+        """The live session for key marked as most recently used, or None (lock held)"""
+        session = self._sessions.get(key)
+        if session is not None:
+            session['last_used'] = time.monotonic()
+            self._sessions.move_to_end(key)
+        return session
+
+    def _pop_oldest(self):
+        key, session = self._sessions.popitem(last=False)
+        self._bytes -= session['bytes']
+        self.evictions += 1
+        return key, session['messages']
+
+    def _evict_over_limits(self, keep=None) -> list:
+        """Evict LRU sessions beyond max_sessions/max_bytes, never `keep` (lock held)"""
+        evicted = []
+        while len(self._sessions) > self.max_sessions or (self._bytes > self.max_bytes and len(self._sessions) > 1):
+            if next(iter(self._sessions)) == keep:
+                self._sessions.move_to_end(keep)
+            evicted.append(self._pop_oldest())
+        return evicted
+
+    def _sweep(self) -> list:
+        """Evict sessions idle longer than idle_timeout; they sit at the LRU end"""
+        evicted = []
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            while self._sessions and next(iter(self._sessions.values()))['last_used'] < cutoff:
+                evicted.append(self._pop_oldest())
+        return evicted
+
+    def _spill_path(self, key):
+        if not self.spill_dir:
+            return None
+        digest = hashlib.sha256(str(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.json")
+
+    def _spill(self, evicted: list):
+        """Write evicted sessions to disk (outside the lock)"""
+        if not self.spill_dir:
+            return
+        for key, messages in evicted:
+            if not messages:
+                continue
+            path = self._spill_path(key)
+            try:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                with open(path + '.tmp', 'w') as f:
+                    json.dump(messages, f)
+                os.replace(path + '.tmp', path)
+            except (OSError, TypeError) as e:
+                logger.warning(f"Could not spill session to {path}: {e}")
+
+    def _resume(self, key) -> list:
+        path = self._spill_path(key)
+        if not path or not os.path.exists(path):
+            return []
+        try:
+            fresh = time.time() - os.path.getmtime(path) <= self.spill_ttl
+            with open(path) as f:
+                messages = json.load(f) if fresh else []
+            os.remove(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not resume spilled session from {path}: {e}")
+            return []
+        if messages:
+            self.resumed += 1
+        return messages[-self.max_history:]
@@ -0,0 +1,142 @@
+"""
+In-memory inverted index for short documents
+Incremental adds, tag filtering, BM25 ranking and age-bounded eviction
+"""
+
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have in into is it its of on or that the their '
+    'this to was were will with'.split()
+)
+
+def tokenize(text: str) -> list:
+    """Lower-cased word tokens without stopwords or possessive suffixes"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or '').lower()):
+        token = token.split("'", 1)[0]
+        if len(token) > 1 and token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+class InvertedIndex:
+    """Term -> {doc_id: weighted term frequency} postings over documents with tags
+
+    Each document has weighted text fields, a set of tags (e.g. symbols) used to filter
+    searches, a timestamp for age eviction and an opaque payload returned by search.
+    Re-adding a known document only merges its tags.
+    """
+
+    # BM25 parameters
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, max_age_seconds: float = None, max_docs: int = None):
+        self.max_age_seconds = max_age_seconds
+        self.max_docs = max_docs
+        self._postings = {}
+        self._docs = {}
+        self._by_time = []  # (timestamp, doc_id) min-heap for eviction
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def add(self, doc_id, fields: list, tags=(), timestamp: float = None, payload=None) -> bool:
+        """Index a document; fields are (text, weight) pairs. Returns True if it was new"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            if doc is not None:
+                doc['tags'].update(tags)
+                return False
+
+            frequencies = Counter()
+            for text, weight in fields:
+                for token in tokenize(text):
+                    frequencies[token] += weight
+            length = sum(frequencies.values())
+            self._docs[doc_id] = {'tags': set(tags), 'timestamp': timestamp, 'length': length,
+                                  'terms': list(frequencies), 'payload': payload}
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[doc_id] = frequency
+            self._total_length += length
+            heapq.heappush(self._by_time, (timestamp, doc_id))
+            self._evict()
+            return True
+
+    def _evict(self):
+        """Drop the oldest documents past max_age_seconds or beyond max_docs (lock held)"""
+        cutoff = time.time() - self.max_age_seconds if self.max_age_seconds else None
+        while self._by_time:
+            timestamp, doc_id = self._by_time[0]
+            too_old = cutoff is not None and timestamp < cutoff
+            too_many = self.max_docs is not None and len(self._docs) > self.max_docs
+            if not (too_old or too_many):
+                break
+            heapq.heappop(self._by_time)
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in doc['terms']:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= doc['length']
+
+    def prune(self) -> int:
+        """Apply the age bound now; returns how many documents were dropped"""
+        with self._lock:
+            before = len(self._docs)
+            self._evict()
+            return before - len(self._docs)
+
+    def search(self, query: str, tags=None, limit: int = 20) -> list:
+        """BM25-ranked [(score, payload, tags)] for documents matching any query term
+
+        With `tags`, only documents sharing at least one tag are considered. Ties go to
+        the newer document.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        tags = set(tags) if tags is not None else None
+
+        with self._lock:
+            self._evict()
+            doc_count = len(self._docs)
+            if not doc_count:
+                return []
+            average_length = self._total_length / doc_count or 1.0
+            scores = Counter()
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    doc = self._docs[doc_id]
+                    if tags is not None and not (doc['tags'] & tags):
+                        continue
+                    norm = self.K1 * (1 - self.B + self.B * doc['length'] / average_length)
+                    scores[doc_id] += idf * frequency * (self.K1 + 1) / (frequency + norm)
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], self._docs[item[0]]['timestamp']))
+            return [(score, self._docs[doc_id]['payload'], sorted(self._docs[doc_id]['tags'])) for doc_id, score in best]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._docs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'documents': len(self._docs), 'terms': len(self._postings)}
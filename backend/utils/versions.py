@@ -0,0 +1,68 @@
+"""
+Data version counters for cache keys
+A per-user data version bumped on every transaction write, and a global price epoch bumped
+whenever cached prices or asset data change. Results keyed on both never go stale. Watchlist
+edits have their own per-user counter so they don't invalidate portfolio results.
+"""
+
+import functools
+import threading
+
+_lock = threading.Lock()
+_user_versions = {}
+_watchlist_versions = {}
+_price_epoch = 0
+
+def get_user_version(user_id: str) -> int:
+    """Current ledger version for a user (0 until their first write in this process)"""
+    return _user_versions.get(user_id, 0)
+
+def bump_user_version(user_id: str) -> int:
+    """Mark a user's holdings/transactions as changed"""
+    with _lock:
+        _user_versions[user_id] = _user_versions.get(user_id, 0) + 1
+        return _user_versions[user_id]
+
+def get_watchlist_version(user_id: str) -> int:
+    """Current watchlist version for a user (0 until their first edit in this process)"""
+    return _watchlist_versions.get(user_id, 0)
+
+def bump_watchlist_version(user_id: str) -> int:
+    """Mark a user's watchlist as changed"""
+    with _lock:
+        _watchlist_versions[user_id] = _watchlist_versions.get(user_id, 0) + 1
+        return _watchlist_versions[user_id]
+
+def get_price_epoch() -> int:
+    """Current global price epoch"""
+    return _price_epoch
+
+def bump_price_epoch() -> int:
+    """Mark cached market prices (or asset metadata) as changed for everyone"""
+    global _price_epoch
+    with _lock:
+        _price_epoch += 1
+        return _price_epoch
+
+def data_version(user_id: str):
+    """(user version, price epoch) pair to fold into a cache key"""
+    return get_user_version(user_id), _price_epoch
+
+def cached_by_version(cache):
+    """Memoize f(user_id, ...) in `cache` under (user_id, user version, price epoch, name, args)
+
+    Old versions are never read again and age out of the bounded cache. Falsy results
+    (the services' error fallbacks) are not cached.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(user_id, *args, **kwargs):
+            # Read the version before computing so a concurrent write can't be cached as current
+            key = (user_id, *data_version(user_id), func.__name__, args, tuple(sorted(kwargs.items())))
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+            result = func(user_id, *args, **kwargs)
+            return cache.set(key, result) if result else result
+        return wrapper
+    return decorator
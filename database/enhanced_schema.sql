@@ -52,6 +52,8 @@ CREATE TABLE portfolio_snapshots (
     user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,
     date DATE NOT NULL,
     total_value DECIMAL(15,4) NOT NULL,
+    -- 'batch' for rows written by run_snapshots.py, 'api' otherwise
+    source TEXT NOT NULL DEFAULT 'api',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     UNIQUE(user_id, date)
 );
@@ -97,4 +99,43 @@ CREATE TRIGGER update_user_profiles_updated_at
 
 CREATE TRIGGER update_holdings_updated_at
     BEFORE UPDATE ON holdings
-    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column(); 
\ No newline at end of file
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column(); 
+-- Weekly and monthly OHLC rollups of portfolio_snapshots.
+-- Maintained incrementally by store_portfolio_snapshot; long chart/analytics windows read these instead of daily rows.
+CREATE TABLE portfolio_snapshot_rollups (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,
+    resolution VARCHAR(10) CHECK (resolution IN ('WEEK', 'MONTH')) NOT NULL,
+    period_start DATE NOT NULL,
+    open_date DATE NOT NULL,
+    close_date DATE NOT NULL,
+    open_value DECIMAL(15,4) NOT NULL,
+    high_value DECIMAL(15,4) NOT NULL,
+    low_value DECIMAL(15,4) NOT NULL,
+    close_value DECIMAL(15,4) NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE(user_id, resolution, period_start)
+);
+
+CREATE INDEX idx_snapshot_rollups_user_res_close ON portfolio_snapshot_rollups(user_id, resolution, close_date);
+
+-- One-off backfill of rollups from existing daily snapshots
+INSERT INTO portfolio_snapshot_rollups
+    (user_id, resolution, period_start, open_date, close_date, open_value, high_value, low_value, close_value)
+SELECT user_id, resolution, period_start,
+       MIN(date), MAX(date),
+       (ARRAY_AGG(total_value ORDER BY date ASC))[1],
+       MAX(total_value), MIN(total_value),
+       (ARRAY_AGG(total_value ORDER BY date DESC))[1]
+FROM (
+    SELECT user_id, date, total_value, 'WEEK' AS resolution, DATE_TRUNC('week', date)::DATE AS period_start
+    FROM portfolio_snapshots
+    UNION ALL
+    SELECT user_id, date, total_value, 'MONTH' AS resolution, DATE_TRUNC('month', date)::DATE AS period_start
+    FROM portfolio_snapshots
+) buckets
+GROUP BY user_id, resolution, period_start
+ON CONFLICT (user_id, resolution, period_start) DO NOTHING;
+
+-- Existing databases: mark which snapshots the nightly batch wrote (its resume only skips those)
+ALTER TABLE portfolio_snapshots ADD COLUMN IF NOT EXISTS source TEXT NOT NULL DEFAULT 'api';